@@ -1,105 +1,107 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, g, has_app_context, stream_with_context
 from flask_cors import CORS
 import os
-import json
-import random
-import sqlite3
+import functools
 import datetime
 
+from bell_schedule import load_bell_schedule, parse_bell_schedule, write_bell_schedule
+from compression import Compressor
+from db import ConnectionPool, bump_data_version, create_schema, read_data_version
+from editor import EditNotFound, TimetableEditor, cell_to_dict, parse_cell, parse_cell_edit
+from export import FORMATS as EXPORT_FORMATS, GROUPS as EXPORT_GROUPS, iter_export, week_of
+from feasibility import INFEASIBLE_ERROR, InfeasibleError, check_feasibility, require_feasible
+from importer import ImportFormatError, import_records, parse_records
+from incremental import regenerate, snapshot_rows, stored_input_key
+from jobs import CANCELLED, COMPLETED, FAILED, JobConflict, JobManager
+from metrics import RequestMetrics
+from persistence import CALENDAR_CHANGED_ERROR, build_timetable_rows, clear_timetable, replace_timetable
+from reader import (list_classes, list_subjects, list_teachers, parse_list_args, read_class_view,
+                    read_day_view, read_teacher_view, read_timetable, read_timetable_compact)
+from response_cache import ResponseCache
+from scheduler import load_problem
+from solver_cache import SolverCache, input_key
+from solvers import parse_solver_options, run_solver
+from streaming import ClassStream, format_event
+from validator import MAX_VIOLATIONS, validate_timetable
+from versions import (StaleVersionError, activate_version, clear_versions, detach_head, diff_versions,
+                      list_versions, record_version)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Background timetable generation jobs
+job_manager = JobManager(max_workers=2)
+
+# Seconds between keep-alive comments on an idle event stream
+app.config.setdefault('EVENT_KEEPALIVE_SECONDS', 15.0)
+
+# Per-route latency and SQL usage, exposed at /api/metrics
+app.config.setdefault('SLOW_SQL_MS', 100.0)
+request_metrics = RequestMetrics(slow_sql_ms=app.config['SLOW_SQL_MS'])
+request_metrics.init_app(app)
+
+# gzip / brotli response compression negotiated through Accept-Encoding
+compressor = Compressor(min_size=1024)
+compressor.init_app(app)
+
 # Database setup
 DB_PATH = 'timetable.db'
+app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', 8)))
+app.config.setdefault('DB_POOL_TIMEOUT', float(os.environ.get('DB_POOL_TIMEOUT', 30)))
+app.config.setdefault('DB_STATEMENT_CACHE_SIZE', 256)
 
-# Helper function to get database connection
+# Finished solver results keyed by a hash of their input
+app.config.setdefault('SOLVER_CACHE_DIR', os.environ.get('SOLVER_CACHE_DIR', 'solver_cache'))
+app.config.setdefault('SOLVER_CACHE_SIZE', 32)
+solver_cache = SolverCache(app.config['SOLVER_CACHE_DIR'], max_entries=app.config['SOLVER_CACHE_SIZE'])
+
+# Long-lived connections shared by all requests and background jobs
+db_pool = ConnectionPool(
+    DB_PATH,
+    size=app.config['DB_POOL_SIZE'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    cached_statements=app.config['DB_STATEMENT_CACHE_SIZE']
+)
+
+# Helper function to get database connection. conn.close() returns it to the
+# pool; anything still checked out when the app context ends is returned then.
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
+    if has_app_context():
+        g.setdefault('db_connections', []).append((conn, conn.lease))
     return conn
 
+@app.teardown_appcontext
+def release_db_connections(exception=None):
+    for conn, lease in g.pop('db_connections', []):
+        # Skip connections already closed and possibly handed out again
+        if conn.lease is lease:
+            conn.close()
+
 # Initialize database
 def init_db():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create subjects table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS subjects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        hours INTEGER NOT NULL,
-        requires_lab BOOLEAN NOT NULL DEFAULT 0,
-        priority INTEGER NOT NULL DEFAULT 2,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create teachers table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS teachers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create teacher_subject table (many-to-many)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS teacher_subject (
-        teacher_id INTEGER,
-        subject_id INTEGER,
-        PRIMARY KEY (teacher_id, subject_id),
-        FOREIGN KEY (teacher_id) REFERENCES teachers (id) ON DELETE CASCADE,
-        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE CASCADE
-    )
-    ''')
-    
-    # Create teacher_year table (many-to-many)
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS teacher_year (
-        teacher_id INTEGER,
-        year INTEGER,
-        PRIMARY KEY (teacher_id, year),
-        FOREIGN KEY (teacher_id) REFERENCES teachers (id) ON DELETE CASCADE
-    )
-    ''')
-    
-    # Create classes table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS classes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        year INTEGER NOT NULL,
-        section TEXT NOT NULL,
-        students_count INTEGER NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE(year, section)
-    )
-    ''')
-    
-    # Create timetable_entries table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS timetable_entries (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        class_id INTEGER NOT NULL,
-        day TEXT NOT NULL,
-        time_slot TEXT NOT NULL,
-        subject_id INTEGER,
-        teacher_id INTEGER,
-        is_break BOOLEAN NOT NULL DEFAULT 0,
-        UNIQUE(class_id, day, time_slot),
-        FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE,
-        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE SET NULL,
-        FOREIGN KEY (teacher_id) REFERENCES teachers (id) ON DELETE SET NULL
-    )
-    ''')
-    
-    conn.commit()
+    create_schema(conn)
     conn.close()
 
 # Initialize database on startup
 init_db()
 
+# Version of the committed data, bumped by every write in its transaction
+def current_data_version():
+    conn = get_db_connection()
+    try:
+        return read_data_version(conn)
+    finally:
+        conn.close()
+
+# Serialized GET responses, keyed by the data version
+response_cache = ResponseCache(current_data_version, max_entries=64)
+
+# Manual cell edits, checked against an in-memory index of the timetable;
+# every accepted edit is a new timetable version
+timetable_editor = TimetableEditor(history=functools.partial(record_version, source='edit'))
+
 # Routes for serving static files
 @app.route('/')
 def index():
@@ -113,24 +115,27 @@ def serve_css(filename):
 def serve_js(filename):
     return send_from_directory('static/js', filename)
 
+# List endpoints return the whole (filtered) list as before; with ?limit=
+# they return one keyset page and the id to pass as ?after= for the next
+def list_response(items, next_after, filters):
+    if filters['limit'] is None:
+        return jsonify(items)
+    return jsonify({'items': items, 'nextAfter': next_after})
+
 # API Routes
 @app.route('/api/subjects', methods=['GET', 'POST'])
+@response_cache.cached('subjects')
 def handle_subjects():
     if request.method == 'GET':
+        try:
+            filters = parse_list_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         conn = get_db_connection()
-        subjects = conn.execute('SELECT * FROM subjects').fetchall()
+        result, next_after = list_subjects(conn, filters)
         conn.close()
-        
-        result = []
-        for subject in subjects:
-            result.append({
-                'id': subject['id'],
-                'name': subject['name'],
-                'hours': subject['hours'],
-                'requiresLab': bool(subject['requires_lab']),
-                'priority': subject['priority']
-            })
-        return jsonify(result)
+        return list_response(result, next_after, filters)
     
     elif request.method == 'POST':
         data = request.json
@@ -152,6 +157,7 @@ def handle_subjects():
         
         # Get the ID of the newly created subject
         subject_id = cursor.lastrowid
+        bump_data_version(conn)
         conn.commit()
         
         # Fetch the newly created subject
@@ -178,51 +184,25 @@ def delete_subject(subject_id):
     
     # Delete the subject
     conn.execute('DELETE FROM subjects WHERE id = ?', (subject_id,))
+    bump_data_version(conn)
     conn.commit()
     conn.close()
     
     return jsonify({'message': 'Subject deleted successfully'}), 200
 
 @app.route('/api/teachers', methods=['GET', 'POST'])
+@response_cache.cached('teachers')
 def handle_teachers():
     if request.method == 'GET':
-        conn = get_db_connection()
-        teachers = conn.execute('SELECT * FROM teachers').fetchall()
-        result = []
-        
-        for teacher in teachers:
-            teacher_id = teacher['id']
-            
-            # Get subjects for this teacher
-            subjects_query = '''
-                SELECT s.* FROM subjects s
-                JOIN teacher_subject ts ON s.id = ts.subject_id
-                WHERE ts.teacher_id = ?
-            '''
-            subjects = conn.execute(subjects_query, (teacher_id,)).fetchall()
-            
-            # Get years for this teacher
-            years_query = 'SELECT year FROM teacher_year WHERE teacher_id = ?'
-            years = [row['year'] for row in conn.execute(years_query, (teacher_id,)).fetchall()]
-            
-            # Build teacher object with subjects and years
-            teacher_obj = {
-                'id': teacher_id,
-                'name': teacher['name'],
-                'subjects': [{
-                    'id': subject['id'],
-                    'name': subject['name'],
-                    'hours': subject['hours'],
-                    'requiresLab': bool(subject['requires_lab']),
-                    'priority': subject['priority']
-                } for subject in subjects],
-                'years': years
-            }
-            
-            result.append(teacher_obj)
+        try:
+            filters = parse_list_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
+        conn = get_db_connection()
+        result, next_after = list_teachers(conn, filters)
         conn.close()
-        return jsonify(result)
+        return list_response(result, next_after, filters)
     
     elif request.method == 'POST':
         data = request.json
@@ -242,7 +222,7 @@ def handle_teachers():
         
         # Add subject relationships
         subject_ids = data.get('subjectIds', [])
-        print(f"Adding subject relationships for teacher {teacher_id}: {subject_ids}")
+        app.logger.debug('Adding subject relationships for teacher %s: %s', teacher_id, subject_ids)
         for subject_id in subject_ids:
             cursor.execute('INSERT INTO teacher_subject (teacher_id, subject_id) VALUES (?, ?)',
                          (teacher_id, subject_id))
@@ -253,6 +233,7 @@ def handle_teachers():
             cursor.execute('INSERT INTO teacher_year (teacher_id, year) VALUES (?, ?)',
                          (teacher_id, year))
         
+        bump_data_version(conn)
         conn.commit()
         
         # Fetch the newly created teacher with relationships
@@ -297,27 +278,25 @@ def delete_teacher(teacher_id):
     
     # Delete the teacher (cascade will handle relationships due to foreign key constraints)
     conn.execute('DELETE FROM teachers WHERE id = ?', (teacher_id,))
+    bump_data_version(conn)
     conn.commit()
     conn.close()
     
     return jsonify({'message': 'Teacher deleted successfully'}), 200
 
 @app.route('/api/classes', methods=['GET', 'POST'])
+@response_cache.cached('classes')
 def handle_classes():
     if request.method == 'GET':
+        try:
+            filters = parse_list_args(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         conn = get_db_connection()
-        classes = conn.execute('SELECT * FROM classes').fetchall()
+        result, next_after = list_classes(conn, filters)
         conn.close()
-        
-        result = []
-        for class_obj in classes:
-            result.append({
-                'id': class_obj['id'],
-                'year': class_obj['year'],
-                'section': class_obj['section'],
-                'studentsCount': class_obj['students_count']
-            })
-        return jsonify(result)
+        return list_response(result, next_after, filters)
     
     elif request.method == 'POST':
         data = request.json
@@ -335,7 +314,8 @@ def handle_classes():
         
         # Create new class
         cursor = conn.cursor()
-        print(f"Creating class: Year={data['year']}, Section={data['section']}, Students={data['studentsCount']}")
+        app.logger.debug('Creating class: Year=%s, Section=%s, Students=%s',
+                         data['year'], data['section'], data['studentsCount'])
         cursor.execute('''
             INSERT INTO classes (year, section, students_count)
             VALUES (?, ?, ?)
@@ -343,6 +323,7 @@ def handle_classes():
         
         # Get the ID of the newly created class
         class_id = cursor.lastrowid
+        bump_data_version(conn)
         conn.commit()
         
         # Fetch the newly created class
@@ -368,292 +349,501 @@ def delete_class(class_id):
     
     # Delete the class
     conn.execute('DELETE FROM classes WHERE id = ?', (class_id,))
+    bump_data_version(conn)
     conn.commit()
     conn.close()
     
     return jsonify({'message': 'Class deleted successfully'}), 200
 
-@app.route('/api/timetable/generate', methods=['POST'])
-def generate_timetable():
+MISSING_DATA_ERROR = 'Please add subjects, teachers, and classes first'
+
+# Solve and store a new timetable. Returns the solver stats, or None when
+# there is nothing to schedule yet. progress is forwarded to the solver;
+# a ClassStream, if given, is started and fed each class as it is solved.
+def run_generation(options, progress=None, stream=None):
     conn = get_db_connection()
+    try:
+        # Load subjects, teachers and classes into the scheduling engine
+        problem = load_problem(conn)
+        
+        # Check if we have all required data
+        if not problem.subjects or not problem.teachers or not problem.classes:
+            return None
+        
+        # Refuse input that cannot fit before spending time on it
+        if options['requireFeasible']:
+            require_feasible(problem)
+        
+        if stream is not None:
+            stream.start(conn, problem)
+        
+        # Re-solve only what changed since the last generation when asked to;
+        # without a usable snapshot fall through to a full generation
+        if options['incremental']:
+            stats = regenerate(conn, problem, progress=progress,
+                               history=functools.partial(record_version, source='incremental'))
+            if stats is not None:
+                return stats
+        
+        # The same input and options always give the same timetable: keep the
+        # stored one if it already is that timetable, or restore it from disk
+        key = input_key(problem, options)
+        cached = solver_cache.get(key) if options['useCache'] else None
+        if cached is not None:
+            assignments, stats = cached
+            stats['cache'] = {'hit': True, 'restored': True, 'key': key}
+        else:
+            # Solve in memory
+            assignments, stats = run_solver(problem, options, progress=progress,
+                                            on_class=stream.add_class if stream is not None else None)
+            solver_cache.put(key, assignments, stats)
+            stats['cache'] = {'hit': False, 'restored': False, 'key': key}
+        rows = build_timetable_rows(problem, assignments)
+        
+        # The snapshot only says which generation wrote the table last; it is
+        # still that timetable only while every one of its rows is there
+        if cached is not None and stored_input_key(conn) == key:
+            stored = conn.execute('SELECT COUNT(*) FROM timetable_entries').fetchone()[0]
+            if stored == len(rows):
+                stats['cache']['restored'] = False
+                return stats
+        
+        # Replace the old timetable in one transaction, keeping it in the
+        # version history
+        replace_timetable(conn, rows,
+                          snapshot=snapshot_rows(problem, input_key=key),
+                          history=functools.partial(record_version, source='generate'))
+    finally:
+        conn.close()
     
-    # Clear any existing timetable entries
-    conn.execute('DELETE FROM timetable_entries')
-    conn.commit()
+    return stats
+
+# With `stream`, the job publishes every class of the new timetable for
+# /api/timetable/jobs/<id>/events as soon as it is scheduled
+def generation_job(options, job, stream=False):
+    class_stream = ClassStream(job.publish) if stream else None
+    try:
+        job.result = run_generation(options, progress=job.progress, stream=class_stream)
+    except InfeasibleError as e:
+        # Kept on the failed job so the caller can see the bottlenecks
+        job.result = {'feasibility': e.report}
+        raise
+    if job.result is None:
+        raise ValueError(MISSING_DATA_ERROR)
+    
+    # Classes the solver did not stream, or that changed after it did
+    if class_stream is not None:
+        conn = get_db_connection()
+        try:
+            class_stream.finish(conn)
+        finally:
+            conn.close()
+
+CALENDAR_BUSY_ERROR = 'A timetable generation is in progress; change the calendar once it has finished'
+
+@app.route('/api/calendar', methods=['GET', 'PUT'])
+@response_cache.cached('calendar')
+def handle_calendar():
+    if request.method == 'GET':
+        conn = get_db_connection()
+        calendar = load_bell_schedule(conn)
+        conn.close()
+        return jsonify(calendar.to_dict())
     
-    # Get all subjects, teachers, and classes
-    subjects = conn.execute('SELECT * FROM subjects').fetchall()
-    classes = conn.execute('SELECT * FROM classes').fetchall()
+    try:
+        calendar = parse_bell_schedule(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Get teachers with their subjects and years
-    teachers = []
-    teacher_rows = conn.execute('SELECT * FROM teachers').fetchall()
+    # A running generation would store a timetable for the old calendar
+    job = job_manager.active_job(DB_PATH)
+    if job is not None:
+        return jsonify({'error': CALENDAR_BUSY_ERROR, 'job': job.to_dict()}), 409
     
-    for teacher in teacher_rows:
-        teacher_id = teacher['id']
-        
-        # Get subjects for this teacher
-        subjects_query = '''
-            SELECT s.* FROM subjects s
-            JOIN teacher_subject ts ON s.id = ts.subject_id
-            WHERE ts.teacher_id = ?
-        '''
-        teacher_subjects = conn.execute(subjects_query, (teacher_id,)).fetchall()
-        
-        # Get years for this teacher
-        years_query = 'SELECT year FROM teacher_year WHERE teacher_id = ?'
-        teacher_years = [row['year'] for row in conn.execute(years_query, (teacher_id,)).fetchall()]
-        
-        teachers.append({
-            'id': teacher_id,
-            'name': teacher['name'],
-            'subjects': teacher_subjects,
-            'years': teacher_years
-        })
+    # Stored cells point into the old calendar, so the timetable goes with it
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        write_bell_schedule(conn, calendar, commit=False)
+        clear_timetable(conn)
+        detach_head(conn)
+        bump_data_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    return jsonify(calendar.to_dict()), 200
+
+@app.route('/api/import', methods=['POST'])
+def import_data():
+    # Uploads may come as a multipart file field or as the raw request body
+    upload = request.files.get('file')
+    stream = upload.stream if upload is not None else request.stream
+    content_type = (upload.mimetype if upload is not None else request.mimetype) or ''
+    
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'ndjson' if 'json' in content_type else 'csv'
+    strict = request.args.get('strict') in ('1', 'true')
     
-    # Check if we have all required data
-    if not subjects or not teachers or not classes:
+    conn = get_db_connection()
+    try:
+        records = parse_records(stream, fmt, default_type=request.args.get('type'))
+        report = import_records(conn, records, strict=strict)
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
         conn.close()
-        return jsonify({'error': 'Please add subjects, teachers, and classes first'}), 400
-    
-    # Define days and time slots
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    time_slots = [
-        '9:00AM - 9:50AM', 
-        '10:00AM - 10:50AM', 
-        '11:00AM - 11:10AM',  # Break
-        '11:10AM - 12:00PM', 
-        '12:00PM - 12:50PM', 
-        '12:50PM - 1:30PM',   # Lunch
-        '1:30PM - 2:20PM', 
-        '2:30PM - 3:20PM', 
-        '3:30PM - 4:20PM'
-    ]
     
-    # Track subject hours remaining for each class
-    class_subject_hours = {}
-    for class_obj in classes:
-        class_subject_hours[class_obj['id']] = {}
-        for subject in subjects:
-            class_subject_hours[class_obj['id']][subject['id']] = subject['hours']
-    
-    # Track teacher availability
-    teacher_availability = {}
-    for teacher in teachers:
-        teacher_availability[teacher['id']] = {}
-        for day in days:
-            teacher_availability[teacher['id']][day] = {}
-            for slot in time_slots:
-                teacher_availability[teacher['id']][day][slot] = True
-    
-    # First, add break and lunch slots for all classes
-    for class_obj in classes:
-        for day in days:
-            # Add break slot
-            conn.execute('''
-                INSERT INTO timetable_entries (class_id, day, time_slot, is_break)
-                VALUES (?, ?, ?, ?)
-            ''', (class_obj['id'], day, '11:00AM - 11:10AM', True))
-            
-            # Add lunch slot
-            conn.execute('''
-                INSERT INTO timetable_entries (class_id, day, time_slot, is_break)
-                VALUES (?, ?, ?, ?)
-            ''', (class_obj['id'], day, '12:50PM - 1:30PM', True))
-    
-    # Now schedule subjects for each class
-    for class_obj in classes:
-        for day in days:
-            for slot in time_slots:
-                # Skip break and lunch slots
-                if slot in ['11:00AM - 11:10AM', '12:50PM - 1:30PM']:
-                    continue
-                
-                # Find subjects with remaining hours for this class, sorted by priority
-                available_subjects = [
-                    subject for subject in subjects 
-                    if class_subject_hours[class_obj['id']][subject['id']] > 0
-                ]
-                
-                # Sort by priority (lower number = higher priority)
-                available_subjects.sort(key=lambda s: (s['priority'], -class_subject_hours[class_obj['id']][s['id']]))
-                
-                if available_subjects:
-                    subject = available_subjects[0]
-                    
-                    # Find an available teacher for this subject and class year
-                    available_teachers = [
-                        teacher for teacher in teachers
-                        if any(s['id'] == subject['id'] for s in teacher['subjects'])
-                        and class_obj['year'] in teacher['years']
-                        and teacher_availability[teacher['id']][day][slot]
-                    ]
-                    
-                    if available_teachers:
-                        # Choose a teacher (you could implement more sophisticated selection)
-                        teacher = available_teachers[0]
-                        
-                        # Create timetable entry
-                        conn.execute('''
-                            INSERT INTO timetable_entries (class_id, day, time_slot, subject_id, teacher_id, is_break)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (class_obj['id'], day, slot, subject['id'], teacher['id'], False))
-                        
-                        # Update remaining hours and teacher availability
-                        class_subject_hours[class_obj['id']][subject['id']] -= 1
-                        teacher_availability[teacher['id']][day][slot] = False
-    
-    # Commit all changes to the database
-    conn.commit()
+    return jsonify(report), 200
+
+@app.route('/api/timetable/generate', methods=['POST'])
+def generate_timetable():
+    options = request.get_json(silent=True) or {}
+    run_async = options.get('async', request.args.get('async') in ('1', 'true'))
+    
+    # "stream": true runs the job in the background and streams its classes
+    # from eventsUrl as they are scheduled
+    stream = options.get('stream', False)
+    if not isinstance(stream, bool):
+        return jsonify({'error': 'stream must be true or false'}), 400
+    
+    try:
+        solver_options = parse_solver_options(options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Every generation goes through the job manager so that only one write
+    # runs per database; a generation already in progress is reused when it
+    # runs with the same options
+    try:
+        job, created = job_manager.submit(DB_PATH, functools.partial(generation_job, solver_options, stream=stream),
+                                          options=solver_options)
+    except JobConflict as e:
+        return jsonify({'error': str(e), 'job': e.job.to_dict()}), 409
+    
+    if run_async or stream:
+        result = job.to_dict()
+        result['coalesced'] = not created
+        result['eventsUrl'] = f'/api/timetable/jobs/{job.id}/events'
+        return jsonify(result), 202
+    
+    job.wait()
+    if job.status == FAILED:
+        if job.error == INFEASIBLE_ERROR:
+            return jsonify({'error': job.error, 'feasibility': job.result['feasibility']}), 422
+        if job.error == CALENDAR_CHANGED_ERROR:
+            return jsonify({'error': job.error}), 409
+        status = 400 if job.error == MISSING_DATA_ERROR else 500
+        return jsonify({'error': job.error}), status
+    if job.status == CANCELLED:
+        return jsonify({'error': 'Timetable generation was cancelled'}), 409
+    
+    # Return the generated timetable along with how the run went
+    conn = get_db_connection()
+    result = read_timetable_payload(conn)
     conn.close()
+    result['generation'] = job.result
+    result['coalesced'] = not created
+    result['options'] = job.options
+    
+    return jsonify(result)
+
+# Upper bounds on what any solver can schedule and the bottlenecks behind
+# them, computed without solving
+@app.route('/api/timetable/feasibility', methods=['GET'])
+@response_cache.cached('feasibility')
+def get_feasibility():
+    conn = get_db_connection()
+    problem = load_problem(conn)
+    conn.close()
+    
+    return jsonify(check_feasibility(problem))
+
+# Clashes, excess hours, ineligible teachers and dangling rows in the
+# stored timetable; ?limit= caps how many violations are listed
+@app.route('/api/timetable/validate', methods=['GET'])
+@response_cache.cached('validate')
+def validate_stored_timetable():
+    try:
+        limit = int(request.args.get('limit', MAX_VIOLATIONS))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit < 0:
+        return jsonify({'error': 'limit must be at least 0'}), 400
+    
+    conn = get_db_connection()
+    report = validate_timetable(conn, limit=limit)
+    conn.close()
+    
+    return jsonify(report)
+
+@app.route('/api/timetable/jobs/<job_id>', methods=['GET', 'DELETE'])
+def handle_job(job_id):
+    if request.method == 'DELETE':
+        job = job_manager.cancel(job_id)
+    else:
+        job = job_manager.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job.to_dict()), 200
+
+# Server-sent events of a job: 'progress' per whole percent, the 'layout',
+# 'class' and 'summary' events of a streamed generation, and a final 'end'
+# with the job as /api/timetable/jobs/<id> returns it. A client that
+# reconnects resumes after its Last-Event-ID; a comment line keeps idle
+# connections open.
+@app.route('/api/timetable/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+    
+    keepalive = app.config['EVENT_KEEPALIVE_SECONDS']
+    
+    def generate():
+        position = start
+        while True:
+            events, closed = job.events(position, timeout=keepalive)
+            if not events and not closed:
+                yield ': keep-alive\n\n'
+                continue
+            for number, name, data in events:
+                yield format_event(number, name, data)
+                position = number + 1
+            if closed:
+                return
+    
+    return app.response_class(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/timetable/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.active:
+        return jsonify(job.to_dict()), 202
+    
+    if job.status != COMPLETED:
+        return jsonify(dict(job.to_dict(), error=job.error or f'Job {job.status}')), 409
     
-    # Return the generated timetable
     return get_timetable()
 
+# ?format=compact sends lookup tables plus integer grids instead of
+# embedding full subject and teacher objects in every cell
+def read_timetable_payload(conn):
+    if request.args.get('format') == 'compact':
+        return read_timetable_compact(conn)
+    return read_timetable(conn)
+
 @app.route('/api/timetable', methods=['GET'])
+@response_cache.cached('timetable')
 def get_timetable():
     conn = get_db_connection()
+    result = read_timetable_payload(conn)
+    conn.close()
     
-    # Get all classes
-    classes = conn.execute('SELECT * FROM classes').fetchall()
-    
-    # Define days and time slots
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    time_slots = [
-        '9:00AM - 9:50AM', 
-        '10:00AM - 10:50AM', 
-        '11:00AM - 11:10AM',  # Break
-        '11:10AM - 12:00PM', 
-        '12:00PM - 12:50PM', 
-        '12:50PM - 1:30PM',   # Lunch
-        '1:30PM - 2:20PM', 
-        '2:30PM - 3:20PM', 
-        '3:30PM - 4:20PM'
-    ]
+    return jsonify(result)
+
+# One teacher's week, one class's week or one day across all classes,
+# without reading the whole timetable
+@app.route('/api/timetable/teacher/<int:teacher_id>', methods=['GET'])
+@response_cache.cached('timetable-teacher')
+def get_teacher_timetable(teacher_id):
+    conn = get_db_connection()
+    result = read_teacher_view(conn, teacher_id)
+    conn.close()
     
-    # Prepare the response
-    timetable_data = {}
-    
-    for class_obj in classes:
-        class_id = class_obj['id']
-        timetable_data[class_id] = {
-            'classInfo': {
-                'id': class_obj['id'],
-                'year': class_obj['year'],
-                'section': class_obj['section'],
-                'studentsCount': class_obj['students_count']
-            },
-            'timetable': {}
-        }
-        
-        # Initialize empty timetable for this class
-        for day in days:
-            timetable_data[class_id]['timetable'][day] = {}
-            for slot in time_slots:
-                timetable_data[class_id]['timetable'][day][slot] = None
-        
-        # Get all timetable entries for this class
-        entries = conn.execute(
-            'SELECT * FROM timetable_entries WHERE class_id = ?', 
-            (class_id,)
-        ).fetchall()
-        
-        # Fill in the timetable
-        for entry in entries:
-            if entry['is_break']:
-                timetable_data[class_id]['timetable'][entry['day']][entry['time_slot']] = {
-                    'isBreak': True,
-                    'breakType': 'Break' if '11:00AM' in entry['time_slot'] else 'Lunch'
-                }
-            else:
-                # Get subject details
-                subject = None
-                if entry['subject_id']:
-                    subject_data = conn.execute(
-                        'SELECT * FROM subjects WHERE id = ?', 
-                        (entry['subject_id'],)
-                    ).fetchone()
-                    if subject_data:
-                        subject = {
-                            'id': subject_data['id'],
-                            'name': subject_data['name'],
-                            'hours': subject_data['hours'],
-                            'requiresLab': bool(subject_data['requires_lab']),
-                            'priority': subject_data['priority']
-                        }
-                
-                # Get teacher details
-                teacher = None
-                if entry['teacher_id']:
-                    teacher_data = conn.execute(
-                        'SELECT * FROM teachers WHERE id = ?', 
-                        (entry['teacher_id'],)
-                    ).fetchone()
-                    if teacher_data:
-                        # Get teacher subjects
-                        subjects_query = '''
-                            SELECT s.* FROM subjects s
-                            JOIN teacher_subject ts ON s.id = ts.subject_id
-                            WHERE ts.teacher_id = ?
-                        '''
-                        teacher_subjects = conn.execute(subjects_query, (teacher_data['id'],)).fetchall()
-                        
-                        # Get teacher years
-                        years_query = 'SELECT year FROM teacher_year WHERE teacher_id = ?'
-                        teacher_years = [row['year'] for row in conn.execute(years_query, (teacher_data['id'],)).fetchall()]
-                        
-                        teacher = {
-                            'id': teacher_data['id'],
-                            'name': teacher_data['name'],
-                            'subjects': [{
-                                'id': s['id'],
-                                'name': s['name'],
-                                'hours': s['hours'],
-                                'requiresLab': bool(s['requires_lab']),
-                                'priority': s['priority']
-                            } for s in teacher_subjects],
-                            'years': teacher_years
-                        }
-                
-                timetable_data[class_id]['timetable'][entry['day']][entry['time_slot']] = {
-                    'subject': subject,
-                    'teacher': teacher
-                }
-    
-    # Check for unscheduled subjects
-    unscheduled_info = {}
-    
-    # Get all subjects with their total hours
-    subjects = conn.execute('SELECT * FROM subjects').fetchall()
-    class_count = len(classes)
-    subject_total_hours = {subject['id']: subject['hours'] * class_count for subject in subjects}
-    
-    # Count scheduled hours
-    scheduled_hours = {}
-    scheduled_entries = conn.execute(
-        'SELECT subject_id, COUNT(*) as count FROM timetable_entries WHERE is_break = 0 AND subject_id IS NOT NULL GROUP BY subject_id'
-    ).fetchall()
-    
-    for entry in scheduled_entries:
-        scheduled_hours[entry['subject_id']] = entry['count']
-    
-    # Calculate unscheduled hours
-    for subject in subjects:
-        subject_id = subject['id']
-        scheduled = scheduled_hours.get(subject_id, 0)
-        total = subject_total_hours.get(subject_id, 0)
-        if scheduled < total:
-            unscheduled_info[subject_id] = {
-                'name': subject['name'],
-                'unscheduledHours': total - scheduled
-            }
+    if result is None:
+        return jsonify({'error': 'Teacher not found'}), 404
+    return jsonify(result)
+
+@app.route('/api/timetable/class/<int:class_id>', methods=['GET'])
+@response_cache.cached('timetable-class')
+def get_class_timetable(class_id):
+    conn = get_db_connection()
+    result = read_class_view(conn, class_id)
+    conn.close()
+    
+    if result is None:
+        return jsonify({'error': 'Class not found'}), 404
+    return jsonify(result)
+
+@app.route('/api/timetable/day/<day>', methods=['GET'])
+@response_cache.cached('timetable-day')
+def get_day_timetable(day):
+    conn = get_db_connection()
+    result = read_day_view(conn, day)
+    conn.close()
+    
+    if result is None:
+        return jsonify({'error': 'Day not found'}), 404
+    return jsonify(result)
+
+# Run a timetable edit and turn its outcome into a response: the changed
+# cells, or the conflicts that kept it from being stored
+def edit_response(edit):
+    conn = get_db_connection()
+    try:
+        changes, conflicts = edit(conn)
+    except EditNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    
+    if conflicts:
+        return jsonify({'error': 'The edit conflicts with the timetable', 'conflicts': conflicts}), 409
+    return jsonify({'cells': [cell_to_dict(cell, lesson) for cell, lesson in changes.items()]}), 200
+
+@app.route('/api/timetable/cell', methods=['PATCH'])
+def edit_timetable_cell():
+    try:
+        cell, lesson = parse_cell_edit(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return edit_response(lambda conn: timetable_editor.set_cell(conn, cell, lesson))
+
+@app.route('/api/timetable/swap', methods=['POST'])
+def swap_timetable_cells():
+    data = request.get_json(silent=True) or {}
+    try:
+        first = parse_cell(data.get('first'))
+        second = parse_cell(data.get('second'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return edit_response(lambda conn: timetable_editor.swap(conn, first, second))
+
+# Timetable history: every generation, incremental run and accepted edit
+# stores the cells it changed as a new version
+@app.route('/api/timetable/versions', methods=['GET'])
+@response_cache.cached('versions')
+def get_timetable_versions():
+    try:
+        filters = parse_list_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    items, next_after = list_versions(conn, filters['after'], filters['limit'])
+    conn.close()
     
+    return list_response(items, next_after, filters)
+
+@app.route('/api/timetable/versions/<int:from_id>/diff/<int:to_id>', methods=['GET'])
+@response_cache.cached('versions-diff')
+def diff_timetable_versions(from_id, to_id):
+    conn = get_db_connection()
+    result = diff_versions(conn, from_id, to_id)
     conn.close()
     
-    return jsonify({
-        'timetable': timetable_data,
-        'unscheduledInfo': unscheduled_info
-    })
+    if result is None:
+        return jsonify({'error': 'Version not found'}), 404
+    return jsonify(result)
+
+# Roll the stored timetable back (or forward) to a version by rewriting
+# only the cells that differ; no solver runs
+@app.route('/api/timetable/versions/<int:version_id>/activate', methods=['POST'])
+def activate_timetable_version(version_id):
+    conn = get_db_connection()
+    try:
+        result = activate_version(conn, version_id)
+    except StaleVersionError as e:
+        return jsonify({'error': str(e)}), 409
+    finally:
+        conn.close()
+    
+    if result is None:
+        return jsonify({'error': 'Version not found'}), 404
+    version, written = result
+    return jsonify({'version': version, 'writtenCells': written}), 200
+
+@app.route('/api/timetable/export', methods=['GET'])
+def export_timetable():
+    fmt = request.args.get('format', 'csv')
+    by = request.args.get('by', 'class')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if by not in EXPORT_GROUPS:
+        return jsonify({'error': f"by must be one of {', '.join(EXPORT_GROUPS)}"}), 400
+    
+    group_id = request.args.get('id')
+    start = request.args.get('start')
+    try:
+        group_id = int(group_id) if group_id is not None else None
+        week_start = week_of(datetime.date.fromisoformat(start) if start else datetime.date.today())
+    except ValueError:
+        return jsonify({'error': 'id must be an integer and start a YYYY-MM-DD date'}), 400
+    
+    conn = get_db_connection()
+    
+    # Rows are read and sent one class or teacher at a time, so memory stays
+    # flat however large the institution is
+    def generate():
+        try:
+            yield from iter_export(conn, fmt, by=by, group_id=group_id, week_start=week_start)
+        finally:
+            conn.close()
+    
+    filename = f'timetable-{by}' + (f'-{group_id}' if group_id is not None else '') + f'.{fmt}'
+    return app.response_class(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/db/pool', methods=['GET'])
+def get_pool_stats():
+    return jsonify(db_pool.stats())
+
+def collect_app_metrics():
+    pool = db_pool.stats()
+    return [
+        ('timetable_db_pool_connections', 'gauge', 'Pooled database connections by state.',
+         {'state': 'idle'}, pool['idle']),
+        ('timetable_db_pool_connections', 'gauge', 'Pooled database connections by state.',
+         {'state': 'in_use'}, pool['inUse']),
+        ('timetable_db_pool_hits_total', 'counter', 'Checkouts served by an idle connection.',
+         {}, pool['hits']),
+        ('timetable_db_pool_misses_total', 'counter', 'Checkouts that opened a new connection.',
+         {}, pool['misses']),
+        ('timetable_db_pool_waits_total', 'counter', 'Checkouts that had to wait for a connection.',
+         {}, pool['waits']),
+        ('timetable_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting.',
+         {}, pool['timeouts']),
+        ('timetable_response_cache_hits_total', 'counter', 'GET responses served from the cache.',
+         {}, response_cache.hits),
+        ('timetable_response_cache_misses_total', 'counter', 'GET responses that had to be built.',
+         {}, response_cache.misses),
+        ('timetable_solver_cache_hits_total', 'counter', 'Generations answered from the solver cache.',
+         {}, solver_cache.hits),
+        ('timetable_solver_cache_misses_total', 'counter', 'Generations that had to run the solver.',
+         {}, solver_cache.misses),
+        ('timetable_data_version', 'gauge', 'Current version of the committed data.',
+         {}, current_data_version()[1])
+    ]
+
+request_metrics.add_collector(collect_app_metrics)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return app.response_class(request_metrics.render(),
+                              mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/clear', methods=['POST'])
 def clear_data():
@@ -661,13 +851,15 @@ def clear_data():
     conn = get_db_connection()
     
     # Delete in order to respect foreign key constraints
-    conn.execute('DELETE FROM timetable_entries')
+    clear_timetable(conn)
     conn.execute('DELETE FROM teacher_subject')
     conn.execute('DELETE FROM teacher_year')
     conn.execute('DELETE FROM teachers')
     conn.execute('DELETE FROM subjects')
     conn.execute('DELETE FROM classes')
+    clear_versions(conn)
     
+    bump_data_version(conn)
     conn.commit()
     conn.close()
     
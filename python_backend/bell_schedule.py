@@ -0,0 +1,119 @@
+DEFAULT_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+# (label, break type) per period; break type is None for teaching periods
+DEFAULT_PERIODS = [
+    ('9:00AM - 9:50AM', None),
+    ('10:00AM - 10:50AM', None),
+    ('11:00AM - 11:10AM', 'Break'),
+    ('11:10AM - 12:00PM', None),
+    ('12:00PM - 12:50PM', None),
+    ('12:50PM - 1:30PM', 'Lunch'),
+    ('1:30PM - 2:20PM', None),
+    ('2:30PM - 3:20PM', None),
+    ('3:30PM - 4:20PM', None)
+]
+
+MAX_DAYS = 7
+MAX_PERIODS = 24
+
+
+# The institution's week: named days and periods, some of which are breaks.
+# Timetable cells are addressed by integer (day_idx, period_idx) pairs, or
+# by the flat index day_idx * len(periods) + period_idx.
+class BellSchedule:
+    def __init__(self, days=DEFAULT_DAYS, periods=DEFAULT_PERIODS):
+        self.days = list(days)
+        self.periods = [label for label, _ in periods]
+        # period_idx -> break label ('Break', 'Lunch', ...)
+        self.break_types = {
+            period_idx: break_type
+            for period_idx, (_, break_type) in enumerate(periods)
+            if break_type
+        }
+        self.teaching_periods = [
+            period_idx for period_idx in range(len(self.periods))
+            if period_idx not in self.break_types
+        ]
+
+    @property
+    def cell_count(self):
+        return len(self.days) * len(self.periods)
+
+    def cell(self, day_idx, period_idx):
+        return day_idx * len(self.periods) + period_idx
+
+    # Break labels keyed by period label, as sent to the browser
+    def break_slots(self):
+        return {self.periods[period_idx]: break_type
+                for period_idx, break_type in self.break_types.items()}
+
+    def to_dict(self):
+        return {
+            'days': self.days,
+            'periods': [
+                {'label': label, 'breakType': self.break_types.get(period_idx)}
+                for period_idx, label in enumerate(self.periods)
+            ]
+        }
+
+
+# Validate a {'days': [...], 'periods': [{'label', 'breakType'}]} payload.
+# Raises ValueError with a message suitable for the API.
+def parse_bell_schedule(data):
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+
+    days = data.get('days')
+    if not isinstance(days, list) or not 1 <= len(days) <= MAX_DAYS:
+        raise ValueError(f'days must be a list of 1 to {MAX_DAYS} day names')
+    days = [str(day).strip() for day in days]
+    if not all(days) or len(set(days)) != len(days):
+        raise ValueError('day names must be non-empty and unique')
+
+    periods = data.get('periods')
+    if not isinstance(periods, list) or not 1 <= len(periods) <= MAX_PERIODS:
+        raise ValueError(f'periods must be a list of 1 to {MAX_PERIODS} periods')
+    parsed = []
+    for period in periods:
+        if not isinstance(period, dict):
+            raise ValueError('each period must be an object with a label')
+        label = str(period.get('label') or '').strip()
+        break_type = period.get('breakType')
+        break_type = str(break_type).strip() or None if break_type is not None else None
+        parsed.append((label, break_type))
+    labels = [label for label, _ in parsed]
+    if not all(labels) or len(set(labels)) != len(labels):
+        raise ValueError('period labels must be non-empty and unique')
+    if all(break_type for _, break_type in parsed):
+        raise ValueError('at least one period must be a teaching period')
+
+    return BellSchedule(days, parsed)
+
+
+def load_bell_schedule(conn):
+    days = [row['name'] for row in
+            conn.execute('SELECT name FROM calendar_days ORDER BY day_idx').fetchall()]
+    periods = [(row['label'], row['break_type']) for row in
+               conn.execute('SELECT label, break_type FROM calendar_periods ORDER BY period_idx').fetchall()]
+    return BellSchedule(days, periods)
+
+
+# Identifies a calendar: cells stored under one mean nothing under another
+def calendar_signature(calendar):
+    return repr((calendar.days, calendar.periods, sorted(calendar.break_types)))
+
+
+# Store `schedule` as the calendar. Without `commit` the caller owns the
+# transaction.
+def write_bell_schedule(conn, schedule, commit=True):
+    conn.execute('DELETE FROM calendar_days')
+    conn.execute('DELETE FROM calendar_periods')
+    conn.executemany('INSERT INTO calendar_days (day_idx, name) VALUES (?, ?)',
+                     list(enumerate(schedule.days)))
+    conn.executemany(
+        'INSERT INTO calendar_periods (period_idx, label, break_type) VALUES (?, ?, ?)',
+        [(period_idx, label, schedule.break_types.get(period_idx))
+         for period_idx, label in enumerate(schedule.periods)]
+    )
+    if commit:
+        conn.commit()
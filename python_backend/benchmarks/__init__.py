@@ -0,0 +1,2 @@
+# Offline benchmarks for timetable generation, persistence and reads.
+# Run from python_backend/ with: python -m benchmarks --help
@@ -0,0 +1,86 @@
+import argparse
+import json
+import sys
+
+from benchmarks.harness import STAGES, compare, run_suite
+from solvers import SOLVERS, parse_solver_options
+
+
+def parse_sizes(value):
+    try:
+        sizes = [int(size) for size in value.split(',') if size.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError('sizes must be a comma separated list of integers')
+    if not sizes or any(size < 1 for size in sizes):
+        raise argparse.ArgumentTypeError('sizes must be positive integers')
+    return sizes
+
+
+def parse_options(value):
+    try:
+        options = json.loads(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('solver options must be valid JSON')
+    if not isinstance(options, dict):
+        raise argparse.ArgumentTypeError('solver options must be a JSON object')
+    return options
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark timetable generation, persistence and reads on synthetic data.'
+    )
+    parser.add_argument('--sizes', type=parse_sizes, default=[10, 100, 1000],
+                        help='comma separated class counts (default: 10,100,1000)')
+    parser.add_argument('--seed', type=int, default=0, help='dataset and solver seed')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, fastest is reported')
+    parser.add_argument('--years', type=int, default=4, help='number of study years')
+    parser.add_argument('--year-spread', type=int, default=1,
+                        help='years each synthetic teacher covers')
+    parser.add_argument('--solver', default='greedy', choices=SOLVERS, help='solver to benchmark')
+    parser.add_argument('--solver-options', type=parse_options, default={},
+                        help='extra solver options as JSON, e.g. \'{"starts": 8}\'')
+    parser.add_argument('--output', help='write the results JSON to this file')
+    parser.add_argument('--baseline', help='compare against this results JSON')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before a stage counts as a regression (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    solver_options = dict(args.solver_options, solver=args.solver, seed=args.seed)
+    try:
+        parse_solver_options(solver_options)
+    except ValueError as e:
+        parser.error(f'--solver-options: {e}')
+    results = run_suite(args.sizes, seed=args.seed, repeat=args.repeat, years=args.years,
+                        year_spread=args.year_spread, solver_options=solver_options)
+
+    print(f"{'case':<32}{'entries':>9}" + ''.join(f'{stage + " ms":>12}' for stage in STAGES)
+          + f"{'sql':>7}{'unsched':>9}")
+    for name, case in results['cases'].items():
+        sql = sum(case['sqlStatements'].values())
+        print(f"{name:<32}{case['entries']:>9}"
+              + ''.join(f"{case['timingsMs'][stage]:>12.1f}" for stage in STAGES)
+              + f"{sql:>7}{case['unscheduledHours']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        if regressions:
+            print('Regressions against baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+        print('No regressions against baseline.')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import contextlib
+import datetime
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_institution
+from db import ConnectionPool, create_schema
+from persistence import build_timetable_rows, replace_timetable
+from reader import read_timetable
+from scheduler import load_problem
+from solvers import parse_solver_options, run_solver
+
+RESULTS_VERSION = 1
+
+STAGES = ('load', 'solve', 'persist', 'read')
+
+# Timing differences below this many milliseconds are treated as noise
+MIN_REGRESSION_MS = 5.0
+
+
+# Counts SQL statements run on `conn` inside the block. SQLite reports every
+# execution, so executemany counts once per row.
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        self.count += 1
+
+
+@contextlib.contextmanager
+def count_statements(conn):
+    counter = StatementCounter()
+    conn.set_trace_callback(counter)
+    try:
+        yield counter
+    finally:
+        conn.set_trace_callback(None)
+
+
+def case_name(classes, solver):
+    return f'classes={classes},solver={solver}'
+
+
+# Benchmark one institution size against a throwaway SQLite file.
+# Each stage is run `repeat` times; the fastest run is reported along with
+# the median, and SQL statement counts come from the last run.
+def run_case(classes, seed=0, repeat=3, years=4, year_spread=1, solver_options=None):
+    options = parse_solver_options(solver_options or {})
+    timings = {stage: [] for stage in STAGES}
+    statements = {}
+
+    with tempfile.TemporaryDirectory(prefix='timetable-bench-') as workdir:
+        pool = ConnectionPool(os.path.join(workdir, 'bench.db'), size=1)
+        conn = pool.acquire()
+        try:
+            create_schema(conn)
+            sizes = generate_institution(conn, classes, seed=seed, years=years, year_spread=year_spread)
+
+            for _ in range(max(1, repeat)):
+                with count_statements(conn) as counter:
+                    started = time.perf_counter()
+                    problem = load_problem(conn)
+                    timings['load'].append(time.perf_counter() - started)
+                statements['load'] = counter.count
+
+                started = time.perf_counter()
+                assignments, stats = run_solver(problem, options)
+                timings['solve'].append(time.perf_counter() - started)
+
+                with count_statements(conn) as counter:
+                    started = time.perf_counter()
+                    rows = build_timetable_rows(problem, assignments)
+                    replace_timetable(conn, rows)
+                    timings['persist'].append(time.perf_counter() - started)
+                statements['persist'] = counter.count
+
+                with count_statements(conn) as counter:
+                    started = time.perf_counter()
+                    read_timetable(conn)
+                    timings['read'].append(time.perf_counter() - started)
+                statements['read'] = counter.count
+        finally:
+            conn.close()
+            pool.close_all()
+
+    return {
+        'classes': classes,
+        'teachers': sizes['teachers'],
+        'subjects': sizes['subjects'],
+        'seed': seed,
+        'solver': options['solver'],
+        'entries': len(rows),
+        'unscheduledHours': stats['unscheduledHours'],
+        'timingsMs': {stage: round(min(values) * 1000, 3) for stage, values in timings.items()},
+        'medianMs': {stage: round(statistics.median(values) * 1000, 3) for stage, values in timings.items()},
+        'sqlStatements': statements
+    }
+
+
+def run_suite(sizes, seed=0, repeat=3, years=4, year_spread=1, solver_options=None):
+    solver_options = solver_options or {}
+    cases = {}
+    for classes in sizes:
+        result = run_case(classes, seed=seed, repeat=repeat, years=years,
+                          year_spread=year_spread, solver_options=solver_options)
+        cases[case_name(classes, result['solver'])] = result
+
+    return {
+        'version': RESULTS_VERSION,
+        'createdAt': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'sizes': list(sizes),
+            'seed': seed,
+            'repeat': repeat,
+            'years': years,
+            'yearSpread': year_spread,
+            'solver': solver_options
+        },
+        'cases': cases
+    }
+
+
+# Compare a results document with a stored baseline. A case regresses when
+# a stage got slower by more than `tolerance` (a fraction) and by at least
+# MIN_REGRESSION_MS, when it ran more SQL statements, or when it left more
+# hours unscheduled. Returns a list of human readable regressions.
+def compare(results, baseline, tolerance=0.25):
+    regressions = []
+    for name, case in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name)
+        if previous is None:
+            continue
+
+        for stage in STAGES:
+            now = case['timingsMs'].get(stage)
+            before = previous.get('timingsMs', {}).get(stage)
+            if now is None or before is None:
+                continue
+            if now > before * (1 + tolerance) and now - before >= MIN_REGRESSION_MS:
+                regressions.append(f'{name}: {stage} took {now:.1f} ms, baseline {before:.1f} ms')
+
+        for stage, now in case['sqlStatements'].items():
+            before = previous.get('sqlStatements', {}).get(stage)
+            if before is not None and now > before:
+                regressions.append(f'{name}: {stage} ran {now} SQL statements, baseline {before}')
+
+        before = previous.get('unscheduledHours')
+        if before is not None and case['unscheduledHours'] > before:
+            regressions.append(
+                f"{name}: {case['unscheduledHours']} unscheduled hours, baseline {before}")
+
+    return regressions
@@ -0,0 +1,91 @@
+import math
+import random
+
+# Lessons per week a synthetic teacher is planned for, out of 42 slots
+TEACHER_LOAD = 30
+
+# Teaching hours per class per week spread over the subjects
+HOURS_PER_CLASS = 36
+
+
+# Fill an empty database with a seeded synthetic institution.
+#
+# `classes` classes are spread evenly over `years` years. Every class takes
+# every subject (as the scheduler expects), with HOURS_PER_CLASS hours split
+# across `subjects` subjects. Teachers are added per (subject, year) until
+# that demand fits TEACHER_LOAD lessons each; every teacher also covers
+# `year_spread - 1` other years, and some teach a second subject.
+# Returns the number of subjects, teachers and classes created.
+def generate_institution(conn, classes, seed=0, years=4, year_spread=1, subjects=8):
+    rng = random.Random(seed)
+    years = max(1, years)
+    year_spread = max(1, min(year_spread, years))
+    subject_count = max(1, min(subjects, HOURS_PER_CLASS))
+
+    # Split the weekly hours over the subjects, at least one hour each
+    hours = [1] * subject_count
+    for _ in range(HOURS_PER_CLASS - subject_count):
+        hours[rng.randrange(subject_count)] += 1
+
+    subject_rows = [
+        (f'Subject {number}', hours[number], rng.random() < 0.25, rng.randint(1, 3))
+        for number in range(subject_count)
+    ]
+    conn.executemany(
+        'INSERT INTO subjects (name, hours, requires_lab, priority) VALUES (?, ?, ?, ?)',
+        subject_rows
+    )
+    subject_ids = [row[0] for row in conn.execute('SELECT id FROM subjects ORDER BY id').fetchall()]
+
+    class_rows = []
+    classes_per_year = [0] * years
+    for number in range(classes):
+        year = number % years + 1
+        classes_per_year[year - 1] += 1
+        class_rows.append((year, f'S{number // years + 1}', rng.randint(30, 70)))
+    conn.executemany(
+        'INSERT INTO classes (year, section, students_count) VALUES (?, ?, ?)',
+        class_rows
+    )
+
+    teacher_names = []
+    teacher_subjects = []
+    teacher_years = []
+    for position, subject_id in enumerate(subject_ids):
+        for year in range(1, years + 1):
+            demand = classes_per_year[year - 1] * hours[position]
+            for _ in range(math.ceil(demand / TEACHER_LOAD)):
+                number = len(teacher_names)
+                teacher_names.append((f'Teacher {number}',))
+
+                taught = {subject_id}
+                if subject_count > 1 and rng.random() < 0.3:
+                    taught.add(rng.choice(subject_ids))
+                teacher_subjects.append(taught)
+
+                covered = {year}
+                while len(covered) < year_spread:
+                    covered.add(rng.randint(1, years))
+                teacher_years.append(covered)
+
+    conn.executemany('INSERT INTO teachers (name) VALUES (?)', teacher_names)
+    teacher_ids = [row[0] for row in conn.execute('SELECT id FROM teachers ORDER BY id').fetchall()]
+    conn.executemany(
+        'INSERT INTO teacher_subject (teacher_id, subject_id) VALUES (?, ?)',
+        [(teacher_id, subject_id)
+         for teacher_id, taught in zip(teacher_ids, teacher_subjects)
+         for subject_id in sorted(taught)]
+    )
+    conn.executemany(
+        'INSERT INTO teacher_year (teacher_id, year) VALUES (?, ?)',
+        [(teacher_id, year)
+         for teacher_id, covered in zip(teacher_ids, teacher_years)
+         for year in sorted(covered)]
+    )
+    conn.commit()
+
+    return {
+        'subjects': subject_count,
+        'teachers': len(teacher_ids),
+        'classes': classes
+    }
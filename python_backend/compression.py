@@ -0,0 +1,91 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+# Brotli is optional; without it responses fall back to gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json', 'application/javascript', 'text/css', 'text/html', 'text/plain'
+)
+
+
+# Compress responses with brotli or gzip, whichever the client prefers in
+# Accept-Encoding.
+#
+# Bodies smaller than `min_size` or of other content types go out as they
+# are, and streamed responses are never buffered. Responses that carry an
+# ETag (the cached GET routes) keep their compressed body in a small LRU, so
+# a cache hit does not pay for compression again. The ETag is weakened since
+# the bytes on the wire differ per encoding.
+class Compressor:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, max_entries=32):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.after_request(self._after_request)
+
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def choose_encoding(self, accept_encodings):
+        best = None
+        best_quality = 0
+        for encoding in self.encodings():
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _after_request(self, response):
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (etag, encoding) if etag else None
+        body = None
+        if key is not None:
+            with self._lock:
+                body = self._entries.get(key)
+                if body is not None:
+                    self._entries.move_to_end(key)
+
+        if body is None:
+            body = self.compress(data, encoding)
+            if key is not None:
+                with self._lock:
+                    self._entries[key] = body
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
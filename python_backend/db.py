@@ -0,0 +1,407 @@
+import contextvars
+import sqlite3
+import threading
+import time
+
+from bell_schedule import BellSchedule, write_bell_schedule
+
+# SqlRecorder collecting statements for the current request, if any
+sql_recorder = contextvars.ContextVar('sql_recorder', default=None)
+
+
+# Create all tables used by the app if they do not exist yet
+def create_schema(conn):
+    cursor = conn.cursor()
+    
+    # Create subjects table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS subjects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        hours INTEGER NOT NULL,
+        requires_lab BOOLEAN NOT NULL DEFAULT 0,
+        priority INTEGER NOT NULL DEFAULT 2,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Create teachers table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS teachers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    # Create teacher_subject table (many-to-many)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS teacher_subject (
+        teacher_id INTEGER,
+        subject_id INTEGER,
+        PRIMARY KEY (teacher_id, subject_id),
+        FOREIGN KEY (teacher_id) REFERENCES teachers (id) ON DELETE CASCADE,
+        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE CASCADE
+    )
+    ''')
+    
+    # Create teacher_year table (many-to-many)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS teacher_year (
+        teacher_id INTEGER,
+        year INTEGER,
+        PRIMARY KEY (teacher_id, year),
+        FOREIGN KEY (teacher_id) REFERENCES teachers (id) ON DELETE CASCADE
+    )
+    ''')
+    
+    # Create classes table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS classes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        year INTEGER NOT NULL,
+        section TEXT NOT NULL,
+        students_count INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(year, section)
+    )
+    ''')
+    
+    # Calendar: the days and periods (with break periods) of the week
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS calendar_days (
+        day_idx INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS calendar_periods (
+        period_idx INTEGER PRIMARY KEY,
+        label TEXT NOT NULL UNIQUE,
+        break_type TEXT
+    )
+    ''')
+    if conn.execute('SELECT COUNT(*) FROM calendar_days').fetchone()[0] == 0:
+        write_bell_schedule(conn, BellSchedule(), commit=False)
+    
+    # Create timetable_entries table. Cells are keyed by integer day and
+    # period indexes into the calendar tables; the primary key serves
+    # per-class reads.
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(timetable_entries)').fetchall()]
+    if 'time_slot' in columns:
+        cursor.execute('ALTER TABLE timetable_entries RENAME TO timetable_entries_text')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS timetable_entries (
+        class_id INTEGER NOT NULL,
+        day_idx INTEGER NOT NULL,
+        period_idx INTEGER NOT NULL,
+        subject_id INTEGER,
+        teacher_id INTEGER,
+        is_break BOOLEAN NOT NULL DEFAULT 0,
+        PRIMARY KEY (class_id, day_idx, period_idx),
+        FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE,
+        FOREIGN KEY (subject_id) REFERENCES subjects (id) ON DELETE SET NULL,
+        FOREIGN KEY (teacher_id) REFERENCES teachers (id) ON DELETE SET NULL
+    ) WITHOUT ROWID
+    ''')
+    
+    # Carry over a timetable stored with the old day / time_slot text columns
+    if 'time_slot' in columns:
+        cursor.execute('''
+        INSERT OR IGNORE INTO timetable_entries
+            (class_id, day_idx, period_idx, subject_id, teacher_id, is_break)
+        SELECT e.class_id, d.day_idx, p.period_idx, e.subject_id, e.teacher_id, e.is_break
+        FROM timetable_entries_text e
+        JOIN calendar_days d ON d.name = e.day
+        JOIN calendar_periods p ON p.label = e.time_slot
+        ''')
+        cursor.execute('DROP TABLE timetable_entries_text')
+    
+    # Signatures of the solver input the stored timetable was generated
+    # from, used to work out what changed for incremental regeneration
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS generation_snapshot (
+        kind TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        signature TEXT NOT NULL,
+        PRIMARY KEY (kind, entity_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Timetable history. Each version stores only the cells that differ from
+    # its parent; a keyframe stores every cell, so rebuilding a version reads
+    # back to the nearest keyframe at most.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS timetable_versions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parent_id INTEGER,
+        source TEXT NOT NULL,
+        keyframe BOOLEAN NOT NULL,
+        depth INTEGER NOT NULL,
+        cells INTEGER NOT NULL,
+        changed INTEGER NOT NULL,
+        stored INTEGER NOT NULL,
+        calendar TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS timetable_version_cells (
+        version_id INTEGER NOT NULL,
+        class_id INTEGER NOT NULL,
+        day_idx INTEGER NOT NULL,
+        period_idx INTEGER NOT NULL,
+        subject_id INTEGER,
+        teacher_id INTEGER,
+        is_break BOOLEAN NOT NULL DEFAULT 0,
+        removed BOOLEAN NOT NULL DEFAULT 0,
+        PRIMARY KEY (version_id, class_id, day_idx, period_idx)
+    ) WITHOUT ROWID
+    ''')
+    
+    # The version the stored timetable currently is, if it is one
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS timetable_version_head (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        version_id INTEGER NOT NULL
+    )
+    ''')
+    
+    # Data version behind response caching and the edit index. The epoch is
+    # random per database file, so versions of a recreated file never match.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        epoch TEXT NOT NULL,
+        version INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO data_version (id, epoch, version) VALUES (0, lower(hex(randomblob(4))), 0)")
+    
+    # Indexes behind the list endpoint filters: name prefix search, teachers
+    # by year and teachers by subject
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_subjects_name_nocase ON subjects (name COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_teachers_name_nocase ON teachers (name COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_teacher_year_year ON teacher_year (year, teacher_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_teacher_subject_subject ON teacher_subject (subject_id, teacher_id)')
+    
+    # Covering indexes behind the per-teacher and per-day timetable views:
+    # every column those reads need is in the index, in the order they
+    # return rows. Breaks have no teacher and stay out of the teacher index.
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_entries_teacher
+    ON timetable_entries (teacher_id, day_idx, period_idx, class_id, subject_id, is_break)
+    WHERE teacher_id IS NOT NULL
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_entries_day
+    ON timetable_entries (day_idx, class_id, period_idx, subject_id, teacher_id, is_break)
+    ''')
+    
+    conn.commit()
+
+
+# Count a change to the data. Called inside the write's own transaction, so
+# the version moves in the same commit as the data, for every connection
+# and process using the database.
+def bump_data_version(conn):
+    conn.execute('UPDATE data_version SET version = version + 1 WHERE id = 0')
+
+
+# (epoch, version) of the committed data
+def read_data_version(conn):
+    row = conn.execute('SELECT epoch, version FROM data_version WHERE id = 0').fetchone()
+    return row[0], row[1]
+
+
+# Number of statements, total time and slowest statement for one request
+class SqlRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_sql = None
+        self.slowest_seconds = 0.0
+
+    def add(self, sql, seconds, statement_seconds, new_statement):
+        if new_statement:
+            self.count += 1
+        self.seconds += seconds
+        if statement_seconds > self.slowest_seconds:
+            self.slowest_seconds = statement_seconds
+            self.slowest_sql = sql
+
+
+# Cursor that reports execute and fetch time to an SqlRecorder. Fetch time is
+# added to the statement that produced the rows, since SQLite only does most
+# of the work for a SELECT while rows are being stepped through.
+class InstrumentedCursor(sqlite3.Cursor):
+    recorder = None
+    _sql = None
+    _elapsed = 0.0
+
+    def _timed(self, method, sql, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            seconds = time.perf_counter() - started
+            new_statement = sql is not None
+            if new_statement:
+                self._sql = sql
+                self._elapsed = 0.0
+            self._elapsed += seconds
+            if self.recorder is not None:
+                self.recorder.add(self._sql, seconds, self._elapsed, new_statement)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, None)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed(super().fetchmany, None)
+        return self._timed(super().fetchmany, None, size)
+
+    def fetchall(self):
+        return self._timed(super().fetchall, None)
+
+
+# Connection handed out by ConnectionPool. close() gives it back to the pool
+# instead of closing it, so existing `conn.close()` calls keep working.
+# `lease` identifies the current checkout and is None while the connection
+# sits in the pool. While an SqlRecorder is active, statements go through
+# InstrumentedCursor.
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    lease = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def cursor(self, factory=None):
+        recorder = sql_recorder.get()
+        if factory is not None or recorder is None:
+            return super().cursor(factory or sqlite3.Cursor)
+        cursor = super().cursor(InstrumentedCursor)
+        cursor.recorder = recorder
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        if sql_recorder.get() is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if sql_recorder.get() is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# Bounded pool of long-lived SQLite connections.
+#
+# Connections are opened lazily up to `size`, configured once (WAL, pragmas,
+# Row factory) and keep their page cache and prepared statement cache
+# between requests. When every connection is checked out, acquire() waits
+# up to `timeout` seconds for one to come back.
+class ConnectionPool:
+    def __init__(self, path, size=8, timeout=30.0, cached_statements=256):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            factory=PooledConnection,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers keep using the last committed timetable while a
+        # generation is being written
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA cache_size = -20000')  # ~20 MB page cache
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        with self._cond:
+            if self._idle:
+                self.hits += 1
+                conn = self._idle.pop()
+            elif self._created < self.size:
+                self.misses += 1
+                self._created += 1
+                conn = None
+            else:
+                self.waits += 1
+                if not self._cond.wait_for(lambda: self._idle, self.timeout):
+                    self.timeouts += 1
+                    raise RuntimeError('Timed out waiting for a database connection')
+                conn = self._idle.pop()
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+        conn.lease = object()
+        return conn
+
+    def release(self, conn):
+        if conn.lease is None:
+            return
+        conn.lease = None
+        # Never hand a connection with a half-finished transaction to the
+        # next user
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'idle': len(self._idle),
+                'inUse': self._created - len(self._idle),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'timeouts': self.timeouts
+            }
+
+    # Really close every idle connection
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                conn = self._idle.pop()
+                conn.pool = None
+                conn.close()
+                self._created -= 1
@@ -0,0 +1,122 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scheduler import SchedulingProblem, solve_greedy
+
+# Below this many classes a worker pool costs more than it saves
+MIN_PARALLEL_CLASSES = 400
+
+
+# Union-find over a `parent` dict mapping every node to itself initially;
+# also used by the feasibility check
+def find_set(parent, node):
+    while parent[node] != node:
+        parent[node] = parent[parent[node]]
+        node = parent[node]
+    return node
+
+
+def union_sets(parent, a, b):
+    root_a = find_set(parent, a)
+    root_b = find_set(parent, b)
+    if root_a != root_b:
+        parent[root_b] = root_a
+
+
+# Split `problem` into independent subproblems.
+#
+# A class can only be taught by teachers of its year, and every class takes
+# every subject, so two classes compete for a teacher exactly when a chain of
+# teachers links their years. Years are therefore merged with union-find
+# along each teacher's years; every resulting set of years is one component
+# with its classes and the teachers that can teach them. Teachers without a
+# known subject or year never teach and are left out.
+#
+# Classes and teachers keep their database order inside each component, so
+# the greedy makes the same choices it makes on the whole problem.
+def decompose(problem):
+    known_subjects = {subject['id'] for subject in problem.subjects}
+    parent = {class_obj['year']: class_obj['year'] for class_obj in problem.classes}
+
+    teaching = []
+    for teacher in problem.teachers:
+        years = [year for year in teacher['years'] if year in parent]
+        if not years or not any(subject_id in known_subjects for subject_id in teacher['subject_ids']):
+            continue
+        teaching.append((teacher, years))
+        for year in years[1:]:
+            union_sets(parent, years[0], year)
+
+    classes = {}
+    for class_obj in problem.classes:
+        classes.setdefault(find_set(parent, class_obj['year']), []).append(class_obj)
+    teachers = {root: [] for root in classes}
+    for teacher, years in teaching:
+        teachers[find_set(parent, years[0])].append(teacher)
+
+    return [
+        SchedulingProblem(problem.subjects, teachers[root], component_classes, problem.calendar)
+        for root, component_classes in classes.items()
+    ]
+
+
+# Run `solve` (solve_greedy by default) over each independent component, in
+# parallel over `workers` processes (default and upper bound: all cores) when
+# the problem is large enough to pay for the pool. `solve` must be a
+# module-level function returning each class's lessons together. Returns the
+# same assignments as `solve` on the whole problem, in class order, plus the
+# number of components. Run in this process, progress and on_class(class_obj,
+# lessons) are passed on to `solve` for every component, so a run can be
+# followed and cancelled class by class; with a pool they are called for a
+# whole component once a worker returns it.
+def solve_decomposed(problem, workers=None, progress=None, solve=solve_greedy, on_class=None):
+    components = decompose(problem)
+    if len(components) == 1:
+        return solve(problem, progress=progress, on_class=on_class), {'components': 1}
+
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, cores, len(components))
+    class_count = len(problem.classes)
+
+    results = {}
+    done = 0
+
+    def record(component, assignments):
+        nonlocal done
+        for class_id, lessons in itertools.groupby(assignments, key=lambda assignment: assignment[0]):
+            results[class_id] = list(lessons)
+        done += len(component.classes)
+        if progress is not None:
+            progress(done, class_count)
+
+    # Progress inside the component being solved, counted on from the
+    # classes of the components already done
+    def component_progress(component_done, component_total):
+        progress(done + component_done, class_count)
+
+    if workers <= 1 or class_count < MIN_PARALLEL_CLASSES:
+        for component in components:
+            record(component, solve(component, progress=component_progress if progress is not None else None,
+                                    on_class=on_class))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Largest components first so the pool drains evenly
+            ordered = sorted(components, key=lambda component: -len(component.classes))
+            futures = {pool.submit(solve, component): component for component in ordered}
+            try:
+                for future in as_completed(futures):
+                    component = futures[future]
+                    record(component, future.result())
+                    if on_class is not None:
+                        for class_obj in component.classes:
+                            on_class(class_obj, results.get(class_obj['id'], []))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    assignments = []
+    for class_obj in problem.classes:
+        assignments.extend(results.get(class_obj['id'], []))
+    return assignments, {'components': len(components)}
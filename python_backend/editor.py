@@ -0,0 +1,262 @@
+import threading
+
+from db import bump_data_version, read_data_version
+from persistence import ONE_CELL, read_cells
+from scheduler import load_problem
+
+UPSERT_CELL_SQL = '''
+    INSERT INTO timetable_entries (class_id, day_idx, period_idx, subject_id, teacher_id, is_break)
+    VALUES (?, ?, ?, ?, ?, 0)
+    ON CONFLICT (class_id, day_idx, period_idx)
+    DO UPDATE SET subject_id = excluded.subject_id, teacher_id = excluded.teacher_id, is_break = 0
+'''
+
+DELETE_CELL_SQL = 'DELETE FROM timetable_entries WHERE class_id = ? AND day_idx = ? AND period_idx = ?'
+
+
+# Raised for cells, classes, subjects or teachers that do not exist
+class EditNotFound(LookupError):
+    pass
+
+
+def _int_field(data, name, required=True):
+    value = data.get(name)
+    if value is None and not required:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{name} must be an integer')
+    return value
+
+
+# (class_id, day_idx, period_idx) of a {'classId', 'dayIdx', 'periodIdx'}
+# object. Raises ValueError for malformed input.
+def parse_cell(data):
+    if not isinstance(data, dict):
+        raise ValueError('A cell must be an object with classId, dayIdx and periodIdx')
+    return _int_field(data, 'classId'), _int_field(data, 'dayIdx'), _int_field(data, 'periodIdx')
+
+
+# Cell and new (subject_id, teacher_id) of a PATCH body; both ids null
+# clears the cell
+def parse_cell_edit(data):
+    cell = parse_cell(data)
+    subject_id = _int_field(data, 'subjectId', required=False)
+    teacher_id = _int_field(data, 'teacherId', required=False)
+    if (subject_id is None) != (teacher_id is None):
+        raise ValueError('subjectId and teacherId must be given together, or both null to clear the cell')
+    return cell, (subject_id, teacher_id) if subject_id is not None else None
+
+
+def cell_to_dict(cell, lesson):
+    class_id, day_idx, period_idx = cell
+    return {
+        'classId': class_id,
+        'dayIdx': day_idx,
+        'periodIdx': period_idx,
+        'subjectId': lesson[0] if lesson else None,
+        'teacherId': lesson[1] if lesson else None
+    }
+
+
+# Where every teacher and lesson is in the stored timetable, plus what the
+# edit checks need from the solver input. Every check is a dict lookup or
+# a bit test.
+class OccupancyIndex:
+    def __init__(self, conn):
+        problem = load_problem(conn)
+        self.calendar = problem.calendar
+        self.eligible = problem.eligible
+        self.hours = {subject['id']: subject['hours'] for subject in problem.subjects}
+        self.years = {class_obj['id']: class_obj['year'] for class_obj in problem.classes}
+        self.teacher_position = {teacher['id']: position for position, teacher in enumerate(problem.teachers)}
+
+        # (class_id, day_idx, period_idx) -> (subject_id, teacher_id)
+        self.lessons = {}
+        # (teacher_id, day_idx, period_idx) -> class_id
+        self.teaching = {}
+        # (class_id, subject_id) -> lessons scheduled
+        self.scheduled = {}
+        entries = conn.execute(
+            'SELECT class_id, day_idx, period_idx, subject_id, teacher_id FROM timetable_entries '
+            'WHERE is_break = 0 AND subject_id IS NOT NULL'
+        )
+        for class_id, day_idx, period_idx, subject_id, teacher_id in entries:
+            self._place((class_id, day_idx, period_idx), (subject_id, teacher_id))
+
+    def _place(self, cell, lesson):
+        class_id, day_idx, period_idx = cell
+        subject_id, teacher_id = lesson
+        self.lessons[cell] = lesson
+        if teacher_id is not None:
+            self.teaching[(teacher_id, day_idx, period_idx)] = class_id
+        key = (class_id, subject_id)
+        self.scheduled[key] = self.scheduled.get(key, 0) + 1
+
+    def _remove(self, cell):
+        lesson = self.lessons.pop(cell, None)
+        if lesson is None:
+            return
+        class_id, day_idx, period_idx = cell
+        subject_id, teacher_id = lesson
+        if self.teaching.get((teacher_id, day_idx, period_idx)) == class_id:
+            del self.teaching[(teacher_id, day_idx, period_idx)]
+        self.scheduled[(class_id, subject_id)] -= 1
+
+    # Replace the contents of cells with {cell: lesson or None}
+    def apply(self, changes):
+        for cell in changes:
+            self._remove(cell)
+        for cell, lesson in changes.items():
+            if lesson is not None:
+                self._place(cell, lesson)
+
+    # Raises EditNotFound or ValueError unless `cell` is a teaching cell of
+    # an existing class
+    def check_cell(self, cell):
+        class_id, day_idx, period_idx = cell
+        if class_id not in self.years:
+            raise EditNotFound(f'Class {class_id} not found')
+        if not 0 <= day_idx < len(self.calendar.days) or not 0 <= period_idx < len(self.calendar.periods):
+            raise EditNotFound(f'Cell ({day_idx}, {period_idx}) is outside the calendar')
+        if period_idx in self.calendar.break_types:
+            raise ValueError(f'Period {period_idx} is a {self.calendar.break_types[period_idx]} period')
+
+    # Conflicts of giving the cells in `changes` ({cell: lesson or None})
+    # their new lessons all at once
+    def conflicts(self, changes):
+        found = []
+        vacated = set(changes)
+        added = {}
+        for cell, lesson in changes.items():
+            if lesson is None:
+                continue
+            class_id, day_idx, period_idx = cell
+            subject_id, teacher_id = lesson
+            if subject_id not in self.hours:
+                raise EditNotFound(f'Subject {subject_id} not found')
+            key = (class_id, subject_id)
+            added[key] = added.get(key, 0) + 1
+            # Lessons whose teacher was deleted can still be moved around
+            if teacher_id is None:
+                continue
+            position = self.teacher_position.get(teacher_id)
+            if position is None:
+                raise EditNotFound(f'Teacher {teacher_id} not found')
+
+            owner = self.teaching.get((teacher_id, day_idx, period_idx))
+            if owner is not None and (owner, day_idx, period_idx) not in vacated:
+                found.append({
+                    'type': 'teacherClash',
+                    'teacherId': teacher_id,
+                    'classId': owner,
+                    'dayIdx': day_idx,
+                    'periodIdx': period_idx
+                })
+            year = self.years[class_id]
+            if not (self.eligible.get((subject_id, year), 0) >> position) & 1:
+                found.append({
+                    'type': 'notEligible',
+                    'teacherId': teacher_id,
+                    'subjectId': subject_id,
+                    'year': year
+                })
+
+        # Hours per class and subject after the edit
+        for cell in changes:
+            lesson = self.lessons.get(cell)
+            if lesson is not None:
+                key = (cell[0], lesson[0])
+                added[key] = added.get(key, 0) - 1
+        for (class_id, subject_id), delta in added.items():
+            scheduled = self.scheduled.get((class_id, subject_id), 0) + delta
+            if delta > 0 and scheduled > self.hours[subject_id]:
+                found.append({
+                    'type': 'hoursExceeded',
+                    'classId': class_id,
+                    'subjectId': subject_id,
+                    'scheduled': scheduled,
+                    'hours': self.hours[subject_id]
+                })
+        return found
+
+
+# Single-cell edits and swaps on the stored timetable.
+#
+# Checks run against an OccupancyIndex held in memory and tagged with the
+# data version (db.read_data_version); any other write, from this process
+# or another, moves the version and the index is rebuilt on the next edit.
+# Each edit is checked and written inside one write transaction, so nothing
+# can change the timetable between the check and the write. Accepted edits
+# write only the cells they change, update the index in place and bump the
+# version. `history` is called as for persistence.replace_timetable.
+class TimetableEditor:
+    def __init__(self, history=None):
+        self.history = history
+        self._index = None
+        self._version = None
+        self._lock = threading.RLock()
+
+    def _current_index(self, conn):
+        version = read_data_version(conn)
+        if self._index is None or self._version != version:
+            self._index = OccupancyIndex(conn)
+            self._version = version
+        return self._index
+
+    # Apply the {cell: lesson or None} that make_changes(index) returns if it
+    # conflicts with nothing. Returns the changes and the conflicts, empty
+    # when the edit was stored.
+    def _edit(self, conn, make_changes):
+        with self._lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                index = self._current_index(conn)
+                changes = make_changes(index)
+                for cell in changes:
+                    index.check_cell(cell)
+                conflicts = index.conflicts(changes)
+            except Exception:
+                conn.rollback()
+                raise
+            if conflicts:
+                conn.rollback()
+                return changes, conflicts
+
+            try:
+                if self.history is not None:
+                    before = {}
+                    for cell in changes:
+                        before.update(read_cells(conn, ONE_CELL, cell))
+                for cell, lesson in changes.items():
+                    if lesson is None:
+                        conn.execute(DELETE_CELL_SQL, cell)
+                    else:
+                        conn.execute(UPSERT_CELL_SQL, cell + lesson)
+                # The timetable no longer is what its solver input produces
+                conn.execute("DELETE FROM generation_snapshot WHERE kind = 'input'")
+                if self.history is not None:
+                    after = {cell: lesson + (0,) for cell, lesson in changes.items() if lesson is not None}
+                    self.history(conn, before, after)
+                bump_data_version(conn)
+                version = read_data_version(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                self._index = None
+                raise
+
+            index.apply(changes)
+            self._version = version
+            return changes, []
+
+    # Put `lesson` ((subject_id, teacher_id), or None to clear) in `cell`.
+    # Returns the requested changes and the conflicts, as swap() does.
+    def set_cell(self, conn, cell, lesson):
+        return self._edit(conn, lambda index: {cell: lesson})
+
+    # Exchange the lessons of two cells, e.g. to move a lesson within a
+    # class's week or to swap the teachers of two classes in one slot
+    def swap(self, conn, first, second):
+        if first == second:
+            raise ValueError('Cannot swap a cell with itself')
+        return self._edit(conn, lambda index: {first: index.lessons.get(second), second: index.lessons.get(first)})
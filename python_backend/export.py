@@ -0,0 +1,199 @@
+import csv
+import datetime
+import io
+import itertools
+import json
+import re
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'ics': 'text/calendar'
+}
+
+GROUPS = ('class', 'teacher')
+
+CSV_COLUMNS = ['classId', 'year', 'section', 'dayIdx', 'periodIdx', 'day', 'timeSlot', 'isBreak', 'breakType',
+               'subjectId', 'subject', 'teacherId', 'teacher']
+
+# Entries joined with everything an export row shows. Rows come back grouped
+# by class or teacher and are stepped through one at a time, so only one
+# group is ever held in memory.
+EXPORT_SQL = '''
+    SELECT e.class_id, c.year, c.section, e.day_idx, e.period_idx, d.name AS day, p.label AS time_slot,
+           p.break_type, e.is_break, e.subject_id, s.name AS subject_name,
+           e.teacher_id, t.name AS teacher_name
+    FROM timetable_entries e
+    JOIN classes c ON c.id = e.class_id
+    JOIN calendar_days d ON d.day_idx = e.day_idx
+    JOIN calendar_periods p ON p.period_idx = e.period_idx
+    LEFT JOIN subjects s ON s.id = e.subject_id
+    LEFT JOIN teachers t ON t.id = e.teacher_id
+'''
+
+SLOT_TIME = re.compile(r'(\d{1,2}):(\d{2})\s*([AP]M)\s*-\s*(\d{1,2}):(\d{2})\s*([AP]M)')
+
+
+def entry_to_dict(row):
+    is_break = bool(row['is_break'])
+    return {
+        'classId': row['class_id'],
+        'year': row['year'],
+        'section': row['section'],
+        'dayIdx': row['day_idx'],
+        'periodIdx': row['period_idx'],
+        'day': row['day'],
+        'timeSlot': row['time_slot'],
+        'isBreak': is_break,
+        'breakType': row['break_type'] if is_break else None,
+        'subjectId': row['subject_id'],
+        'subject': row['subject_name'],
+        'teacherId': row['teacher_id'],
+        'teacher': row['teacher_name']
+    }
+
+
+# Yield lists of export rows, one class or one teacher at a time, each in
+# day / period order. Breaks only belong to classes, so teacher exports
+# leave them out. `group_id` limits the export to one class or teacher.
+def iter_groups(conn, by='class', group_id=None):
+    if by == 'class':
+        column = 'e.class_id'
+        # The primary key order of timetable_entries, so no sort is needed
+        order = 'e.class_id, e.day_idx, e.period_idx'
+    else:
+        column = 'e.teacher_id'
+        order = 'e.teacher_id, e.day_idx, e.period_idx, e.class_id'
+    sql = EXPORT_SQL + f' WHERE {column} IS NOT NULL'
+    params = ()
+    if group_id is not None:
+        sql += f' AND {column} = ?'
+        params = (group_id,)
+    sql += f' ORDER BY {order}'
+
+    key = 'class_id' if by == 'class' else 'teacher_id'
+    for _, rows in itertools.groupby(conn.execute(sql, params), key=lambda row: row[key]):
+        yield [entry_to_dict(row) for row in rows]
+
+
+def iter_csv(groups):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, lineterminator='\n')
+    writer.writeheader()
+    for entries in groups:
+        writer.writerows(entries)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(groups):
+    for entries in groups:
+        yield ''.join(json.dumps(entry) + '\n' for entry in entries)
+
+
+# Start and end time of a slot label such as '9:00AM - 9:50AM'
+def slot_times(slot):
+    match = SLOT_TIME.match(slot)
+    if match is None:
+        return None
+
+    def to_time(hour, minute, meridiem):
+        hour = int(hour) % 12 + (12 if meridiem == 'PM' else 0)
+        return datetime.time(hour, int(minute))
+
+    return to_time(*match.group(1, 2, 3)), to_time(*match.group(4, 5, 6))
+
+
+def _ics_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+# Content lines are folded at 75 octets (RFC 5545, section 3.1)
+def _ics_line(line):
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        # Do not split a multi-byte character
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+    parts.append(data.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+# Weekday (Monday = 0) of a calendar day from its English name or an
+# abbreviation of at least three letters ('Tue', 'Thurs.'). Days named
+# otherwise ('Day 1') keep their position in the week.
+def day_weekday(name, day_idx):
+    name = name.strip().rstrip('.').lower()
+    if len(name) >= 3:
+        for weekday, full_name in enumerate(WEEKDAYS):
+            if full_name.startswith(name):
+                return weekday
+    return day_idx % 7
+
+
+# One weekly recurring event per lesson. `week_start` is the Monday of the
+# first week the timetable applies to; each lesson falls on the weekday its
+# calendar day is named after, so calendars need not start on Monday.
+def iter_ics(groups, week_start, by='class'):
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(_ics_line(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Timetable Generator//Timetable Export//EN',
+        'CALSCALE:GREGORIAN'
+    ))
+
+    for entries in groups:
+        lines = []
+        for entry in entries:
+            times = slot_times(entry['timeSlot'])
+            if entry['isBreak'] or entry['subjectId'] is None or times is None:
+                continue
+            date = week_start + datetime.timedelta(days=day_weekday(entry['day'], entry['dayIdx']))
+            start, end = times
+            class_name = f"Year {entry['year']} - {entry['section']}"
+            summary = entry['subject'] or 'Lesson'
+            summary += f" ({class_name})" if by == 'teacher' else f" ({entry['teacher'] or 'No teacher'})"
+            lines.extend((
+                'BEGIN:VEVENT',
+                f"UID:{entry['classId']}-{entry['day']}-{start.strftime('%H%M')}@timetable",
+                f'DTSTAMP:{stamp}',
+                f"DTSTART:{datetime.datetime.combine(date, start).strftime('%Y%m%dT%H%M%S')}",
+                f"DTEND:{datetime.datetime.combine(date, end).strftime('%Y%m%dT%H%M%S')}",
+                'RRULE:FREQ=WEEKLY',
+                f'SUMMARY:{_ics_text(summary)}',
+                f"DESCRIPTION:{_ics_text(class_name + ', ' + (entry['teacher'] or 'No teacher'))}",
+                'END:VEVENT'
+            ))
+        if lines:
+            yield ''.join(_ics_line(line) for line in lines)
+
+    yield _ics_line('END:VCALENDAR')
+
+
+# Stream an export as text chunks, one class or teacher per chunk
+def iter_export(conn, fmt, by='class', group_id=None, week_start=None):
+    groups = iter_groups(conn, by, group_id)
+    if fmt == 'csv':
+        return iter_csv(groups)
+    if fmt == 'ndjson':
+        return iter_ndjson(groups)
+    return iter_ics(groups, week_start, by)
+
+
+# Monday of the week containing `day`
+def week_of(day):
+    return day - datetime.timedelta(days=day.weekday())
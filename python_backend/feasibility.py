@@ -0,0 +1,226 @@
+import time
+from collections import deque
+
+from decompose import find_set, union_sets
+
+INFEASIBLE_ERROR = 'The timetable cannot fit: some hours can never be scheduled'
+
+
+# Raised by require_feasible; carries the report for the response
+class InfeasibleError(ValueError):
+    def __init__(self, report):
+        super().__init__(INFEASIBLE_ERROR)
+        self.report = report
+
+
+# Dinic's maximum flow over integer capacities
+class _FlowNetwork:
+    def __init__(self, node_count):
+        self.edges = [[] for _ in range(node_count)]
+        self.to = []
+        self.capacity = []
+
+    # Edge a -> b; its index is returned and its reverse edge is index ^ 1
+    def add_edge(self, a, b, capacity):
+        index = len(self.to)
+        self.edges[a].append(index)
+        self.to.append(b)
+        self.capacity.append(capacity)
+        self.edges[b].append(index + 1)
+        self.to.append(a)
+        self.capacity.append(0)
+        return index
+
+    def _levels(self, source):
+        level = [-1] * len(self.edges)
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for index in self.edges[node]:
+                if self.capacity[index] > 0 and level[self.to[index]] < 0:
+                    level[self.to[index]] = level[node] + 1
+                    queue.append(self.to[index])
+        return level
+
+    # Find one augmenting path in the level graph and push flow along it.
+    # cursor[node] skips edges already known to lead nowhere.
+    def _augment(self, source, sink, level, cursor):
+        capacity = self.capacity
+        path = []
+        node = source
+        while node != sink:
+            edges = self.edges[node]
+            while cursor[node] < len(edges):
+                index = edges[cursor[node]]
+                if capacity[index] > 0 and level[self.to[index]] == level[node] + 1:
+                    break
+                cursor[node] += 1
+            else:
+                # Dead end: step back and skip the edge that led here
+                if not path:
+                    return 0
+                node = self.to[path.pop() ^ 1]
+                cursor[node] += 1
+                continue
+            path.append(index)
+            node = self.to[index]
+
+        amount = min(capacity[index] for index in path)
+        for index in path:
+            capacity[index] -= amount
+            capacity[index ^ 1] += amount
+        return amount
+
+    def max_flow(self, source, sink):
+        total = 0
+        while True:
+            level = self._levels(source)
+            if level[sink] < 0:
+                return total
+            cursor = [0] * len(self.edges)
+            while True:
+                pushed = self._augment(source, sink, level, cursor)
+                if not pushed:
+                    break
+                total += pushed
+
+    # Nodes still reachable from `source` in the residual network: the
+    # source side of a minimum cut
+    def reachable(self, source):
+        return self._levels(source)
+
+
+# Bounds on how much of `problem` any solver can schedule, computed from
+# aggregates per (subject, year) instead of per class, so the cost does not
+# grow with the number of classes.
+#
+# Demand flows source -> year (classes x slots per class) -> (subject, year)
+# (classes x hours) -> eligible teacher -> sink (one lesson per slot). The
+# maximum flow is an upper bound on the lessons that fit, and the minimum
+# cut names the exact bottlenecks:
+# - classHours: a year whose classes need more hours than the week has slots
+# - noTeacher: a subject nobody may teach to some year
+# - teacherCapacity: a group of subjects and years whose eligible teachers
+#   are all fully booked, with the hours they cannot cover
+# Bottlenecks can overlap (a year may lack both slots and teachers), so
+# their lostHours need not add up; minUnscheduledHours is the combined
+# bound.
+def check_feasibility(problem):
+    started = time.perf_counter()
+    slot_count = len(problem.slots)
+    hours = {subject['id']: subject['hours'] for subject in problem.subjects if subject['hours'] > 0}
+    hours_per_class = sum(hours.values())
+
+    classes_per_year = {}
+    for class_obj in problem.classes:
+        classes_per_year[class_obj['year']] = classes_per_year.get(class_obj['year'], 0) + 1
+    years = sorted(classes_per_year)
+
+    # Nodes: 0 source, 1 sink, then years, (subject, year) pairs, teachers
+    pairs = [(subject_id, year) for year in years for subject_id in hours]
+    year_node = {year: 2 + number for number, year in enumerate(years)}
+    pair_node = {pair: 2 + len(years) + number for number, pair in enumerate(pairs)}
+    teacher_base = 2 + len(years) + len(pairs)
+    network = _FlowNetwork(teacher_base + len(problem.teachers))
+
+    year_demand = {year: hours_per_class * classes_per_year[year] for year in years}
+    for year in years:
+        network.add_edge(0, year_node[year], min(year_demand[year], slot_count * classes_per_year[year]))
+    pair_edges = {}
+    for pair in pairs:
+        subject_id, year = pair
+        demand = hours[subject_id] * classes_per_year[year]
+        pair_edges[pair] = network.add_edge(year_node[year], pair_node[pair], demand)
+        bits = problem.eligible.get(pair, 0)
+        while bits:
+            low = bits & -bits
+            # Never the limiting edge, so teachers stay on the cut's source
+            # side whenever their pair is
+            network.add_edge(pair_node[pair], teacher_base + low.bit_length() - 1, demand)
+            bits ^= low
+    for position in range(len(problem.teachers)):
+        network.add_edge(teacher_base + position, 1, slot_count)
+
+    flow = network.max_flow(0, 1)
+    source_side = network.reachable(0)
+
+    bottlenecks = []
+    for year in years:
+        capacity = slot_count * classes_per_year[year]
+        if year_demand[year] > capacity:
+            bottlenecks.append({
+                'type': 'classHours',
+                'year': year,
+                'classes': classes_per_year[year],
+                'hoursPerClass': hours_per_class,
+                'slotsPerClass': slot_count,
+                'lostHours': year_demand[year] - capacity
+            })
+
+    # Subjects nobody may teach to a year are reported on their own
+    for pair in pairs:
+        if not problem.eligible.get(pair):
+            bottlenecks.append({
+                'type': 'noTeacher',
+                'subjectId': pair[0],
+                'year': pair[1],
+                'classes': classes_per_year[pair[1]],
+                'lostHours': hours[pair[0]] * classes_per_year[pair[1]]
+            })
+
+    # On the source side of the cut, (subject, year) pairs and the teachers
+    # they can reach form groups whose teachers are all fully booked; a
+    # group that leaves demand unserved is a teacher capacity bottleneck
+    parent = {}
+    for pair in pairs:
+        bits = problem.eligible.get(pair, 0)
+        if not bits or source_side[pair_node[pair]] < 0:
+            continue
+        parent.setdefault(pair, pair)
+        while bits:
+            low = bits & -bits
+            position = low.bit_length() - 1
+            bits ^= low
+            if source_side[teacher_base + position] >= 0:
+                parent.setdefault(position, position)
+                union_sets(parent, pair, position)
+
+    groups = {}
+    for node in parent:
+        groups.setdefault(find_set(parent, node), []).append(node)
+    for members in groups.values():
+        group_pairs = [node for node in members if isinstance(node, tuple)]
+        positions = sorted(node for node in members if not isinstance(node, tuple))
+        demand = sum(hours[subject_id] * classes_per_year[year] for subject_id, year in group_pairs)
+        served = sum(network.capacity[pair_edges[pair] ^ 1] for pair in group_pairs)
+        if served >= demand:
+            continue
+        bottlenecks.append({
+            'type': 'teacherCapacity',
+            'subjectYears': [{'subjectId': subject_id, 'year': year} for subject_id, year in group_pairs],
+            'teacherIds': [problem.teachers[position]['id'] for position in positions],
+            'demandHours': demand,
+            'availableHours': slot_count * len(positions),
+            'lostHours': demand - served
+        })
+
+    demand = hours_per_class * len(problem.classes)
+    return {
+        'feasible': flow == demand,
+        'slotsPerClass': slot_count,
+        'hoursPerClass': hours_per_class,
+        'demandHours': demand,
+        'maxSchedulableHours': flow,
+        'minUnscheduledHours': demand - flow,
+        'bottlenecks': bottlenecks,
+        'elapsedMs': round((time.perf_counter() - started) * 1000, 3)
+    }
+
+
+# Check `problem` and raise InfeasibleError when not every hour can fit
+def require_feasible(problem):
+    report = check_feasibility(problem)
+    if not report['feasible']:
+        raise InfeasibleError(report)
+    return report
@@ -0,0 +1,285 @@
+import codecs
+import csv
+import json
+
+from db import bump_data_version
+
+RECORD_TYPES = {
+    'subject': 'subject', 'subjects': 'subject',
+    'teacher': 'teacher', 'teachers': 'teacher',
+    'class': 'class', 'classes': 'class'
+}
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('', '0', 'false', 'no', 'n')
+
+
+# The upload as a whole cannot be read (bad encoding, malformed NDJSON line...)
+class ImportFormatError(ValueError):
+    pass
+
+
+# A single row is invalid; reported per row and the row is skipped
+class RowError(ValueError):
+    pass
+
+
+# Decode a binary stream chunk by chunk and yield complete text lines
+def _iter_lines(stream, chunk_size=64 * 1024):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        try:
+            text = decoder.decode(chunk or b'', final=not chunk)
+        except UnicodeDecodeError as e:
+            raise ImportFormatError(f'Upload is not valid UTF-8: {e}')
+        pending += text
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+# Parse an upload incrementally. Yields (row_number, record) pairs where
+# record is a dict with a 'type' key. `default_type` is used for rows that
+# do not name their type (CSV without a type column, for example).
+def parse_records(stream, fmt, default_type=None):
+    if fmt == 'ndjson':
+        for number, line in enumerate(_iter_lines(stream), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ImportFormatError(f'Line {number} is not valid JSON: {e}')
+            if not isinstance(record, dict):
+                raise ImportFormatError(f'Line {number} must be a JSON object')
+            record.setdefault('type', default_type)
+            yield number, record
+    elif fmt == 'csv':
+        reader = csv.DictReader(_iter_lines(stream))
+        try:
+            for record in reader:
+                # Blank cells mean "not given"
+                record = {key: value for key, value in record.items()
+                          if key is not None and value not in (None, '')}
+                record.setdefault('type', default_type)
+                # Row numbers count the header as line 1
+                yield reader.line_num, record
+        except csv.Error as e:
+            raise ImportFormatError(f'Line {reader.line_num}: {e}')
+    else:
+        raise ImportFormatError(f"Unsupported import format '{fmt}', expected csv or ndjson")
+
+
+def _text(record, name, required=True):
+    value = record.get(name)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise RowError(f'{name} is required')
+        return None
+    if not isinstance(value, (str, int)):
+        raise RowError(f'{name} must be text')
+    return str(value).strip()
+
+
+def _int(record, name, default=None):
+    value = record.get(name, default)
+    if value is None:
+        raise RowError(f'{name} is required')
+    if isinstance(value, bool):
+        raise RowError(f'{name} must be an integer')
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise RowError(f'{name} must be an integer')
+
+
+def _bool(record, name, default=False):
+    value = record.get(name, default)
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RowError(f'{name} must be true or false')
+
+
+# List values are JSON arrays in NDJSON and ';' or '|' separated in CSV
+def _list(record, name):
+    value = record.get(name)
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    if isinstance(value, (str, int)):
+        return [part.strip() for part in str(value).replace('|', ';').split(';') if part.strip()]
+    raise RowError(f'{name} must be a list')
+
+
+# Names, (year, section) pairs and subject ids already stored
+def _existing(conn):
+    subject_names = {row['name'] for row in conn.execute('SELECT name FROM subjects')}
+    teacher_names = {row['name'] for row in conn.execute('SELECT name FROM teachers')}
+    class_keys = {(row['year'], row['section'])
+                  for row in conn.execute('SELECT year, section FROM classes')}
+    subject_ids = {row['id'] for row in conn.execute('SELECT id FROM subjects')}
+    return subject_names, teacher_names, class_keys, subject_ids
+
+
+# The parsed rows that are still valid against what is stored, each
+# (row_number, values); the others are reported through fail(). Subjects
+# and classes must not exist yet. Teachers must have a new name and name
+# only existing subjects or subjects of the upload; a teacher's name is
+# taken only once the row is accepted.
+def _accepted(conn, subjects, teachers, classes, fail):
+    subject_names, teacher_names, class_keys, subject_ids = _existing(conn)
+
+    new_subjects = []
+    for number, subject in subjects:
+        if subject[0] in subject_names:
+            fail(number, 'subject', f"Subject '{subject[0]}' already exists")
+        else:
+            new_subjects.append((number, subject))
+            subject_names.add(subject[0])
+
+    new_classes = []
+    for number, class_row in classes:
+        if class_row[:2] in class_keys:
+            fail(number, 'class', f'Class {class_row[0]}-{class_row[1]} already exists')
+        else:
+            new_classes.append((number, class_row))
+            class_keys.add(class_row[:2])
+
+    new_teachers = []
+    for number, teacher in teachers:
+        name, ids, names, _ = teacher
+        unknown_ids = ids - subject_ids
+        unknown_names = [subject for subject in names if subject not in subject_names]
+        if name in teacher_names:
+            fail(number, 'teacher', f"Teacher '{name}' already exists")
+        elif unknown_ids:
+            fail(number, 'teacher', f'Unknown subject ids: {sorted(unknown_ids)}')
+        elif unknown_names:
+            fail(number, 'teacher', f'Unknown subjects: {unknown_names}')
+        else:
+            new_teachers.append((number, teacher))
+            teacher_names.add(name)
+    return new_subjects, new_teachers, new_classes
+
+
+# Validate and write all records.
+#
+# The whole upload is parsed and checked before the write lock is taken,
+# so a slow upload never blocks other writers. Names and (year, section)
+# pairs are checked against in-memory sets built from one query per table
+# plus the rows already accepted from this upload, then checked again
+# inside the write transaction in case another writer got there first.
+# Teachers may name their subjects (`subjects`) or give ids (`subjectIds`);
+# names are resolved after the upload's own subjects are inserted, so a
+# teacher can reference a subject defined anywhere in the same file.
+# Invalid rows are skipped and reported; with strict=True any invalid row
+# aborts the whole import.
+def import_records(conn, records, strict=False):
+    errors = []
+    subjects = []
+    teachers = []
+    classes = []
+
+    def fail(number, record_type, message):
+        errors.append({'row': number, 'type': record_type, 'error': message})
+
+    rows = 0
+    for number, record in records:
+        rows += 1
+        record_type = RECORD_TYPES.get(str(record.get('type') or '').strip().lower())
+        try:
+            if record_type is None:
+                raise RowError("type must be one of 'subject', 'teacher' or 'class'")
+
+            if record_type == 'subject':
+                subjects.append((number, (_text(record, 'name'), _int(record, 'hours'),
+                                          _bool(record, 'requiresLab'), _int(record, 'priority', 2))))
+
+            elif record_type == 'teacher':
+                name = _text(record, 'name')
+                try:
+                    years = sorted({int(year) for year in _list(record, 'years')})
+                    ids = {int(subject_id) for subject_id in _list(record, 'subjectIds')}
+                except (TypeError, ValueError):
+                    raise RowError('years and subjectIds must be integers')
+                names = [str(subject).strip() for subject in _list(record, 'subjects')]
+                teachers.append((number, (name, ids, names, years)))
+
+            else:
+                classes.append((number, (_int(record, 'year'), _text(record, 'section'),
+                                         _int(record, 'studentsCount'))))
+        except RowError as e:
+            fail(number, record_type or record.get('type'), str(e))
+
+    # Report duplicates and unknown subjects before taking the lock
+    subjects, teachers, classes = _accepted(conn, subjects, teachers, classes, fail)
+    if strict and errors:
+        errors.sort(key=lambda error: error['row'])
+        return {'rows': rows, 'imported': {'subjects': 0, 'teachers': 0, 'classes': 0},
+                'errors': errors}
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        subjects, teachers, classes = _accepted(conn, subjects, teachers, classes, fail)
+        errors.sort(key=lambda error: error['row'])
+        if strict and errors:
+            conn.rollback()
+            return {'rows': rows, 'imported': {'subjects': 0, 'teachers': 0, 'classes': 0},
+                    'errors': errors}
+
+        conn.executemany(
+            'INSERT INTO subjects (name, hours, requires_lab, priority) VALUES (?, ?, ?, ?)',
+            [subject for _, subject in subjects]
+        )
+        conn.executemany(
+            'INSERT INTO classes (year, section, students_count) VALUES (?, ?, ?)',
+            [class_row for _, class_row in classes]
+        )
+        conn.executemany('INSERT INTO teachers (name) VALUES (?)',
+                         [(teacher[0],) for _, teacher in teachers])
+
+        # Resolve ids in bulk now that everything from the upload is inserted
+        ids_by_subject = {row['name']: row['id'] for row in conn.execute('SELECT id, name FROM subjects')}
+        ids_by_teacher = {row['name']: row['id'] for row in conn.execute('SELECT id, name FROM teachers')}
+
+        teacher_subject_rows = []
+        teacher_year_rows = []
+        for _, (name, ids, names, years) in teachers:
+            teacher_id = ids_by_teacher[name]
+            linked = ids | {ids_by_subject[subject] for subject in names}
+            teacher_subject_rows.extend((teacher_id, subject_id) for subject_id in sorted(linked))
+            teacher_year_rows.extend((teacher_id, year) for year in years)
+
+        conn.executemany('INSERT INTO teacher_subject (teacher_id, subject_id) VALUES (?, ?)',
+                         teacher_subject_rows)
+        conn.executemany('INSERT INTO teacher_year (teacher_id, year) VALUES (?, ?)',
+                         teacher_year_rows)
+        if subjects or teachers or classes:
+            bump_data_version(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        'rows': rows,
+        'imported': {
+            'subjects': len(subjects),
+            'teachers': len(teachers),
+            'classes': len(classes)
+        },
+        'errors': errors
+    }
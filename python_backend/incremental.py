@@ -0,0 +1,219 @@
+from bell_schedule import calendar_signature
+from persistence import break_rows, lesson_rows, update_timetable
+from scheduler import fill_class, score_assignments
+
+
+# Signatures of everything the solver reads, as generation_snapshot rows.
+# Only solver input is covered: renaming a teacher or toggling requiresLab
+# does not make a class dirty. `input_key` records the solver cache key of a
+# full generation; incremental results depend on history and have none.
+def snapshot_rows(problem, input_key=None):
+    rows = [('calendar', 0, calendar_signature(problem.calendar))]
+    rows.extend(
+        ('subject', subject['id'], f"{subject['hours']}:{subject['priority']}")
+        for subject in problem.subjects
+    )
+    rows.extend(
+        ('teacher', teacher['id'],
+         f"{sorted(set(teacher['subject_ids']))}|{sorted(set(teacher['years']))}")
+        for teacher in problem.teachers
+    )
+    rows.extend(('class', class_obj['id'], str(class_obj['year'])) for class_obj in problem.classes)
+    if input_key is not None:
+        rows.append(('input', 0, input_key))
+    return rows
+
+
+# Solver cache key of the stored timetable, if it came from a full generation
+def stored_input_key(conn):
+    row = conn.execute("SELECT signature FROM generation_snapshot WHERE kind = 'input'").fetchone()
+    return row['signature'] if row is not None else None
+
+
+def load_snapshot(conn):
+    snapshot = {}
+    for kind, entity_id, signature in conn.execute(
+            'SELECT kind, entity_id, signature FROM generation_snapshot').fetchall():
+        snapshot.setdefault(kind, {})[entity_id] = signature
+    return snapshot
+
+
+# Whether the stored timetable can still be the one the snapshot describes.
+# Edits never touch break cells, so every class of the snapshot keeps all
+# of them until something wipes or replaces the table without the snapshot.
+def _breaks_stored(conn, problem, snapshot):
+    calendar = problem.calendar
+    expected = len(calendar.days) * len(calendar.break_types)
+    stored = dict(conn.execute(
+        'SELECT class_id, COUNT(*) FROM timetable_entries WHERE is_break GROUP BY class_id'
+    ).fetchall())
+    if any(stored.get(class_id, 0) != expected for class_id in snapshot.get('class', {})):
+        return False
+    if expected or not snapshot.get('class'):
+        return True
+    # A calendar without breaks only shows a wiped table
+    return conn.execute('SELECT 1 FROM timetable_entries LIMIT 1').fetchone() is not None
+
+
+def _diff(old, new):
+    return {entity_id for entity_id in set(old) | set(new) if old.get(entity_id) != new.get(entity_id)}
+
+
+# Re-solve only what changed since the last generation.
+#
+# The current solver input is compared with the snapshot stored by the last
+# generation. Then:
+# - every cell of an added, removed or re-yeared class is freed
+# - cells whose subject is gone, whose teacher is gone, or whose teacher may
+#   no longer teach that subject to that year are freed
+# - when a subject loses hours, a class's last lessons of it are freed
+# - classes with freed cells, and classes that might use new capacity (a
+#   subject gained hours, or a teacher became eligible for a subject and
+#   year the class still misses hours of), are filled greedily. Teachers
+#   stay busy wherever a kept cell needs them.
+#
+# Priority changes alone never move accepted lessons. Returns the stats of
+# the run, or None when there is no usable snapshot (never generated, the
+# calendar changed, or the stored cells no longer match it) and a full
+# generation is needed instead. `history` is passed on to update_timetable.
+def regenerate(conn, problem, progress=None, history=None):
+    snapshot = load_snapshot(conn)
+    current_rows = snapshot_rows(problem)
+    current = {}
+    for kind, entity_id, signature in current_rows:
+        current.setdefault(kind, {})[entity_id] = signature
+    if not snapshot or snapshot.get('calendar') != current['calendar']:
+        return None
+    if not _breaks_stored(conn, problem, snapshot):
+        return None
+
+    subject_changes = _diff(snapshot.get('subject', {}), current.get('subject', {}))
+    teacher_changes = _diff(snapshot.get('teacher', {}), current.get('teacher', {}))
+    class_changes = _diff(snapshot.get('class', {}), current.get('class', {}))
+
+    slot_index = {slot: index for index, slot in enumerate(problem.slots)}
+    subject_order = {subject['id']: order for order, subject in enumerate(problem.subjects)}
+    teacher_position = {teacher['id']: position for position, teacher in enumerate(problem.teachers)}
+    classes_by_id = {class_obj['id']: class_obj for class_obj in problem.classes}
+    eligible = problem.eligible
+
+    # Lessons of untouched classes that are still valid are kept; all other
+    # stored lessons are freed
+    kept = {}
+    freed_cells = []
+    entries = conn.execute(
+        'SELECT class_id, day_idx, period_idx, subject_id, teacher_id FROM timetable_entries '
+        'WHERE is_break = 0 ORDER BY class_id, day_idx, period_idx'
+    )
+    for class_id, day_idx, period_idx, subject_id, teacher_id in entries:
+        if class_id in class_changes:
+            continue
+        index = slot_index.get((day_idx, period_idx))
+        # Only cells touching a changed teacher or subject can have become
+        # invalid; the calendar is unchanged
+        if teacher_id in teacher_changes or subject_id in subject_changes or class_id not in classes_by_id:
+            class_obj = classes_by_id.get(class_id)
+            position = teacher_position.get(teacher_id)
+            if (class_obj is None or index is None or position is None
+                    or subject_id not in subject_order
+                    or not (eligible.get((subject_id, class_obj['year']), 0) >> position) & 1):
+                freed_cells.append((class_id, day_idx, period_idx))
+                continue
+        lessons = kept.get(class_id)
+        if lessons is None:
+            lessons = kept[class_id] = []
+        lessons.append((index, subject_id, teacher_id))
+
+    # Lessons beyond a subject's (possibly reduced) hours are freed, latest first
+    hours = {subject['id']: max(subject['hours'], 0) for subject in problem.subjects}
+    dirty = set(class_id for class_id in class_changes if class_id in classes_by_id)
+    dirty.update(class_id for class_id, _, _ in freed_cells if class_id in classes_by_id)
+    if subject_changes:
+        for class_id, lessons in kept.items():
+            placed = {}
+            keep = []
+            for lesson in lessons:
+                count = placed.get(lesson[1], 0)
+                if count < hours[lesson[1]]:
+                    placed[lesson[1]] = count + 1
+                    keep.append(lesson)
+                else:
+                    freed_cells.append((class_id,) + problem.slots[lesson[0]])
+            if len(keep) != len(lessons):
+                kept[class_id] = keep
+                dirty.add(class_id)
+
+    # Classes that could gain lessons from new capacity: (subject, year)
+    # pairs that got more hours or a newly eligible teacher
+    grown = set()
+    for subject_id in subject_changes:
+        if subject_id in subject_order:
+            grown.update((subject_id, class_obj['year']) for class_obj in problem.classes)
+    for teacher in problem.teachers:
+        if teacher['id'] in teacher_changes:
+            grown.update(
+                (subject_id, year)
+                for subject_id in teacher['subject_ids'] if subject_id in subject_order
+                for year in teacher['years']
+            )
+    if grown:
+        for class_obj in problem.classes:
+            class_id = class_obj['id']
+            if class_id in dirty:
+                continue
+            placed = {}
+            for _, subject_id, _ in kept.get(class_id, ()):
+                placed[subject_id] = placed.get(subject_id, 0) + 1
+            if any((subject_id, class_obj['year']) in grown and placed.get(subject_id, 0) < hours[subject_id]
+                   for subject_id in subject_order):
+                dirty.add(class_id)
+
+    # Teachers stay busy wherever a kept lesson needs them
+    busy = [0] * len(problem.slots)
+    for lessons in kept.values():
+        for index, _, teacher_id in lessons:
+            busy[index] |= 1 << teacher_position[teacher_id]
+
+    teacher_ids = [teacher['id'] for teacher in problem.teachers]
+    dirty_classes = [class_obj for class_obj in problem.classes if class_obj['id'] in dirty]
+    added = []
+    for number, class_obj in enumerate(dirty_classes, 1):
+        lessons = kept.get(class_obj['id'], [])
+        remaining = [max(subject['hours'], 0) for subject in problem.subjects]
+        taken = set()
+        for index, subject_id, _ in lessons:
+            remaining[subject_order[subject_id]] -= 1
+            taken.add(index)
+        free_slots = [index for index in range(len(problem.slots)) if index not in taken]
+        added.extend(fill_class(problem, class_obj, free_slots, remaining, busy, teacher_ids))
+        if progress is not None:
+            progress(number, len(dirty_classes))
+
+    # Rebuilt classes get all their rows again; other classes only change
+    # in the freed cells
+    rebuilt = class_changes
+    new_classes = [class_obj for class_obj in problem.classes if class_obj['id'] in rebuilt]
+    rows = break_rows(problem, new_classes) + lesson_rows(problem, added)
+    cells = [cell for cell in freed_cells if cell[0] not in rebuilt]
+    if rebuilt or cells or rows or subject_changes or teacher_changes:
+        update_timetable(conn, sorted(rebuilt), cells, rows, current_rows, history=history)
+
+    assignments = [
+        (class_id, index, subject_id, teacher_id)
+        for class_id, lessons in kept.items()
+        for index, subject_id, teacher_id in lessons
+    ] + added
+    unscheduled, double_load = score_assignments(problem, assignments)
+    return {
+        'solver': 'incremental',
+        'changes': {
+            'subjects': len(subject_changes),
+            'teachers': len(teacher_changes),
+            'classes': len(class_changes)
+        },
+        'classesResolved': len(dirty_classes),
+        'cellsFreed': len(cells),
+        'lessonsAdded': len(added),
+        'unscheduledHours': unscheduled,
+        'teacherDoubleLoad': double_load
+    }
@@ -0,0 +1,209 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+# Raised inside a job's progress callback once cancellation was requested
+class JobCancelled(Exception):
+    pass
+
+
+# Raised by JobManager.submit when the active job of a resource runs with
+# other options than the ones submitted
+class JobConflict(Exception):
+    def __init__(self, job):
+        super().__init__('Another timetable generation with different options is in progress')
+        self.job = job
+
+
+# One background timetable generation
+class Job:
+    def __init__(self, resource, options=None):
+        self.id = uuid.uuid4().hex
+        self.resource = resource
+        self.options = options
+        self.status = QUEUED
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        # Events for /jobs/<id>/events as (name, data); the first _dropped
+        # were discarded, and no more follow once _closed
+        self._events = []
+        self._dropped = 0
+        self._closed = False
+        self._events_changed = threading.Condition()
+        self._published_percent = None
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATES
+
+    def cancel(self):
+        self._cancel.set()
+
+    # Block until the job has finished; returns False on timeout
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    # Progress callback handed to the solver: records classes scheduled so
+    # far, publishes a progress event per whole percent and stops the run if
+    # someone asked to cancel it
+    def progress(self, done, total):
+        self.done = done
+        self.total = total
+        percent = 100 * done // total if total else 0
+        if percent != self._published_percent:
+            self._published_percent = percent
+            self.publish('progress', {'classesScheduled': done, 'classesTotal': total, 'percent': percent})
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    # Append an event for subscribers; `last` closes the stream
+    def publish(self, name, data, last=False):
+        with self._events_changed:
+            if self._closed:
+                return
+            self._events.append((name, data))
+            self._closed = last
+            self._events_changed.notify_all()
+
+    # Events from number `start` on as (number, name, data), waiting up to
+    # `timeout` seconds while there are none yet. Returns them and whether
+    # the stream is closed, in which case they run up to the last event.
+    # Discarded events are skipped.
+    def events(self, start, timeout=None):
+        with self._events_changed:
+            if start >= self._dropped + len(self._events) and not self._closed:
+                self._events_changed.wait(timeout)
+            first = max(start, self._dropped)
+            events = [(number, name, data)
+                      for number, (name, data) in enumerate(self._events[first - self._dropped:], first)]
+            return events, self._closed
+
+    # Free the events of a finished job except the final one
+    def discard_events(self):
+        with self._events_changed:
+            if self._closed and len(self._events) > 1:
+                self._dropped += len(self._events) - 1
+                self._events = self._events[-1:]
+
+    def to_dict(self):
+        if self.started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'classesScheduled': self.done,
+            'classesTotal': self.total,
+            'percent': round(100.0 * self.done / self.total, 1) if self.total else 0.0,
+            'elapsedMs': int(elapsed * 1000),
+            'error': self.error,
+            'result': self.result,
+            'options': self.options
+        }
+
+
+# Runs write jobs on a thread pool, allowing only one active job per
+# resource (database). Submitting while a job for the same resource is
+# queued or running returns that job instead of starting another when both
+# have equal options, and raises JobConflict otherwise.
+class JobManager:
+    def __init__(self, max_workers=2, max_finished=50):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='timetable-job')
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+        self.max_finished = max_finished
+
+    # Returns (job, created); `work` is called as work(job) on the pool
+    def submit(self, resource, work, options=None):
+        with self._lock:
+            running = self._active.get(resource)
+            if running is not None and running.active:
+                if running.options != options:
+                    raise JobConflict(running)
+                return running, False
+
+            # Only the latest job of a resource keeps its full event log
+            for other in self._jobs.values():
+                if other.resource == resource:
+                    other.discard_events()
+            job = Job(resource, options)
+            self._jobs[job.id] = job
+            self._active[resource] = job
+            self._prune()
+
+        self._executor.submit(self._run, job, work)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    # The queued or running job of `resource`, or None
+    def active_job(self, resource):
+        with self._lock:
+            job = self._active.get(resource)
+            return job if job is not None and job.active else None
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job.cancel()
+            with self._lock:
+                if job.status == QUEUED:
+                    self._finish(job, CANCELLED)
+        return job
+
+    def _run(self, job, work):
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+
+        try:
+            work(job)
+        except JobCancelled:
+            status, error = CANCELLED, None
+        except Exception as exc:
+            status, error = FAILED, str(exc)
+        else:
+            status, error = COMPLETED, None
+
+        with self._lock:
+            job.error = error
+            self._finish(job, status)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        if self._active.get(job.resource) is job:
+            del self._active[job.resource]
+        job.publish('end', job.to_dict(), last=True)
+        job._finished.set()
+
+    # Forget the oldest finished jobs once more than max_finished are kept
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
@@ -0,0 +1,303 @@
+import math
+import random
+import time
+
+# One unscheduled hour costs as much as this many back-to-back lessons
+UNSCHEDULED_WEIGHT = 100
+
+# Starting temperature of the annealing schedule, in double-load units
+START_TEMPERATURE = 2.0
+
+EMPTY = -1
+
+
+# Items with O(1) add, remove and uniform sampling: a list of the items and
+# each item's position in it. Removal moves the last item into the gap.
+class SampleSet:
+    def __init__(self, items=()):
+        self.items = list(items)
+        self._index = {item: index for index, item in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        self._index[item] = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item):
+        index = self._index.pop(item)
+        last = self.items.pop()
+        if last != item:
+            self.items[index] = last
+            self._index[last] = index
+
+    def choice(self, rng):
+        return self.items[rng.randrange(len(self.items))]
+
+
+# Mutable timetable used by the improvement phase. Every move updates the
+# objective incrementally: only the cells it touches and their neighbouring
+# slots are looked at, so evaluating a move is O(1) in the timetable size.
+class TimetableState:
+    def __init__(self, problem, assignments):
+        self.problem = problem
+        slot_count = len(problem.slots)
+        teacher_count = len(problem.teachers)
+        self.slot_count = slot_count
+
+        self.subject_order = {subject['id']: order for order, subject in enumerate(problem.subjects)}
+        self.teacher_position = {teacher['id']: position for position, teacher in enumerate(problem.teachers)}
+        class_position = {class_obj['id']: position for position, class_obj in enumerate(problem.classes)}
+
+        # Eligible teacher positions per (subject order, year)
+        self.eligible = {}
+        for (subject_id, year), bits in problem.eligible.items():
+            positions = []
+            while bits:
+                low = bits & -bits
+                positions.append(low.bit_length() - 1)
+                bits ^= low
+            self.eligible[(self.subject_order[subject_id], year)] = positions
+
+        # Teaching slots that directly follow the previous one on the same day,
+        # padded so slot_index + 1 can always be looked up
+        self.follows_previous = problem.follows_previous + [False]
+
+        class_count = len(problem.classes)
+        self.years = [class_obj['year'] for class_obj in problem.classes]
+        self.cell_subject = [[EMPTY] * slot_count for _ in range(class_count)]
+        self.cell_teacher = [[EMPTY] * slot_count for _ in range(class_count)]
+        self.teaching = bytearray(teacher_count * slot_count)
+        self.remaining = [
+            [max(subject['hours'], 0) for subject in problem.subjects]
+            for _ in range(class_count)
+        ]
+
+        self.unscheduled = sum(sum(hours) for hours in self.remaining)
+        self.double_load = 0
+
+        # Classes that still have unscheduled hours and, per class, the
+        # subjects with hours left and the empty cells, kept up to date by
+        # place() and clear() so moves can sample them directly
+        self.class_remaining = [sum(hours) for hours in self.remaining]
+        self.open_classes = SampleSet(
+            class_pos for class_pos, hours in enumerate(self.class_remaining) if hours > 0)
+        self.wanted = [
+            SampleSet(subject for subject, hours in enumerate(remaining) if hours > 0)
+            for remaining in self.remaining
+        ]
+        self.empty = [SampleSet(range(slot_count)) for _ in range(class_count)]
+
+        for class_id, slot_index, subject_id, teacher_id in assignments:
+            self.place(class_position[class_id], slot_index,
+                       self.subject_order[subject_id], self.teacher_position[teacher_id])
+
+    @property
+    def objective(self):
+        return UNSCHEDULED_WEIGHT * self.unscheduled + self.double_load
+
+    def score(self):
+        return {
+            'unscheduledHours': self.unscheduled,
+            'teacherDoubleLoad': self.double_load,
+            'objective': self.objective
+        }
+
+    def is_free(self, teacher, slot_index):
+        return not self.teaching[teacher * self.slot_count + slot_index]
+
+    # Lessons `teacher` gives right before and right after `slot_index`
+    def _neighbours(self, teacher, slot_index):
+        base = teacher * self.slot_count
+        count = 0
+        if self.follows_previous[slot_index] and self.teaching[base + slot_index - 1]:
+            count += 1
+        if self.follows_previous[slot_index + 1] and self.teaching[base + slot_index + 1]:
+            count += 1
+        return count
+
+    def place(self, class_pos, slot_index, subject, teacher):
+        self.cell_subject[class_pos][slot_index] = subject
+        self.cell_teacher[class_pos][slot_index] = teacher
+        self.teaching[teacher * self.slot_count + slot_index] = 1
+        self.double_load += self._neighbours(teacher, slot_index)
+        self.empty[class_pos].remove(slot_index)
+        self.remaining[class_pos][subject] -= 1
+        if not self.remaining[class_pos][subject]:
+            self.wanted[class_pos].remove(subject)
+        self.unscheduled -= 1
+        self.class_remaining[class_pos] -= 1
+        if not self.class_remaining[class_pos]:
+            self.open_classes.remove(class_pos)
+
+    def clear(self, class_pos, slot_index):
+        subject = self.cell_subject[class_pos][slot_index]
+        teacher = self.cell_teacher[class_pos][slot_index]
+        self.cell_subject[class_pos][slot_index] = EMPTY
+        self.cell_teacher[class_pos][slot_index] = EMPTY
+        self.teaching[teacher * self.slot_count + slot_index] = 0
+        self.double_load -= self._neighbours(teacher, slot_index)
+        self.empty[class_pos].add(slot_index)
+        self.remaining[class_pos][subject] += 1
+        if self.remaining[class_pos][subject] == 1:
+            self.wanted[class_pos].add(subject)
+        self.unscheduled += 1
+        self.class_remaining[class_pos] += 1
+        if self.class_remaining[class_pos] == 1:
+            self.open_classes.add(class_pos)
+        return subject, teacher
+
+    # A free eligible teacher for `subject` in this class at `slot_index`
+    def free_teacher(self, class_pos, subject, slot_index, rng):
+        candidates = self.eligible.get((subject, self.years[class_pos]))
+        if not candidates:
+            return EMPTY
+        offset = rng.randrange(len(candidates))
+        for i in range(len(candidates)):
+            teacher = candidates[(offset + i) % len(candidates)]
+            if self.is_free(teacher, slot_index):
+                return teacher
+        return EMPTY
+
+    def assignments(self):
+        class_ids = [class_obj['id'] for class_obj in self.problem.classes]
+        subject_ids = [subject['id'] for subject in self.problem.subjects]
+        teacher_ids = [teacher['id'] for teacher in self.problem.teachers]
+        result = []
+        for class_pos, subjects in enumerate(self.cell_subject):
+            teachers = self.cell_teacher[class_pos]
+            for slot_index, subject in enumerate(subjects):
+                if subject != EMPTY:
+                    result.append((class_ids[class_pos], slot_index,
+                                   subject_ids[subject], teacher_ids[teachers[slot_index]]))
+        return result
+
+
+# Simulated annealing over the solved timetable. Moves:
+#   fill     - put a subject with remaining hours into an empty cell, or
+#              first move a lesson out of the way within the same class
+#   swap     - exchange two cells of one class
+#   reassign - give a lesson to another free eligible teacher
+# Stops when the time budget is spent or no hours remain unscheduled.
+# Returns the improved assignments and a stats dict.
+def improve(problem, assignments, time_budget_ms, seed=0):
+    started = time.perf_counter()
+    deadline = started + time_budget_ms / 1000.0
+    rng = random.Random(seed)
+
+    state = TimetableState(problem, assignments)
+    before = state.score()
+    class_count = len(problem.classes)
+    slot_count = state.slot_count
+
+    iterations = 0
+    temperature = START_TEMPERATURE
+    while class_count and slot_count and state.unscheduled > 0:
+        iterations += 1
+        if not iterations & 255:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            temperature = START_TEMPERATURE * (deadline - now) / (deadline - started) + 1e-3
+
+        move = rng.random()
+        if move < 0.4:
+            _fill(state, rng)
+        elif move < 0.75:
+            _swap(state, rng, temperature)
+        else:
+            _reassign(state, rng, temperature)
+
+    after = state.score()
+    return state.assignments(), {
+        'before': before,
+        'after': after,
+        'iterations': iterations,
+        'elapsedMs': int((time.perf_counter() - started) * 1000)
+    }
+
+
+def _accept(delta, temperature, rng):
+    return delta <= 0 or rng.random() < math.exp(-delta / temperature)
+
+
+def _fill(state, rng):
+    class_pos = state.open_classes.choice(rng)
+    wanted = state.wanted[class_pos]
+    empty = state.empty[class_pos]
+    if not wanted or not empty:
+        return
+    subject = wanted.choice(rng)
+    slot_index = empty.choice(rng)
+    cells = state.cell_subject[class_pos]
+
+    teacher = state.free_teacher(class_pos, subject, slot_index, rng)
+    if teacher != EMPTY:
+        state.place(class_pos, slot_index, subject, teacher)
+        return
+
+    # Move another lesson of this class into the empty cell if its teacher is
+    # free then, and teach the wanted subject in the cell it leaves behind
+    other = rng.randrange(state.slot_count)
+    if cells[other] == EMPTY:
+        return
+    moved_teacher = state.cell_teacher[class_pos][other]
+    if not state.is_free(moved_teacher, slot_index):
+        return
+    moved_subject, _ = state.clear(class_pos, other)
+    teacher = state.free_teacher(class_pos, subject, other, rng)
+    if teacher == EMPTY:
+        state.place(class_pos, other, moved_subject, moved_teacher)
+        return
+    state.place(class_pos, slot_index, moved_subject, moved_teacher)
+    state.place(class_pos, other, subject, teacher)
+
+
+def _swap(state, rng, temperature):
+    class_pos = rng.randrange(len(state.remaining))
+    first = rng.randrange(state.slot_count)
+    second = rng.randrange(state.slot_count)
+    cells = state.cell_subject[class_pos]
+    if first == second or (cells[first] == EMPTY and cells[second] == EMPTY):
+        return
+
+    teachers = state.cell_teacher[class_pos]
+    first_teacher, second_teacher = teachers[first], teachers[second]
+    if first_teacher != EMPTY and first_teacher != second_teacher and not state.is_free(first_teacher, second):
+        return
+    if second_teacher != EMPTY and second_teacher != first_teacher and not state.is_free(second_teacher, first):
+        return
+
+    before = state.objective
+    _exchange(state, class_pos, first, second)
+    if not _accept(state.objective - before, temperature, rng):
+        _exchange(state, class_pos, first, second)
+
+
+def _exchange(state, class_pos, first, second):
+    first_lesson = state.clear(class_pos, first) if state.cell_subject[class_pos][first] != EMPTY else None
+    second_lesson = state.clear(class_pos, second) if state.cell_subject[class_pos][second] != EMPTY else None
+    if first_lesson is not None:
+        state.place(class_pos, second, *first_lesson)
+    if second_lesson is not None:
+        state.place(class_pos, first, *second_lesson)
+
+
+def _reassign(state, rng, temperature):
+    class_pos = rng.randrange(len(state.remaining))
+    slot_index = rng.randrange(state.slot_count)
+    subject = state.cell_subject[class_pos][slot_index]
+    if subject == EMPTY:
+        return
+
+    teacher = state.free_teacher(class_pos, subject, slot_index, rng)
+    if teacher == EMPTY:
+        return
+
+    before = state.objective
+    _, previous_teacher = state.clear(class_pos, slot_index)
+    state.place(class_pos, slot_index, subject, teacher)
+    if not _accept(state.objective - before, temperature, rng):
+        state.clear(class_pos, slot_index)
+        state.place(class_pos, slot_index, subject, previous_teacher)
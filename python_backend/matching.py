@@ -0,0 +1,163 @@
+from collections import deque
+
+
+# Slot-by-slot scheduler behind the 'cardinality-matching' solver: every
+# teaching slot is filled for all classes at once as a bipartite matching
+# between classes and free teachers, so early classes can no longer take
+# every shared teacher from later ones.
+#
+# For each slot, classes are seeded greedily, furthest behind first (most
+# remaining hours), each with its highest-priority subject (most remaining
+# hours first on ties) that still has a free eligible teacher. Hopcroft-Karp
+# then grows the seed into a maximum-cardinality matching: augmenting paths
+# only move matched classes to other teachers, never unmatch them. Finally
+# each class teaches the best subject its matched teacher may teach it.
+# The matching is cardinality-first: lessons placed come first and subject
+# priority only second, so a slot may go to a lower-priority subject when
+# that lets one more class have a lesson. An exact maximum-weight matching
+# per slot would cost far more at this scale.
+#
+# Returns the same (class_id, slot_index, subject_id, teacher_id) tuples as
+# solve_greedy, ordered by class and slot. If given, progress(done, total)
+# is called after each slot in class units; it may raise to abort the run.
+# on_class(class_obj, lessons) is called for every class at the end, since
+# no class is final before the last slot.
+def solve_matching(problem, progress=None, on_class=None):
+    subjects = problem.subjects
+    eligible = problem.eligible
+    teacher_ids = [teacher['id'] for teacher in problem.teachers]
+    classes = problem.classes
+    slot_count = len(problem.slots)
+    class_count = len(classes)
+
+    # remaining[i][order]: hours of subjects[order] class i still needs
+    remaining = [[max(subject['hours'], 0) for subject in subjects] for _ in classes]
+    # Eligible teacher bitset per class and subject
+    masks = [
+        [eligible.get((subject['id'], class_obj['year']), 0) for subject in subjects]
+        for class_obj in classes
+    ]
+    lessons = [[] for _ in classes]
+
+    for slot_index in range(slot_count):
+        # Subjects still open per class, best first
+        ranked = []
+        candidates = []
+        for i in range(class_count):
+            hours = remaining[i]
+            open_orders = [order for order in range(len(subjects)) if hours[order] > 0 and masks[i][order]]
+            open_orders.sort(key=lambda order: (subjects[order]['priority'], -hours[order], order))
+            ranked.append(open_orders)
+            bits = 0
+            for order in open_orders:
+                bits |= masks[i][order]
+            candidates.append(bits)
+
+        # Greedy seed, classes furthest behind first
+        match_class = [-1] * class_count
+        match_teacher = {}
+        busy = 0
+        behind = sorted((i for i in range(class_count) if candidates[i]),
+                        key=lambda i: (-sum(remaining[i]), i))
+        for i in behind:
+            for order in ranked[i]:
+                free = masks[i][order] & ~busy
+                if free:
+                    position = (free & -free).bit_length() - 1
+                    busy |= 1 << position
+                    match_class[i] = position
+                    match_teacher[position] = i
+                    break
+
+        _augment_matching(behind, candidates, match_class, match_teacher)
+
+        for i in range(class_count):
+            position = match_class[i]
+            if position < 0:
+                continue
+            for order in ranked[i]:
+                if (masks[i][order] >> position) & 1:
+                    remaining[i][order] -= 1
+                    lessons[i].append((classes[i]['id'], slot_index, subjects[order]['id'],
+                                       teacher_ids[position]))
+                    break
+
+        if progress is not None:
+            progress(class_count * (slot_index + 1) // slot_count, class_count)
+
+    if on_class is not None:
+        for class_obj, class_lessons in zip(classes, lessons):
+            on_class(class_obj, class_lessons)
+    return [lesson for class_lessons in lessons for lesson in class_lessons]
+
+
+# Hopcroft-Karp over the classes in `order`, whose neighbours are the teacher
+# positions set in candidates[i]. Grows match_class / match_teacher in place
+# to a maximum matching.
+def _augment_matching(order, candidates, match_class, match_teacher):
+    while True:
+        # Layer classes by the length of the shortest alternating path from
+        # an unmatched class
+        layer = {}
+        queue = deque()
+        for i in order:
+            if match_class[i] < 0:
+                layer[i] = 0
+                queue.append(i)
+        if not queue:
+            return
+
+        reached = 0
+        found = False
+        while queue:
+            i = queue.popleft()
+            bits = candidates[i] & ~reached
+            reached |= bits
+            while bits:
+                low = bits & -bits
+                bits ^= low
+                j = match_teacher.get(low.bit_length() - 1)
+                if j is None:
+                    found = True
+                elif j not in layer:
+                    layer[j] = layer[i] + 1
+                    queue.append(j)
+        if not found:
+            return
+
+        # Vertex-disjoint shortest augmenting paths along the layers; every
+        # teacher is tried at most once per phase
+        used = 0
+        for root in order:
+            if match_class[root] >= 0:
+                continue
+            stack = [root]
+            pending = [candidates[root]]
+            chosen = []
+            while stack:
+                i = stack[-1]
+                bits = pending[-1] & ~used
+                if not bits:
+                    # Dead end: no path through i in this phase
+                    layer.pop(i, None)
+                    stack.pop()
+                    pending.pop()
+                    if chosen:
+                        chosen.pop()
+                    continue
+                low = bits & -bits
+                pending[-1] = bits ^ low
+                position = low.bit_length() - 1
+                j = match_teacher.get(position)
+                if j is None:
+                    used |= low
+                    chosen.append(position)
+                    for i, position in zip(stack, chosen):
+                        match_class[i] = position
+                        match_teacher[position] = i
+                    break
+                if layer.get(j) == layer[i] + 1:
+                    used |= low
+                    chosen.append(position)
+                    stack.append(j)
+                    pending.append(candidates[j])
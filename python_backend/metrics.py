@@ -0,0 +1,156 @@
+import threading
+import time
+
+from flask import current_app, g, request
+
+from db import SqlRecorder, sql_recorder
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(f'{name}_bucket{_labels(labels + [("le", _number(bound))])} {count}')
+        lines.append(f'{name}_bucket{_labels(labels + [("le", "+Inf")])} {self.total}')
+        lines.append(f'{name}_sum{_labels(labels)} {_number(self.sum)}')
+        lines.append(f'{name}_count{_labels(labels)} {self.total}')
+        return lines
+
+
+# Per-route request latency and SQL usage, rendered in the Prometheus text
+# exposition format.
+#
+# init_app() starts an SqlRecorder for every request. Once the response is
+# ready the request's latency, SQL statement count, SQL time and slowest
+# statement are recorded per route, and X-SQL-Count / X-SQL-Time-Ms headers
+# are added so N+1 regressions show up in the browser's network tab.
+class RequestMetrics:
+    def __init__(self, slow_sql_ms=100.0):
+        self.slow_sql_ms = slow_sql_ms
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._sql_count = {}
+        self._sql_seconds = {}
+        self._slowest = {}
+        self._collectors = []
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    # Register a callable returning [(name, type, help, labels dict, value)]
+    # samples, called on every scrape
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.sql_recorder = SqlRecorder()
+        g.sql_recorder_token = sql_recorder.set(g.sql_recorder)
+
+    def _after_request(self, response):
+        recorder = g.get('sql_recorder')
+        started = g.get('metrics_started')
+        if recorder is None or started is None:
+            return response
+
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        key = (request.method, route)
+        with self._lock:
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self._sql_count.setdefault(key, Histogram(SQL_COUNT_BUCKETS)).observe(recorder.count)
+            self._sql_seconds[key] = self._sql_seconds.get(key, 0.0) + recorder.seconds
+            if recorder.slowest_seconds > self._slowest.get(key, 0.0):
+                self._slowest[key] = recorder.slowest_seconds
+
+        response.headers['X-SQL-Count'] = str(recorder.count)
+        response.headers['X-SQL-Time-Ms'] = f'{recorder.seconds * 1000:.2f}'
+
+        if recorder.slowest_seconds * 1000 >= self.slow_sql_ms:
+            current_app.logger.warning(
+                'Slow SQL on %s %s (%.1f ms): %s', request.method, route,
+                recorder.slowest_seconds * 1000, ' '.join(recorder.slowest_sql.split()))
+        return response
+
+    def _teardown_request(self, exception=None):
+        token = g.pop('sql_recorder_token', None)
+        if token is not None:
+            sql_recorder.reset(token)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            latency = sorted(self._latency.items())
+            sql_count = sorted(self._sql_count.items())
+            sql_seconds = sorted(self._sql_seconds.items())
+            slowest = sorted(self._slowest.items())
+
+        lines.append('# HELP timetable_http_request_duration_seconds Request latency by route.')
+        lines.append('# TYPE timetable_http_request_duration_seconds histogram')
+        for (method, route), histogram in latency:
+            lines.extend(histogram.render('timetable_http_request_duration_seconds',
+                                          [('method', method), ('route', route)]))
+
+        lines.append('# HELP timetable_http_request_sql_statements SQL statements run per request.')
+        lines.append('# TYPE timetable_http_request_sql_statements histogram')
+        for (method, route), histogram in sql_count:
+            lines.extend(histogram.render('timetable_http_request_sql_statements',
+                                          [('method', method), ('route', route)]))
+
+        lines.append('# HELP timetable_http_request_sql_seconds_total Time spent in SQL by route.')
+        lines.append('# TYPE timetable_http_request_sql_seconds_total counter')
+        for (method, route), seconds in sql_seconds:
+            lines.append(f'timetable_http_request_sql_seconds_total'
+                         f'{_labels([("method", method), ("route", route)])} {_number(seconds)}')
+
+        lines.append('# HELP timetable_http_request_sql_slowest_seconds Slowest single SQL statement seen by route.')
+        lines.append('# TYPE timetable_http_request_sql_slowest_seconds gauge')
+        for (method, route), seconds in slowest:
+            lines.append(f'timetable_http_request_sql_slowest_seconds'
+                         f'{_labels([("method", method), ("route", route)])} {_number(seconds)}')
+
+        seen = set()
+        for collect in self._collectors:
+            for name, kind, help_text, labels, value in collect():
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# HELP {name} {help_text}')
+                    lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name}{_labels(sorted(labels.items()))} {_number(value)}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,83 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scheduler import score_assignments, solve_greedy, solve_randomized
+
+# Starts of a run that does not ask for a number. Fixed rather than derived
+# from the core count, so the same request gives the same timetable on any
+# machine.
+DEFAULT_STARTS = 8
+
+# Problem shared by every task in a worker process, set by _init_worker so it
+# is pickled once per worker instead of once per start
+_worker_problem = None
+
+
+def _init_worker(problem):
+    global _worker_problem
+    _worker_problem = problem
+
+
+def _run_start(start, seed):
+    return _solve_start(_worker_problem, start, seed)
+
+
+# Start 0 is the plain greedy, so multi-start never does worse than it;
+# every other start is a seeded randomized greedy
+def _solve_start(problem, start, seed):
+    if start == 0:
+        assignments = solve_greedy(problem)
+    else:
+        assignments = solve_randomized(problem, seed)
+    return start, score_assignments(problem, assignments), assignments
+
+
+# Seeds for every start, derived from the run seed so a run can be repeated
+def start_seeds(seed, starts):
+    rng = random.Random(seed)
+    return [rng.getrandbits(32) for _ in range(starts)]
+
+
+# Run `starts` greedy variants, in parallel over `workers` processes
+# (default and upper bound: all cores), and keep the best by
+# score_assignments. Ties go to the lowest start number, so the result does
+# not depend on which worker finishes first or how many workers there are.
+def solve_multistart(problem, starts=DEFAULT_STARTS, seed=0, workers=None, progress=None):
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, cores)
+    starts = max(1, starts)
+    seeds = start_seeds(seed, starts)
+
+    results = []
+
+    def record(result):
+        results.append(result)
+        if progress is not None:
+            # Reported in class units so job progress reads like a single run
+            class_count = len(problem.classes)
+            progress(class_count * len(results) // starts, class_count)
+
+    if workers == 1 or starts == 1:
+        for start in range(starts):
+            record(_solve_start(problem, start, seeds[start]))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, starts),
+                                 initializer=_init_worker,
+                                 initargs=(problem,)) as pool:
+            futures = [pool.submit(_run_start, start, seeds[start]) for start in range(starts)]
+            try:
+                for future in as_completed(futures):
+                    record(future.result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    best_start, best_score, best_assignments = min(results, key=lambda result: (result[1], result[0]))
+    return best_assignments, {
+        'starts': starts,
+        'seed': seed,
+        'bestStart': best_start,
+        'bestSeed': seeds[best_start]
+    }
@@ -0,0 +1,145 @@
+import itertools
+
+from bell_schedule import calendar_signature, load_bell_schedule
+from db import bump_data_version
+
+INSERT_ENTRY_SQL = '''
+    INSERT INTO timetable_entries (class_id, day_idx, period_idx, subject_id, teacher_id, is_break)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+SNAPSHOT_SQL = 'INSERT INTO generation_snapshot (kind, entity_id, signature) VALUES (?, ?, ?)'
+
+CELLS_SQL = 'SELECT class_id, day_idx, period_idx, subject_id, teacher_id, is_break FROM timetable_entries'
+ONE_CELL = ' WHERE class_id = ? AND day_idx = ? AND period_idx = ?'
+
+CALENDAR_CHANGED_ERROR = 'The calendar changed while the timetable was generated; generate it again'
+
+
+# Raised when a timetable built under one calendar is written after the
+# calendar was replaced
+class CalendarChangedError(ValueError):
+    pass
+
+
+# Break cells of the given classes
+def break_rows(problem, classes):
+    rows = []
+    calendar = problem.calendar
+    for class_obj in classes:
+        for day_idx in range(len(calendar.days)):
+            for period_idx in calendar.break_types:
+                rows.append((class_obj['id'], day_idx, period_idx, None, None, True))
+    return rows
+
+
+# Build every timetable_entries row for a solved problem in memory:
+# break and lunch cells for all classes first, then the scheduled lessons
+def build_timetable_rows(problem, assignments):
+    rows = break_rows(problem, problem.classes)
+    rows.extend(lesson_rows(problem, assignments))
+    return rows
+
+
+# timetable_entries rows for (class_id, slot_index, subject_id, teacher_id)
+# assignments
+def lesson_rows(problem, assignments):
+    rows = []
+    slots = problem.slots
+    for class_id, slot_index, subject_id, teacher_id in assignments:
+        day_idx, period_idx = slots[slot_index]
+        rows.append((class_id, day_idx, period_idx, subject_id, teacher_id, False))
+    return rows
+
+
+# {(class_id, day_idx, period_idx): (subject_id, teacher_id, is_break)} of
+# timetable_entries rows, all of them or those matching `where`
+def read_cells(conn, where='', params=()):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(CELLS_SQL + where, params)
+    return {(row[0], row[1], row[2]): (row[3], row[4], int(row[5])) for row in cursor}
+
+
+# The same mapping for timetable_entries rows held in memory
+def rows_to_cells(rows):
+    return {(row[0], row[1], row[2]): (row[3], row[4], int(bool(row[5]))) for row in rows}
+
+
+# Refuse a snapshot that was taken under another calendar than the stored one
+def _check_calendar(conn, snapshot):
+    built_under = [signature for kind, _, signature in snapshot if kind == 'calendar']
+    if built_under and built_under[0] != calendar_signature(load_bell_schedule(conn)):
+        raise CalendarChangedError(CALENDAR_CHANGED_ERROR)
+
+
+def _write_snapshot(conn, snapshot):
+    conn.execute('DELETE FROM generation_snapshot')
+    conn.executemany(SNAPSHOT_SQL, snapshot)
+
+
+# Delete the whole timetable inside the caller's transaction, together with
+# the snapshot that described it
+def clear_timetable(conn):
+    conn.execute('DELETE FROM timetable_entries')
+    conn.execute('DELETE FROM generation_snapshot')
+
+
+# Swap the stored timetable for `rows` in a single write transaction, so
+# readers keep seeing the previous timetable until the commit lands.
+# `snapshot` rows record the solver input the timetable was built from;
+# CalendarChangedError is raised if they name another calendar than the
+# stored one.
+#
+# If given, history(conn, before, after) is called inside the transaction
+# with the old and new contents of every cell the write touched, as
+# read_cells() returns them; a cell missing from one side has no row there.
+def replace_timetable(conn, rows, snapshot=None, history=None):
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if snapshot is not None:
+            _check_calendar(conn, snapshot)
+        before = read_cells(conn) if history is not None else None
+        conn.execute('DELETE FROM timetable_entries')
+        conn.executemany(INSERT_ENTRY_SQL, rows)
+        if snapshot is not None:
+            _write_snapshot(conn, snapshot)
+        if history is not None:
+            history(conn, before, rows_to_cells(rows))
+        bump_data_version(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# Apply an incremental update in one write transaction: drop every row of
+# `class_ids`, delete the `cells` given as (class_id, day_idx, period_idx),
+# then insert `rows` and record the new snapshot. `history` and the
+# calendar check are as for replace_timetable.
+def update_timetable(conn, class_ids, cells, rows, snapshot, history=None):
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        _check_calendar(conn, snapshot)
+        if history is not None:
+            before = {}
+            for class_id in class_ids:
+                before.update(read_cells(conn, ' WHERE class_id = ?', (class_id,)))
+            rebuilt = set(class_ids)
+            for cell in itertools.chain(cells, (row[:3] for row in rows if row[0] not in rebuilt)):
+                before.update(read_cells(conn, ONE_CELL, cell))
+        conn.executemany('DELETE FROM timetable_entries WHERE class_id = ?',
+                         [(class_id,) for class_id in class_ids])
+        conn.executemany(
+            'DELETE FROM timetable_entries WHERE class_id = ? AND day_idx = ? AND period_idx = ?',
+            cells
+        )
+        conn.executemany(INSERT_ENTRY_SQL, rows)
+        _write_snapshot(conn, snapshot)
+        if history is not None:
+            history(conn, before, rows_to_cells(rows))
+        bump_data_version(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
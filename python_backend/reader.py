@@ -0,0 +1,396 @@
+from bell_schedule import load_bell_schedule
+from export import EXPORT_SQL, entry_to_dict
+
+
+def subject_to_dict(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'hours': row['hours'],
+        'requiresLab': bool(row['requires_lab']),
+        'priority': row['priority']
+    }
+
+
+def class_to_dict(row):
+    return {
+        'id': row['id'],
+        'year': row['year'],
+        'section': row['section'],
+        'studentsCount': row['students_count']
+    }
+
+
+# Subject payloads keyed by id
+def load_subjects(conn):
+    return {
+        row['id']: subject_to_dict(row)
+        for row in conn.execute('SELECT * FROM subjects ORDER BY id').fetchall()
+    }
+
+
+# Teacher payloads keyed by id, with their subjects and years, in three
+# queries regardless of how many teachers there are
+def load_teachers(conn, subjects_by_id):
+    teachers = {}
+    for row in conn.execute('SELECT id, name FROM teachers ORDER BY id').fetchall():
+        teachers[row['id']] = {
+            'id': row['id'],
+            'name': row['name'],
+            'subjects': [],
+            'years': []
+        }
+
+    subject_rows = conn.execute(
+        'SELECT teacher_id, subject_id FROM teacher_subject ORDER BY teacher_id, subject_id'
+    ).fetchall()
+    for row in subject_rows:
+        teacher = teachers.get(row['teacher_id'])
+        subject = subjects_by_id.get(row['subject_id'])
+        if teacher is not None and subject is not None:
+            teacher['subjects'].append(subject)
+
+    year_rows = conn.execute(
+        'SELECT teacher_id, year FROM teacher_year ORDER BY teacher_id, year'
+    ).fetchall()
+    for row in year_rows:
+        teacher = teachers.get(row['teacher_id'])
+        if teacher is not None:
+            teacher['years'].append(row['year'])
+
+    return teachers
+
+
+# Subjects whose hours are not all scheduled across `class_count` classes
+def unscheduled_info(subjects, scheduled_hours, class_count):
+    info = {}
+    for subject_id, subject in subjects.items():
+        scheduled = scheduled_hours.get(subject_id, 0)
+        total = subject['hours'] * class_count
+        if scheduled < total:
+            info[subject_id] = {
+                'name': subject['name'],
+                'unscheduledHours': total - scheduled
+            }
+    return info
+
+
+# Build the /api/timetable payload from bulk queries and in-memory lookups.
+# Cells are collected in flat per-class grids indexed by calendar.cell()
+# and only turned into day / period keyed dicts at the end.
+def read_timetable(conn):
+    calendar = load_bell_schedule(conn)
+    subjects = load_subjects(conn)
+    teachers = load_teachers(conn, subjects)
+    classes = conn.execute('SELECT * FROM classes ORDER BY id').fetchall()
+
+    grids = {class_obj['id']: [None] * calendar.cell_count for class_obj in classes}
+    break_cells = [
+        {'isBreak': True, 'breakType': calendar.break_types.get(period_idx)}
+        for period_idx in range(len(calendar.periods))
+    ]
+
+    # Fill in the timetable and count scheduled hours per subject
+    scheduled_hours = {}
+    entries = conn.execute(
+        'SELECT class_id, day_idx, period_idx, subject_id, teacher_id, is_break FROM timetable_entries'
+    )
+    for class_id, day_idx, period_idx, subject_id, teacher_id, is_break in entries:
+        if not is_break and subject_id is not None:
+            scheduled_hours[subject_id] = scheduled_hours.get(subject_id, 0) + 1
+
+        grid = grids.get(class_id)
+        if grid is None or day_idx >= len(calendar.days) or period_idx >= len(calendar.periods):
+            continue
+
+        if is_break:
+            cell = break_cells[period_idx]
+        else:
+            cell = {
+                'subject': subjects.get(subject_id) if subject_id else None,
+                'teacher': teachers.get(teacher_id) if teacher_id else None
+            }
+        grid[calendar.cell(day_idx, period_idx)] = cell
+
+    # Prepare the response
+    period_count = len(calendar.periods)
+    timetable_data = {}
+    for class_obj in classes:
+        grid = grids[class_obj['id']]
+        timetable_data[class_obj['id']] = {
+            'classInfo': class_to_dict(class_obj),
+            'timetable': {
+                day: dict(zip(calendar.periods, grid[day_idx * period_count:(day_idx + 1) * period_count]))
+                for day_idx, day in enumerate(calendar.days)
+            }
+        }
+
+    return {
+        'timetable': timetable_data,
+        'unscheduledInfo': unscheduled_info(subjects, scheduled_hours, len(classes))
+    }
+
+
+# Normalized variant of read_timetable for /api/timetable?format=compact.
+#
+# Subjects and teachers are sent once in lookup tables keyed by id (teachers
+# carry subjectIds instead of embedded subjects). Each class has two flat
+# integer grids, `subjectIds` and `teacherIds`, indexed by
+# day_idx * len(timeSlots) + period_idx. 0 means an empty cell and
+# BREAK_CELL marks a break whose label is in `breakSlots`.
+BREAK_CELL = -1
+
+
+# The subject and teacher lookup tables of the compact format
+def compact_lookups(conn):
+    subjects = load_subjects(conn)
+    teachers = {
+        teacher_id: {
+            'id': teacher['id'],
+            'name': teacher['name'],
+            'subjectIds': [subject['id'] for subject in teacher['subjects']],
+            'years': teacher['years']
+        }
+        for teacher_id, teacher in load_teachers(conn, subjects).items()
+    }
+    return subjects, teachers
+
+
+def read_timetable_compact(conn):
+    subjects, teachers = compact_lookups(conn)
+
+    calendar = load_bell_schedule(conn)
+    cell_count = calendar.cell_count
+
+    classes = []
+    grids = {}
+    for row in conn.execute('SELECT * FROM classes ORDER BY id').fetchall():
+        class_data = class_to_dict(row)
+        class_data['subjectIds'] = [0] * cell_count
+        class_data['teacherIds'] = [0] * cell_count
+        classes.append(class_data)
+        grids[row['id']] = class_data
+
+    scheduled_hours = {}
+    entries = conn.execute(
+        'SELECT class_id, day_idx, period_idx, subject_id, teacher_id, is_break FROM timetable_entries'
+    )
+    for class_id, day_idx, period_idx, subject_id, teacher_id, is_break in entries:
+        if not is_break and subject_id is not None:
+            scheduled_hours[subject_id] = scheduled_hours.get(subject_id, 0) + 1
+
+        class_data = grids.get(class_id)
+        if class_data is None or day_idx >= len(calendar.days) or period_idx >= len(calendar.periods):
+            continue
+
+        cell = calendar.cell(day_idx, period_idx)
+        if is_break:
+            class_data['subjectIds'][cell] = BREAK_CELL
+        else:
+            class_data['subjectIds'][cell] = subject_id or 0
+            class_data['teacherIds'][cell] = teacher_id or 0
+
+    return {
+        'days': calendar.days,
+        'timeSlots': calendar.periods,
+        'breakSlots': calendar.break_slots(),
+        'subjects': subjects,
+        'teachers': teachers,
+        'classes': classes,
+        'unscheduledInfo': unscheduled_info(subjects, scheduled_hours, len(classes))
+    }
+
+
+# Cells of one teacher, class or day, as export rows. Each view is one
+# lookup of what it is about plus one query over timetable_entries that is
+# answered from the primary key (classes) or a covering index (teachers,
+# days), so it stays fast however many classes the timetable has. Returns
+# None when the teacher, class or day does not exist.
+def _view_entries(conn, condition, order, params):
+    rows = conn.execute(EXPORT_SQL + f' WHERE {condition} ORDER BY {order}', params)
+    return [entry_to_dict(row) for row in rows]
+
+
+def read_teacher_view(conn, teacher_id):
+    teacher = conn.execute('SELECT id, name FROM teachers WHERE id = ?', (teacher_id,)).fetchone()
+    if teacher is None:
+        return None
+    return {
+        'teacher': {'id': teacher['id'], 'name': teacher['name']},
+        'entries': _view_entries(conn, 'e.teacher_id = ?', 'e.day_idx, e.period_idx, e.class_id', (teacher_id,))
+    }
+
+
+def read_class_view(conn, class_id):
+    class_obj = conn.execute('SELECT * FROM classes WHERE id = ?', (class_id,)).fetchone()
+    if class_obj is None:
+        return None
+    return {
+        'classInfo': class_to_dict(class_obj),
+        'entries': _view_entries(conn, 'e.class_id = ?', 'e.day_idx, e.period_idx', (class_id,))
+    }
+
+
+# `day` is a day name (any case) or its index in the calendar
+def read_day_view(conn, day):
+    if day.isdigit():
+        row = conn.execute('SELECT day_idx, name FROM calendar_days WHERE day_idx = ?', (int(day),)).fetchone()
+    else:
+        row = conn.execute('SELECT day_idx, name FROM calendar_days WHERE name = ? COLLATE NOCASE',
+                           (day,)).fetchone()
+    if row is None:
+        return None
+    return {
+        'dayIdx': row['day_idx'],
+        'day': row['name'],
+        'entries': _view_entries(conn, 'e.day_idx = ?', 'e.class_id, e.period_idx', (row['day_idx'],))
+    }
+
+
+# Largest page the list endpoints hand out
+MAX_PAGE_SIZE = 500
+
+# Largest `IN (...)` list sent in one statement
+BATCH_SIZE = 500
+
+
+def _int_arg(args, name, minimum=None, maximum=None):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer')
+    if minimum is not None and value < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    if maximum is not None and value > maximum:
+        raise ValueError(f'{name} must be at most {maximum}')
+    return value
+
+
+# Keyset pagination and filter arguments shared by the list endpoints.
+# Raises ValueError for malformed values.
+def parse_list_args(args):
+    requires_lab = args.get('requiresLab')
+    if requires_lab is not None:
+        if requires_lab.lower() not in ('1', 'true', '0', 'false'):
+            raise ValueError('requiresLab must be true or false')
+        requires_lab = requires_lab.lower() in ('1', 'true')
+
+    return {
+        'after': _int_arg(args, 'after', minimum=0),
+        'limit': _int_arg(args, 'limit', minimum=1, maximum=MAX_PAGE_SIZE),
+        'q': args.get('q') or None,
+        'year': _int_arg(args, 'year'),
+        'subjectId': _int_arg(args, 'subjectId'),
+        'requiresLab': requires_lab
+    }
+
+
+def _prefix_pattern(prefix):
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+# Run `sql` (a SELECT without WHERE / ORDER BY) with the given conditions,
+# ordered by id and cut to one keyset page. Returns the rows and the id to
+# pass as ?after= for the next page, or None on the last page.
+def keyset_page(conn, sql, conditions, params, after, limit):
+    conditions = list(conditions)
+    params = list(params)
+    if after is not None:
+        conditions.append('id > ?')
+        params.append(after)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY id'
+    if limit is not None:
+        # One extra row tells whether another page follows
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    if limit is not None and len(rows) > limit:
+        return rows[:limit], rows[limit - 1]['id']
+    return rows, None
+
+
+def list_subjects(conn, filters):
+    conditions = []
+    params = []
+    if filters['q']:
+        # Served by the NOCASE index on subjects.name
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        params.append(_prefix_pattern(filters['q']))
+    if filters['requiresLab'] is not None:
+        conditions.append('requires_lab = ?')
+        params.append(int(filters['requiresLab']))
+    if filters['subjectId'] is not None:
+        conditions.append('id = ?')
+        params.append(filters['subjectId'])
+
+    rows, next_after = keyset_page(conn, 'SELECT * FROM subjects', conditions, params,
+                                   filters['after'], filters['limit'])
+    return [subject_to_dict(row) for row in rows], next_after
+
+
+def list_classes(conn, filters):
+    conditions = []
+    params = []
+    if filters['year'] is not None:
+        conditions.append('year = ?')
+        params.append(filters['year'])
+    if filters['q']:
+        conditions.append("section LIKE ? ESCAPE '\\'")
+        params.append(_prefix_pattern(filters['q']))
+
+    rows, next_after = keyset_page(conn, 'SELECT * FROM classes', conditions, params,
+                                   filters['after'], filters['limit'])
+    return [class_to_dict(row) for row in rows], next_after
+
+
+# Teachers matching the filters, with their subjects and years loaded in
+# batched `IN (...)` queries for the whole page instead of per teacher
+def list_teachers(conn, filters):
+    conditions = []
+    params = []
+    if filters['q']:
+        conditions.append("name LIKE ? ESCAPE '\\'")
+        params.append(_prefix_pattern(filters['q']))
+    if filters['year'] is not None:
+        conditions.append('id IN (SELECT teacher_id FROM teacher_year WHERE year = ?)')
+        params.append(filters['year'])
+    if filters['subjectId'] is not None:
+        conditions.append('id IN (SELECT teacher_id FROM teacher_subject WHERE subject_id = ?)')
+        params.append(filters['subjectId'])
+
+    rows, next_after = keyset_page(conn, 'SELECT id, name FROM teachers', conditions, params,
+                                   filters['after'], filters['limit'])
+    teachers = {
+        row['id']: {'id': row['id'], 'name': row['name'], 'subjects': [], 'years': []}
+        for row in rows
+    }
+
+    ids = list(teachers)
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        placeholders = ','.join('?' * len(batch))
+        subject_rows = conn.execute(f'''
+            SELECT ts.teacher_id, s.* FROM teacher_subject ts
+            JOIN subjects s ON s.id = ts.subject_id
+            WHERE ts.teacher_id IN ({placeholders})
+            ORDER BY ts.teacher_id, ts.subject_id
+        ''', batch).fetchall()
+        for row in subject_rows:
+            teachers[row['teacher_id']]['subjects'].append(subject_to_dict(row))
+
+        year_rows = conn.execute(f'''
+            SELECT teacher_id, year FROM teacher_year
+            WHERE teacher_id IN ({placeholders})
+            ORDER BY teacher_id, year
+        ''', batch).fetchall()
+        for row in year_rows:
+            teachers[row['teacher_id']]['years'].append(row['year'])
+
+    return list(teachers.values()), next_after
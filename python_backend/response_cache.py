@@ -0,0 +1,83 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+
+
+# Serialized JSON responses cached per data version.
+#
+# The version is the counter every write bumps in its own transaction
+# (db.bump_data_version), read through `read_version()`, so it changes in
+# the same commit as the data and is shared by every process using the
+# database. Entries from older versions are never looked up again and age
+# out of the bounded LRU. ETags are derived from the version and the cache
+# key only, so a matching If-None-Match is answered with one version read
+# and without building the response.
+class ResponseCache:
+    def __init__(self, read_version, max_entries=64):
+        self.read_version = read_version
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def etag(self, key, version):
+        epoch, number = version
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:12]
+        return f'{epoch}-{number}-{digest}'
+
+    def get(self, key, version):
+        with self._lock:
+            body = self._entries.get((key, version))
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, version))
+            self.hits += 1
+            return body
+
+    def put(self, key, version, body):
+        with self._lock:
+            self._entries[(key, version)] = body
+            self._entries.move_to_end((key, version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Decorator for GET views: serves the cached body for the current data
+    # version, or a 304 when the client already holds it
+    def cached(self, name):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = (name, tuple(sorted(kwargs.items())), request.query_string)
+                version = self.read_version()
+                etag = self.etag(key, version)
+                if request.if_none_match.contains_weak(etag):
+                    response = current_app.response_class(status=304)
+                else:
+                    body = self.get(key, version)
+                    if body is None:
+                        response = current_app.make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        body = response.get_data()
+                        # A write that committed meanwhile may be in the body
+                        # or not: send it, but neither cache nor tag it
+                        if self.read_version() != version:
+                            response.headers['Cache-Control'] = 'no-cache'
+                            return response
+                        self.put(key, version, body)
+                    response = current_app.response_class(body, mimetype='application/json')
+
+                response.set_etag(etag)
+                # Make browsers revalidate instead of reusing a stale copy
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
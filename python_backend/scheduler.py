@@ -0,0 +1,246 @@
+import heapq
+import random
+
+from bell_schedule import BellSchedule, load_bell_schedule
+
+
+# Precomputed lookup structures for one scheduling run
+class SchedulingProblem:
+    def __init__(self, subjects, teachers, classes, calendar=None):
+        # subjects: [{'id', 'hours', 'priority', 'requires_lab'}], in database order
+        # teachers: [{'id', 'subject_ids', 'years'}], in database order
+        # classes:  [{'id', 'year'}], in database order
+        # calendar: BellSchedule, the default week when not given
+        self.subjects = subjects
+        self.teachers = teachers
+        self.classes = classes
+        self.calendar = calendar if calendar is not None else BellSchedule()
+
+        # Flat index over the teaching slots as (day_idx, period_idx) pairs,
+        # in the order the greedy visits them
+        self.slots = [
+            (day_idx, period_idx)
+            for day_idx in range(len(self.calendar.days))
+            for period_idx in self.calendar.teaching_periods
+        ]
+
+        # follows_previous[slot_index]: the slot directly follows the previous
+        # teaching slot on the same day, with no free period or break between
+        self.follows_previous = [False] * len(self.slots)
+        for slot_index in range(1, len(self.slots)):
+            day_idx, period_idx = self.slots[slot_index]
+            previous_day_idx, previous_period_idx = self.slots[slot_index - 1]
+            self.follows_previous[slot_index] = (
+                day_idx == previous_day_idx and period_idx == previous_period_idx + 1
+            )
+
+        # (subject_id, year) -> bitset of eligible teacher positions.
+        # Bit i stands for teachers[i], so the lowest set bit is the first
+        # eligible teacher in database order.
+        known_subjects = {subject['id'] for subject in subjects}
+        self.eligible = {}
+        for position, teacher in enumerate(teachers):
+            bit = 1 << position
+            for subject_id in teacher['subject_ids']:
+                if subject_id not in known_subjects:
+                    continue
+                for year in teacher['years']:
+                    key = (subject_id, year)
+                    self.eligible[key] = self.eligible.get(key, 0) | bit
+
+
+# Load solver input, including the stored calendar, with a fixed number of
+# queries. ORDER BY id keeps the rowid order the greedy depends on; narrow
+# selects would otherwise be served from the UNIQUE name and
+# (year, section) indexes in a different order.
+def load_problem(conn):
+    subjects = [{
+        'id': row['id'],
+        'hours': row['hours'],
+        'priority': row['priority'],
+        'requires_lab': bool(row['requires_lab'])
+    } for row in conn.execute('SELECT id, hours, priority, requires_lab FROM subjects ORDER BY id').fetchall()]
+
+    teachers = []
+    teachers_by_id = {}
+    for row in conn.execute('SELECT id FROM teachers ORDER BY id').fetchall():
+        teacher = {'id': row['id'], 'subject_ids': [], 'years': []}
+        teachers.append(teacher)
+        teachers_by_id[row['id']] = teacher
+
+    for row in conn.execute('SELECT teacher_id, subject_id FROM teacher_subject').fetchall():
+        if row['teacher_id'] in teachers_by_id:
+            teachers_by_id[row['teacher_id']]['subject_ids'].append(row['subject_id'])
+
+    for row in conn.execute('SELECT teacher_id, year FROM teacher_year').fetchall():
+        if row['teacher_id'] in teachers_by_id:
+            teachers_by_id[row['teacher_id']]['years'].append(row['year'])
+
+    classes = [{
+        'id': row['id'],
+        'year': row['year']
+    } for row in conn.execute('SELECT id, year FROM classes ORDER BY id').fetchall()]
+
+    return SchedulingProblem(subjects, teachers, classes, load_bell_schedule(conn))
+
+
+# Greedy scheduler: for every class, walk the week slot by slot and give the
+# slot to the highest-priority subject (most remaining hours first on ties),
+# taught by the first free eligible teacher. If that subject has no free
+# teacher the slot stays empty.
+#
+# Returns a list of (class_id, slot_index, subject_id, teacher_id) tuples,
+# where slot_index points into problem.slots. If given, progress(done, total)
+# is called after each class; it may raise to abort the run. on_class, if
+# given, is called with each class and its lessons once the class is filled.
+def solve_greedy(problem, progress=None, on_class=None):
+    teacher_ids = [teacher['id'] for teacher in problem.teachers]
+    slot_count = len(problem.slots)
+
+    # busy[slot_index] is a bitset of teacher positions already teaching then
+    busy = [0] * slot_count
+    assignments = []
+
+    class_count = len(problem.classes)
+    hours = [subject['hours'] for subject in problem.subjects]
+
+    for class_number, class_obj in enumerate(problem.classes, 1):
+        lessons = fill_class(problem, class_obj, range(slot_count), hours, busy, teacher_ids)
+        assignments.extend(lessons)
+        if on_class is not None:
+            on_class(class_obj, lessons)
+
+        if progress is not None:
+            progress(class_number, class_count)
+
+    return assignments
+
+
+# Greedy fill of one class: walk `slot_indices` in order and give each slot
+# to the highest-priority subject (most remaining hours first on ties),
+# taught by the first eligible teacher not set in busy[slot_index].
+# `remaining` holds the hours still to place per subject, in
+# problem.subjects order. Updates `busy` and returns the new assignments.
+def fill_class(problem, class_obj, slot_indices, remaining, busy, teacher_ids):
+    subjects = problem.subjects
+    eligible = problem.eligible
+    class_id = class_obj['id']
+    year = class_obj['year']
+    assignments = []
+
+    # Remaining hours per subject, ordered like the original sort key:
+    # (priority, -remaining hours, database order)
+    heap = [
+        (subject['priority'], -remaining[order], order)
+        for order, subject in enumerate(subjects)
+        if remaining[order] > 0
+    ]
+    heapq.heapify(heap)
+
+    for slot_index in slot_indices:
+        if not heap:
+            break
+
+        priority, neg_remaining, order = heap[0]
+        subject_id = subjects[order]['id']
+
+        candidates = eligible.get((subject_id, year), 0) & ~busy[slot_index]
+        if not candidates:
+            continue
+
+        position = (candidates & -candidates).bit_length() - 1
+        busy[slot_index] |= 1 << position
+        assignments.append((class_id, slot_index, subject_id, teacher_ids[position]))
+
+        if neg_remaining < -1:
+            heapq.heapreplace(heap, (priority, neg_remaining + 1, order))
+        else:
+            heapq.heappop(heap)
+
+    return assignments
+
+
+# Randomized variant of the greedy for multi-start search. Classes and each
+# class's slots are visited in a seeded random order, subjects with equal
+# priority and remaining hours are tie-broken randomly, a random free
+# eligible teacher is chosen, and when the preferred subject has no free
+# teacher the next subject is tried instead of leaving the slot empty.
+def solve_randomized(problem, seed, progress=None):
+    rng = random.Random(seed)
+    subjects = problem.subjects
+    teacher_ids = [teacher['id'] for teacher in problem.teachers]
+    eligible = problem.eligible
+    slot_count = len(problem.slots)
+
+    busy = [0] * slot_count
+    assignments = []
+
+    classes = list(problem.classes)
+    rng.shuffle(classes)
+    class_count = len(classes)
+
+    for class_number, class_obj in enumerate(classes, 1):
+        class_id = class_obj['id']
+        year = class_obj['year']
+        remaining = {
+            order: subject['hours']
+            for order, subject in enumerate(subjects)
+            if subject['hours'] > 0
+        }
+        # Random tie-break between subjects that sort equal
+        jitter = {order: rng.random() for order in remaining}
+
+        slot_order = list(range(slot_count))
+        rng.shuffle(slot_order)
+
+        for slot_index in slot_order:
+            if not remaining:
+                break
+
+            ranked = sorted(remaining, key=lambda o: (subjects[o]['priority'], -remaining[o], jitter[o]))
+            for order in ranked:
+                subject_id = subjects[order]['id']
+                candidates = eligible.get((subject_id, year), 0) & ~busy[slot_index]
+                if not candidates:
+                    continue
+
+                position = _random_bit(candidates, rng)
+                busy[slot_index] |= 1 << position
+                assignments.append((class_id, slot_index, subject_id, teacher_ids[position]))
+
+                remaining[order] -= 1
+                if not remaining[order]:
+                    del remaining[order]
+                break
+
+        if progress is not None:
+            progress(class_number, class_count)
+
+    return assignments
+
+
+# Position of a uniformly chosen set bit of `bits`
+def _random_bit(bits, rng):
+    positions = []
+    while bits:
+        low = bits & -bits
+        positions.append(low.bit_length() - 1)
+        bits ^= low
+    return rng.choice(positions)
+
+
+# Quality of a solution, lower is better:
+# (unscheduled subject hours over all classes, teacher double-load), where
+# double-load counts lessons a teacher teaches directly after another lesson
+# on the same day with no free period or break in between.
+def score_assignments(problem, assignments):
+    required = sum(subject['hours'] for subject in problem.subjects if subject['hours'] > 0)
+    unscheduled = required * len(problem.classes) - len(assignments)
+
+    follows_previous = problem.follows_previous
+    taught = set((teacher_id, slot_index) for _, slot_index, _, teacher_id in assignments)
+    double_load = sum(
+        1 for teacher_id, slot_index in taught
+        if follows_previous[slot_index] and (teacher_id, slot_index - 1) in taught
+    )
+    return unscheduled, double_load
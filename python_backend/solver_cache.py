@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+CACHE_VERSION = 2
+
+# Options that do not change which timetable a solver produces. Workers
+# only spread the multistart starts over processes: the number of starts is
+# part of the key, and parse_solver_options always resolves it.
+IGNORED_OPTIONS = ('workers', 'incremental', 'useCache', 'requireFeasible')
+
+
+# SHA-256 over a canonical JSON encoding of everything a generation depends
+# on: subjects, teacher subject / year mappings, classes, the calendar and
+# the solver options
+def input_key(problem, options):
+    calendar = problem.calendar
+    canonical = {
+        'version': CACHE_VERSION,
+        'subjects': [
+            [subject['id'], subject['hours'], subject['priority'], bool(subject['requires_lab'])]
+            for subject in problem.subjects
+        ],
+        'teachers': [
+            [teacher['id'], sorted(set(teacher['subject_ids'])), sorted(set(teacher['years']))]
+            for teacher in problem.teachers
+        ],
+        'classes': [[class_obj['id'], class_obj['year']] for class_obj in problem.classes],
+        'calendar': [calendar.days, calendar.periods, sorted(calendar.break_types.items())],
+        'options': {name: value for name, value in sorted(options.items()) if name not in IGNORED_OPTIONS}
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+# Finished solver results on disk, one gzipped JSON file per input key.
+#
+# Lookups refresh a file's modification time and put() evicts the least
+# recently used files beyond `max_entries`. Files are written to a temporary
+# name and renamed into place, so concurrent readers never see a partial
+# result.
+class SolverCache:
+    def __init__(self, directory, max_entries=32):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json.gz')
+
+    # (assignments, stats) stored for `key`, or None
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if data.get('version') != CACHE_VERSION:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return [tuple(assignment) for assignment in data['assignments']], data['stats']
+
+    def put(self, key, assignments, stats):
+        os.makedirs(self.directory, exist_ok=True)
+        data = {'version': CACHE_VERSION, 'assignments': assignments, 'stats': stats}
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                f.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+            os.replace(temp_path, self._path(key))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json.gz'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+            entries.sort()
+            for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,103 @@
+import os
+
+from decompose import solve_decomposed
+from local_search import improve
+from matching import solve_matching
+from multistart import DEFAULT_STARTS, solve_multistart
+from scheduler import score_assignments
+
+# 'cardinality-matching' maximises the lessons placed in each slot first and
+# only then prefers higher-priority subjects; it is not a maximum-weight
+# matching (see matching.solve_matching)
+SOLVERS = ('greedy', 'multistart', 'cardinality-matching')
+
+MAX_STARTS = 1024
+
+# Solver processes one generation may use: no more than the machine's cores
+MAX_WORKERS = os.cpu_count() or 1
+
+# Upper bound for the local-search budget of one generation (10 minutes)
+MAX_TIME_BUDGET_MS = 600000
+
+
+def _int_option(data, name, default, minimum=None, maximum=None):
+    value = data.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{name} must be an integer')
+    if minimum is not None and value < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    if maximum is not None and value > maximum:
+        raise ValueError(f'{name} must be at most {maximum}')
+    return value
+
+
+# Validate the solver options of a generation request body.
+# Raises ValueError with a message suitable for a 400 response.
+def parse_solver_options(data):
+    solver = data.get('solver', 'greedy')
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver '{solver}', expected one of: {', '.join(SOLVERS)}")
+
+    incremental = data.get('incremental', False)
+    if not isinstance(incremental, bool):
+        raise ValueError('incremental must be true or false')
+    if incremental and (solver != 'greedy' or data.get('timeBudgetMs')):
+        raise ValueError('incremental generation always uses the greedy solver without a time budget')
+
+    use_cache = data.get('cache', True)
+    if not isinstance(use_cache, bool):
+        raise ValueError('cache must be true or false')
+
+    require_feasible = data.get('requireFeasible', False)
+    if not isinstance(require_feasible, bool):
+        raise ValueError('requireFeasible must be true or false')
+
+    return {
+        'solver': solver,
+        'incremental': incremental,
+        'useCache': use_cache,
+        'requireFeasible': require_feasible,
+        'starts': _int_option(data, 'starts', None, 1, MAX_STARTS) or DEFAULT_STARTS,
+        'seed': _int_option(data, 'seed', 0),
+        'workers': _int_option(data, 'workers', None, 1, MAX_WORKERS),
+        'timeBudgetMs': _int_option(data, 'timeBudgetMs', 0, 0, MAX_TIME_BUDGET_MS)
+    }
+
+
+# Solve `problem` with the configured solver, then spend up to timeBudgetMs
+# improving the result with local search. Returns the assignments and a
+# stats dict describing the run and the quality of the result. on_class is
+# passed on to the greedy and matching solvers; classes may still change
+# in the local search afterwards.
+def run_solver(problem, options, progress=None, on_class=None):
+    solver = options['solver']
+    if solver == 'multistart':
+        assignments, stats = solve_multistart(
+            problem,
+            starts=options['starts'],
+            seed=options['seed'],
+            workers=options['workers'],
+            progress=progress
+        )
+    elif solver == 'cardinality-matching':
+        assignments, stats = solve_decomposed(problem, workers=options['workers'], progress=progress,
+                                              solve=solve_matching, on_class=on_class)
+    else:
+        # Independent components are solved side by side; the result is the
+        # same as one greedy pass over all classes
+        assignments, stats = solve_decomposed(problem, workers=options['workers'], progress=progress,
+                                              on_class=on_class)
+
+    if options['timeBudgetMs']:
+        assignments, stats['improvement'] = improve(
+            problem, assignments, options['timeBudgetMs'], seed=options['seed'])
+
+    unscheduled, double_load = score_assignments(problem, assignments)
+    stats.update({
+        'solver': solver,
+        'unscheduledHours': unscheduled,
+        'teacherDoubleLoad': double_load
+    })
+    return assignments, stats
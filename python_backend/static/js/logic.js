@@ -3,6 +3,21 @@ let subjects = [];
 let teachers = [];
 let classes = [];
 
+// Teachers and classes are loaded page by page as their lists scroll into
+// view; subjects are always loaded in full since the forms need all of them
+const PAGE_SIZE = 50;
+const listPages = {
+    teachers: { url: '/api/teachers', listId: 'teacherList', after: 0, done: false, loading: false, sentinel: null },
+    classes: { url: '/api/classes', listId: 'classList', after: 0, done: false, loading: false, sentinel: null }
+};
+const pageObserver = 'IntersectionObserver' in window ? new IntersectionObserver(entries => {
+    entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            loadNextPage(entry.target.dataset.list);
+        }
+    });
+}) : null;
+
 // Web Speech API
 const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
 const SpeechSynthesis = window.speechSynthesis;
@@ -41,20 +56,81 @@ async function loadData() {
         updateSubjectList();
         updateTeacherSubjects();
         
-        // Load teachers
-        const teachersResponse = await fetch('/api/teachers');
-        teachers = await teachersResponse.json();
-        updateTeacherList();
-        
-        // Load classes
-        const classesResponse = await fetch('/api/classes');
-        classes = await classesResponse.json();
-        updateClassList();
+        // Load the first page of teachers and classes, the rest follows on scroll
+        resetPages();
+        await Promise.all([loadNextPage('teachers'), loadNextPage('classes')]);
     } catch (error) {
         console.error('Error loading data:', error);
     }
 }
 
+// Forget loaded pages and watch a sentinel placed after each list
+function resetPages() {
+    teachers = [];
+    classes = [];
+    Object.entries(listPages).forEach(([name, page]) => {
+        page.after = 0;
+        page.done = false;
+        if (!page.sentinel) {
+            page.sentinel = document.createElement('div');
+            page.sentinel.dataset.list = name;
+            document.getElementById(page.listId).after(page.sentinel);
+        }
+        if (pageObserver) {
+            pageObserver.observe(page.sentinel);
+        }
+    });
+}
+
+// Fetch the next keyset page of teachers or classes
+async function loadNextPage(name) {
+    const page = listPages[name];
+    if (page.done || page.loading) {
+        return;
+    }
+
+    page.loading = true;
+    try {
+        const response = await fetch(`${page.url}?after=${page.after}&limit=${PAGE_SIZE}`);
+        if (!response.ok) {
+            throw new Error(`Failed to load ${name}`);
+        }
+        const data = await response.json();
+
+        // Skip rows already added locally after a POST
+        if (name === 'teachers') {
+            const known = new Set(teachers.map(teacher => teacher.id));
+            teachers = teachers.concat(data.items.filter(teacher => !known.has(teacher.id)));
+            updateTeacherList();
+        } else {
+            const known = new Set(classes.map(cls => cls.id));
+            classes = classes.concat(data.items.filter(cls => !known.has(cls.id)));
+            updateClassList();
+        }
+
+        if (data.nextAfter === null) {
+            page.done = true;
+        } else {
+            page.after = data.nextAfter;
+        }
+    } finally {
+        page.loading = false;
+    }
+
+    // Without an observer load everything; with one, re-observe so a
+    // sentinel that is still visible asks for another page
+    if (!page.done) {
+        if (pageObserver) {
+            pageObserver.unobserve(page.sentinel);
+            pageObserver.observe(page.sentinel);
+        } else {
+            await loadNextPage(name);
+        }
+    } else if (pageObserver) {
+        pageObserver.unobserve(page.sentinel);
+    }
+}
+
 // Event listeners
 document.getElementById('subjectForm').addEventListener('submit', function (event) {
     event.preventDefault();
@@ -386,8 +462,10 @@ async function clearAllData() {
             }
 
             subjects = [];
-            teachers = [];
-            classes = [];
+            resetPages();
+            Object.values(listPages).forEach(page => {
+                page.done = true;
+            });
             updateSubjectList();
             updateTeacherList();
             updateTeacherSubjects();
@@ -411,17 +489,11 @@ async function generateTimetable() {
     }
 
     try {
-        const response = await fetch('/api/timetable/generate', {
-            method: 'POST'
-        });
-
-        if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.error || 'Failed to generate timetable');
+        if ('EventSource' in window) {
+            await streamTimetable();
+        } else {
+            await fetchTimetable();
         }
-
-        const timetableData = await response.json();
-        renderTimetable(timetableData);
         speak('Timetable generated successfully!');
     } catch (error) {
         console.error('Error generating timetable:', error);
@@ -430,89 +502,204 @@ async function generateTimetable() {
     }
 }
 
-// Render the generated timetable
-function renderTimetable(timetableData) {
-    const days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'];
-    const timeSlots = [
-        '9:00AM - 9:50AM', 
-        '10:00AM - 10:50AM', 
-        '11:00AM - 11:10AM',  // Break
-        '11:10AM - 12:00PM', 
-        '12:00PM - 12:50PM', 
-        '12:50PM - 1:30PM',   // Lunch
-        '1:30PM - 2:20PM', 
-        '2:30PM - 3:20PM', 
-        '3:30PM - 4:20PM'
-    ];
-    
-    let html = '';
-    const timetable = timetableData.timetable;
-    const unscheduledInfo = timetableData.unscheduledInfo;
-    
-    // For each class, render its timetable
-    Object.keys(timetable).forEach(classId => {
-        const classData = timetable[classId];
-        const classInfo = classData.classInfo;
-        
-        html += `<h3>Timetable for ${getOrdinal(classInfo.year)} Year - Section ${classInfo.section}</h3>`;
-        html += `
+// Generate and wait for the whole timetable in one response
+async function fetchTimetable() {
+    // The compact format sends subjects and teachers once plus integer
+    // grids per class, instead of full objects in every cell
+    const response = await fetch('/api/timetable/generate?format=compact', {
+        method: 'POST'
+    });
+
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Failed to generate timetable');
+    }
+
+    renderTimetable(await response.json());
+}
+
+// Generate in the background and render each class as soon as the server
+// streams it: a 'layout' event with the calendar, lookup tables and classes,
+// then 'class' events with one class's grids (a class may come again if it
+// changed), 'progress' while solving, 'summary' with the unscheduled hours
+// and a final 'end' with the job status
+async function streamTimetable() {
+    const response = await fetch('/api/timetable/generate', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ stream: true })
+    });
+    const job = await response.json();
+    if (!response.ok) {
+        throw new Error(job.error || 'Failed to generate timetable');
+    }
+
+    const result = document.getElementById('timetableResult');
+    result.innerHTML = '<div id="timetableProgress" class="message" style="display: block;">Scheduling classes...</div>';
+    let layout = null;
+
+    await new Promise((resolve, reject) => {
+        const source = new EventSource(job.eventsUrl);
+
+        source.addEventListener('progress', event => {
+            const progress = JSON.parse(event.data);
+            const element = document.getElementById('timetableProgress');
+            if (element) {
+                element.textContent = `Scheduling classes... ${progress.classesScheduled} of ${progress.classesTotal} (${progress.percent}%)`;
+            }
+        });
+
+        source.addEventListener('layout', event => {
+            layout = timetableLayout(JSON.parse(event.data));
+            // One placeholder per class keeps them in order whenever they arrive
+            result.insertAdjacentHTML('beforeend', layout.classes.map(classInfo =>
+                `<div id="classTimetable${classInfo.id}"></div>`).join(''));
+        });
+
+        source.addEventListener('class', event => {
+            const grids = JSON.parse(event.data);
+            const element = document.getElementById(`classTimetable${grids.id}`);
+            if (layout && element) {
+                element.innerHTML = classTimetableHtml(layout, Object.assign({}, layout.classesById[grids.id], grids));
+            }
+        });
+
+        source.addEventListener('summary', event => {
+            const warningHtml = unscheduledWarningHtml(JSON.parse(event.data).unscheduledInfo);
+            if (layout && warningHtml) {
+                layout.classes.forEach(classInfo => {
+                    document.getElementById(`classTimetable${classInfo.id}`).insertAdjacentHTML('beforeend', warningHtml);
+                });
+            }
+        });
+
+        source.addEventListener('end', event => {
+            source.close();
+            const finished = JSON.parse(event.data);
+            const element = document.getElementById('timetableProgress');
+            if (element) {
+                element.remove();
+            }
+            if (finished.status !== 'completed') {
+                reject(new Error(finished.error || `Timetable generation ${finished.status}`));
+            } else if (!layout) {
+                // Joined a generation started without streaming: load the result
+                fetch('/api/timetable?format=compact')
+                    .then(response => response.json())
+                    .then(timetableData => {
+                        renderTimetable(timetableData);
+                        resolve();
+                    }, reject);
+            } else {
+                resolve();
+            }
+        });
+
+        // The browser reconnects by itself and resumes after the last event;
+        // give up only once it stops trying
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                reject(new Error('Lost the connection to the timetable generation'));
+            }
+        };
+    });
+}
+
+// What rendering any class needs from the compact format: lookup tables
+// for subjects and teachers, the calendar and the table header, which is
+// the same for every class
+function timetableLayout(timetableData) {
+    const timeSlots = timetableData.timeSlots;
+    const breakSlots = timetableData.breakSlots;
+    const classesById = {};
+    timetableData.classes.forEach(classInfo => {
+        classesById[classInfo.id] = classInfo;
+    });
+
+    return {
+        days: timetableData.days,
+        timeSlots: timeSlots,
+        breakSlots: breakSlots,
+        subjectsById: timetableData.subjects,
+        teachersById: timetableData.teachers,
+        classes: timetableData.classes,
+        classesById: classesById,
+        headerHtml: timeSlots.map(slot => {
+            if (breakSlots[slot]) {
+                return `<th style="background-color: lightgray;">${slot}</th>`;
+            }
+            return `<th>${slot}</th>`;
+        }).join('')
+    };
+}
+
+function unscheduledWarningHtml(unscheduledInfo) {
+    const classUnscheduled = Object.values(unscheduledInfo).filter(info => info.unscheduledHours > 0);
+    return classUnscheduled.length === 0 ? '' : `
+            <div class="message error" style="display: block; margin-top: 1rem;">
+                Warning: Could not schedule all hours. Remaining:
+                ${classUnscheduled.map(info => `${info.name} (${info.unscheduledHours} hours)`).join(', ')}.
+            </div>
+`;
+}
+
+// Heading and table of one class from its flat subjectIds / teacherIds
+// grids, indexed by dayIndex * timeSlots.length + slotIndex
+// (0 = empty, -1 = break)
+function classTimetableHtml(layout, classData) {
+    const { days, timeSlots, breakSlots, subjectsById, teachersById } = layout;
+    const parts = [];
+
+    parts.push(`<h3>Timetable for ${getOrdinal(classData.year)} Year - Section ${classData.section}</h3>`);
+    parts.push(`
 <div class="timetable-wrapper">
     <table class="timetable">
         <tr>
             <th>Day/Hour</th>
-            ${timeSlots.map(slot => {
-                if (slot === '11:00AM - 11:10AM') {
-                    return `<th style="background-color: lightgray;">11:00AM - 11:10AM</th>`;
-                }
-                if (slot === '12:50PM - 1:30PM') {
-                    return `<th style="background-color: lightgray;">12:50PM - 1:30PM</th>`;
-                }
-                return `<th>${slot}</th>`;
-            }).join('')}
+            ${layout.headerHtml}
         </tr>
-`;
+`);
 
-        days.forEach((day, dayIndex) => {
-            html += `<tr><td><strong>${day}</strong></td>`;
+    days.forEach((day, dayIndex) => {
+        parts.push(`<tr><td><strong>${day}</strong></td>`);
 
-            timeSlots.forEach(slot => {
-                if (slot === '11:00AM - 11:10AM' && dayIndex === 0) {
-                    // Merge Break cell across all 6 days
-                    html += `<td rowspan="6" style="background-color: lightgray; text-align: center; font-weight: bold; font-size: 14px; padding: 32px; writing-mode: vertical-rl; text-orientation: upright;letter-spacing: 25px;">
-BREAK
-</td>
-`;
-                } else if (slot === '12:50PM - 1:30PM' && dayIndex === 0) {
-                    // Merge Lunch cell across all 6 days
-                    html += `<td rowspan="6" style="background-color: lightgray; text-align: center; font-weight: bold; font-size: 14px;padding:30px;writing-mode: vertical-rl; text-orientation: upright;letter-spacing: 25px;"> LUNCH</td>`;
-                } else if (slot !== '11:00AM - 11:10AM' && slot !== '12:50PM - 1:30PM') {
-                    const cell = classData.timetable[day][slot];
-                    html += `
-                    <td>
-                        ${cell && cell.subject ? `<strong>${cell.subject.name}</strong><br>${cell.teacher.name}` : '-'}
-                    </td>
-                `;
+        timeSlots.forEach((slot, slotIndex) => {
+            if (breakSlots[slot]) {
+                // Merge Break / Lunch cells across all days
+                if (dayIndex === 0) {
+                    parts.push(`<td rowspan="${days.length}" style="background-color: lightgray; text-align: center; font-weight: bold; font-size: 14px; padding: 32px; writing-mode: vertical-rl; text-orientation: upright;letter-spacing: 25px;">${breakSlots[slot].toUpperCase()}</td>`);
                 }
-            });
+                return;
+            }
 
-            html += `</tr>`;
+            const cell = dayIndex * timeSlots.length + slotIndex;
+            const subject = subjectsById[classData.subjectIds[cell]];
+            const teacher = teachersById[classData.teacherIds[cell]];
+            parts.push(`
+                    <td>
+                        ${subject ? `<strong>${subject.name}</strong><br>${teacher ? teacher.name : ''}` : '-'}
+                    </td>
+                `);
         });
 
-        html += `</table></div>`;
-        
-        // Show warning if some subjects couldn't be scheduled for this class
-        const classUnscheduled = Object.values(unscheduledInfo).filter(info => info.unscheduledHours > 0);
-        if (classUnscheduled.length > 0) {
-            html += `
-            <div class="message error" style="display: block; margin-top: 1rem;">
-                Warning: Could not schedule all hours. Remaining:
-                ${classUnscheduled.map(info => `${info.name} (${info.unscheduledHours} hours)`).join(', ')}.
-            </div>
-`;
-        }
+        parts.push(`</tr>`);
     });
 
-    document.getElementById('timetableResult').innerHTML = html;
+    parts.push(`</table></div>`);
+    return parts.join('');
+}
+
+// Render a whole timetable in the compact format: lookup tables for
+// subjects and teachers plus per-class grids (see classTimetableHtml)
+function renderTimetable(timetableData) {
+    const layout = timetableLayout(timetableData);
+
+    // Show the warning if some subjects couldn't be scheduled after every class
+    const warningHtml = unscheduledWarningHtml(timetableData.unscheduledInfo);
+
+    document.getElementById('timetableResult').innerHTML = timetableData.classes
+        .map(classData => classTimetableHtml(layout, classData) + warningHtml)
+        .join('');
 }
 
 // Show success/error messages
@@ -0,0 +1,68 @@
+import json
+
+from reader import BREAK_CELL, class_to_dict, compact_lookups, read_timetable_compact
+
+
+# One server-sent event; `data` goes out as a single line of JSON
+def format_event(number, name, data):
+    return f"id: {number}\nevent: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+# Streams the classes of one generation as they are scheduled, in the
+# compact format of /api/timetable?format=compact, through publish(name,
+# data) (Job.publish):
+# - 'layout': days, time slots, breaks, the subject and teacher lookup
+#   tables and every class without its grids, before solving starts
+# - 'class': {id, subjectIds, teacherIds} of a class once the solver has
+#   filled it; a class can be sent again when a later step changes it
+# - 'summary': {unscheduledInfo}, after the timetable was stored
+class ClassStream:
+    def __init__(self, publish):
+        self.publish = publish
+        self.problem = None
+        self._sent = {}
+
+    def start(self, conn, problem):
+        self.problem = problem
+        calendar = problem.calendar
+        subjects, teachers = compact_lookups(conn)
+        self.publish('layout', {
+            'days': calendar.days,
+            'timeSlots': calendar.periods,
+            'breakSlots': calendar.break_slots(),
+            'subjects': subjects,
+            'teachers': teachers,
+            'classes': [class_to_dict(row) for row in conn.execute('SELECT * FROM classes ORDER BY id')]
+        })
+
+    def _send(self, class_id, subject_ids, teacher_ids):
+        grids = (subject_ids, teacher_ids)
+        if self._sent.get(class_id) == grids:
+            return
+        self._sent[class_id] = grids
+        self.publish('class', {'id': class_id, 'subjectIds': subject_ids, 'teacherIds': teacher_ids})
+
+    # on_class hook for the solvers: the grids of one class from its
+    # (class_id, slot_index, subject_id, teacher_id) lessons
+    def add_class(self, class_obj, lessons):
+        calendar = self.problem.calendar
+        slots = self.problem.slots
+        subject_ids = [0] * calendar.cell_count
+        teacher_ids = [0] * calendar.cell_count
+        for day_idx in range(len(calendar.days)):
+            for period_idx in calendar.break_types:
+                subject_ids[calendar.cell(day_idx, period_idx)] = BREAK_CELL
+        for _, slot_index, subject_id, teacher_id in lessons:
+            cell = calendar.cell(*slots[slot_index])
+            subject_ids[cell] = subject_id
+            teacher_ids[cell] = teacher_id
+        self._send(class_obj['id'], subject_ids, teacher_ids)
+
+    # Once the timetable is stored: send every class whose stored grids
+    # differ from what was streamed (local search moves, incremental runs
+    # and cached results stream nothing before this), then the summary
+    def finish(self, conn):
+        timetable = read_timetable_compact(conn)
+        for class_data in timetable['classes']:
+            self._send(class_data['id'], class_data['subjectIds'], class_data['teacherIds'])
+        self.publish('summary', {'unscheduledInfo': timetable['unscheduledInfo']})
@@ -0,0 +1,42 @@
+import functools
+import os
+import sys
+
+import pytest
+
+# The backend modules import each other by their flat names
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import generate_institution  # noqa: E402
+from db import ConnectionPool, create_schema  # noqa: E402
+from incremental import snapshot_rows  # noqa: E402
+from persistence import build_timetable_rows, replace_timetable  # noqa: E402
+from scheduler import load_problem, solve_greedy  # noqa: E402
+from versions import record_version  # noqa: E402
+
+
+# An empty database in its own directory
+@pytest.fixture
+def conn(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'timetable.db'), size=1)
+    conn = pool.acquire()
+    create_schema(conn)
+    yield conn
+    conn.close()
+
+
+# A small synthetic institution: 8 classes over 4 years
+@pytest.fixture
+def institution(conn):
+    generate_institution(conn, 8, seed=0)
+    return conn
+
+
+# The institution with a generated timetable stored as its first version
+@pytest.fixture
+def generated(institution):
+    problem = load_problem(institution)
+    rows = build_timetable_rows(problem, solve_greedy(problem))
+    replace_timetable(institution, rows, snapshot=snapshot_rows(problem),
+                      history=functools.partial(record_version, source='generate'))
+    return institution
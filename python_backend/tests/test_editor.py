@@ -0,0 +1,109 @@
+import pytest
+
+from editor import EditNotFound, TimetableEditor
+from persistence import read_cells
+from scheduler import load_problem
+
+
+@pytest.fixture
+def editor():
+    return TimetableEditor()
+
+
+def _lessons(conn):
+    return {cell: (subject_id, teacher_id)
+            for cell, (subject_id, teacher_id, is_break) in read_cells(conn).items() if not is_break}
+
+
+def _types(conflicts):
+    return {conflict['type'] for conflict in conflicts}
+
+
+# Two classes of the same year and a slot where both have a lesson
+def _same_year_slot(conn):
+    years = {class_obj['id']: class_obj['year'] for class_obj in load_problem(conn).classes}
+    lessons = _lessons(conn)
+    for (class_id, day_idx, period_idx), lesson in sorted(lessons.items()):
+        for other in years:
+            if other != class_id and years[other] == years[class_id] and (other, day_idx, period_idx) in lessons:
+                return (class_id, day_idx, period_idx), (other, day_idx, period_idx), lesson
+    raise AssertionError('no shared slot')
+
+
+def test_teacher_clash_is_rejected(generated, editor):
+    cell, other, lesson = _same_year_slot(generated)
+    before = read_cells(generated)
+
+    changes, conflicts = editor.set_cell(generated, other, lesson)
+    clash = [conflict for conflict in conflicts if conflict['type'] == 'teacherClash']
+    assert clash == [{'type': 'teacherClash', 'teacherId': lesson[1], 'classId': cell[0],
+                      'dayIdx': cell[1], 'periodIdx': cell[2]}]
+    assert read_cells(generated) == before
+
+
+def test_swap_across_classes_in_one_slot(generated, editor):
+    cell, other, lesson = _same_year_slot(generated)
+    other_lesson = _lessons(generated)[other]
+
+    # Both teachers stay in the slot and both classes are of one year
+    changes, conflicts = editor.swap(generated, cell, other)
+    assert _types(conflicts) <= {'hoursExceeded'}
+    if not conflicts:
+        lessons = _lessons(generated)
+        assert (lessons[cell], lessons[other]) == (other_lesson, lesson)
+
+
+def test_ineligible_teacher_is_rejected(generated, editor):
+    problem = load_problem(generated)
+    positions = {teacher['id']: position for position, teacher in enumerate(problem.teachers)}
+    years = {class_obj['id']: class_obj['year'] for class_obj in problem.classes}
+    cell, (subject_id, _) = sorted(_lessons(generated).items())[0]
+    eligible = problem.eligible.get((subject_id, years[cell[0]]), 0)
+    teacher_id = next(teacher_id for teacher_id, position in positions.items() if not (eligible >> position) & 1)
+
+    changes, conflicts = editor.set_cell(generated, cell, (subject_id, teacher_id))
+    assert {'type': 'notEligible', 'teacherId': teacher_id, 'subjectId': subject_id,
+            'year': years[cell[0]]} in conflicts
+
+
+def test_hours_exceeded_is_rejected(generated, editor):
+    problem = load_problem(generated)
+    hours = {subject['id']: subject['hours'] for subject in problem.subjects}
+    lessons = _lessons(generated)
+    scheduled = {}
+    for (class_id, _, _), (subject_id, _) in lessons.items():
+        scheduled[(class_id, subject_id)] = scheduled.get((class_id, subject_id), 0) + 1
+
+    # Turn a lesson of the class into one more lesson of a subject it has
+    # all hours of already
+    ordered = sorted(lessons.items())
+    cell, target = next(
+        (cell, target) for cell, lesson in ordered for other, target in ordered
+        if other[0] == cell[0] and target[0] != lesson[0] and scheduled[(cell[0], target[0])] == hours[target[0]]
+    )
+
+    changes, conflicts = editor.set_cell(generated, cell, target)
+    assert {'type': 'hoursExceeded', 'classId': cell[0], 'subjectId': target[0],
+            'scheduled': hours[target[0]] + 1, 'hours': hours[target[0]]} in conflicts
+
+
+def test_clear_and_restore_a_lesson(generated, editor):
+    cell, lesson = sorted(_lessons(generated).items())[0]
+
+    assert editor.set_cell(generated, cell, None) == ({cell: None}, [])
+    assert cell not in _lessons(generated)
+    assert editor.set_cell(generated, cell, lesson) == ({cell: lesson}, [])
+    assert _lessons(generated)[cell] == lesson
+
+
+def test_cells_outside_the_timetable(generated, editor):
+    calendar = load_problem(generated).calendar
+    class_id = sorted(_lessons(generated))[0][0]
+    break_period = min(calendar.break_types)
+
+    with pytest.raises(ValueError, match='period'):
+        editor.set_cell(generated, (class_id, 0, break_period), None)
+    with pytest.raises(EditNotFound):
+        editor.set_cell(generated, (class_id, len(calendar.days), 0), None)
+    with pytest.raises(EditNotFound):
+        editor.set_cell(generated, (10 ** 6, 0, 0), None)
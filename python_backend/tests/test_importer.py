@@ -0,0 +1,88 @@
+import io
+
+import pytest
+
+from db import read_data_version
+from importer import ImportFormatError, import_records, parse_records
+
+RECORDS = [
+    {'type': 'subject', 'name': 'Math', 'hours': 4},
+    {'type': 'subject', 'name': 'Physics', 'hours': 'lots'},
+    {'type': 'teacher', 'name': 'Ada', 'subjects': ['Math', 'Chemistry'], 'years': [1]},
+    {'type': 'teacher', 'name': 'Ada', 'subjects': ['Math'], 'years': [1, 2]},
+    {'type': 'teacher', 'name': 'Ada', 'subjects': ['Math'], 'years': [1]},
+    {'type': 'class', 'year': 1, 'section': 'A', 'studentsCount': 30},
+    {'type': 'class', 'year': 1, 'section': 'A', 'studentsCount': 25},
+    {'type': 'room', 'name': 'Lab'},
+]
+
+
+def _import(conn, records, strict=False):
+    return import_records(conn, enumerate(records, start=1), strict=strict)
+
+
+def _count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_invalid_rows_are_skipped_and_reported(conn):
+    report = _import(conn, RECORDS)
+
+    assert report['rows'] == len(RECORDS)
+    assert report['imported'] == {'subjects': 1, 'teachers': 1, 'classes': 1}
+    assert [(error['row'], error['type']) for error in report['errors']] == [
+        (2, 'subject'), (3, 'teacher'), (5, 'teacher'), (7, 'class'), (8, 'room')
+    ]
+    assert report['errors'][1]['error'] == "Unknown subjects: ['Chemistry']"
+    assert report['errors'][2]['error'] == "Teacher 'Ada' already exists"
+
+
+# A teacher rejected for its subjects does not take its name from a later
+# valid row
+def test_rejected_teacher_keeps_name_free(conn):
+    _import(conn, RECORDS)
+
+    years = [row['year'] for row in conn.execute(
+        'SELECT year FROM teacher_year JOIN teachers ON teachers.id = teacher_id WHERE name = ?', ('Ada',))]
+    assert years == [1, 2]
+
+
+def test_strict_import_writes_nothing(conn):
+    version = read_data_version(conn)
+    report = _import(conn, RECORDS, strict=True)
+
+    assert report['imported'] == {'subjects': 0, 'teachers': 0, 'classes': 0}
+    assert len(report['errors']) == 5
+    assert _count(conn, 'subjects') == _count(conn, 'teachers') == _count(conn, 'classes') == 0
+    assert read_data_version(conn) == version
+
+
+def test_strict_import_of_valid_rows(conn):
+    version = read_data_version(conn)
+    valid = [RECORDS[0], RECORDS[3], RECORDS[5]]
+    report = _import(conn, valid, strict=True)
+
+    assert report['imported'] == {'subjects': 1, 'teachers': 1, 'classes': 1}
+    assert report['errors'] == []
+    assert read_data_version(conn) != version
+
+
+def test_rows_already_stored_are_rejected(conn):
+    _import(conn, [RECORDS[0], RECORDS[5]])
+    report = _import(conn, [RECORDS[0], RECORDS[5]])
+
+    assert report['imported'] == {'subjects': 0, 'teachers': 0, 'classes': 0}
+    assert [error['error'] for error in report['errors']] == [
+        "Subject 'Math' already exists", 'Class 1-A already exists'
+    ]
+
+
+def test_parse_csv():
+    stream = io.BytesIO(b'type,name,hours\nsubject,Math,4\nsubject,Art,2\n')
+    records = list(parse_records(stream, 'csv', default_type=None))
+    assert [record['name'] for _, record in records] == ['Math', 'Art']
+
+
+def test_parse_rejects_unknown_format():
+    with pytest.raises(ImportFormatError):
+        list(parse_records(io.BytesIO(b''), 'xml', default_type=None))
@@ -0,0 +1,55 @@
+import pytest
+from flask import Flask, jsonify
+
+from db import bump_data_version, read_data_version
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def client(conn):
+    app = Flask(__name__)
+    cache = ResponseCache(lambda: read_data_version(conn))
+
+    @app.route('/api/subjects')
+    @cache.cached('subjects')
+    def subjects():
+        return jsonify([row['name'] for row in conn.execute('SELECT name FROM subjects ORDER BY id')])
+
+    app.cache = cache
+    return app.test_client()
+
+
+def _add_subject(conn, name):
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('INSERT INTO subjects (name, hours) VALUES (?, 2)', (name,))
+    bump_data_version(conn)
+    conn.commit()
+
+
+def test_etag_revalidates_until_a_write(client, conn):
+    _add_subject(conn, 'Math')
+    first = client.get('/api/subjects')
+    assert first.status_code == 200
+    assert first.get_json() == ['Math']
+    etag = first.headers['ETag']
+
+    unchanged = client.get('/api/subjects', headers={'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.headers['ETag'] == etag
+
+    _add_subject(conn, 'Art')
+    changed = client.get('/api/subjects', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json() == ['Math', 'Art']
+    assert changed.headers['ETag'] != etag
+
+
+def test_body_is_cached_per_version(client, conn):
+    cache = client.application.cache
+    client.get('/api/subjects')
+    client.get('/api/subjects')
+    assert (cache.misses, cache.hits) == (1, 1)
+
+    _add_subject(conn, 'Math')
+    assert client.get('/api/subjects').get_json() == ['Math']
+    assert (cache.misses, cache.hits) == (2, 1)
@@ -0,0 +1,51 @@
+import pytest
+
+from decompose import decompose, solve_decomposed
+from scheduler import load_problem, solve_greedy
+from solvers import DEFAULT_STARTS, MAX_STARTS, MAX_TIME_BUDGET_MS, MAX_WORKERS, parse_solver_options
+
+
+def test_defaults():
+    options = parse_solver_options({})
+    assert options['solver'] == 'greedy'
+    assert options['starts'] == DEFAULT_STARTS
+    assert options['workers'] is None
+    assert options['timeBudgetMs'] == 0
+
+
+@pytest.mark.parametrize('data', [
+    {'starts': MAX_STARTS},
+    {'starts': 1},
+    {'workers': MAX_WORKERS},
+    {'workers': 1},
+    {'timeBudgetMs': MAX_TIME_BUDGET_MS},
+])
+def test_bounds_accepted(data):
+    name, value = next(iter(data.items()))
+    assert parse_solver_options(data)[name] == value
+
+
+@pytest.mark.parametrize('data, message', [
+    ({'starts': 0}, 'starts must be at least 1'),
+    ({'starts': MAX_STARTS + 1}, f'starts must be at most {MAX_STARTS}'),
+    ({'workers': 0}, 'workers must be at least 1'),
+    ({'workers': MAX_WORKERS + 1}, f'workers must be at most {MAX_WORKERS}'),
+    ({'timeBudgetMs': -1}, 'timeBudgetMs must be at least 0'),
+    ({'timeBudgetMs': MAX_TIME_BUDGET_MS + 1}, f'timeBudgetMs must be at most {MAX_TIME_BUDGET_MS}'),
+    ({'starts': True}, 'starts must be an integer'),
+    ({'seed': '1'}, 'seed must be an integer'),
+    ({'solver': 'annealing'}, "Unknown solver 'annealing'"),
+    ({'incremental': True, 'solver': 'multistart'}, 'incremental generation always uses the greedy solver'),
+])
+def test_bounds_rejected(data, message):
+    with pytest.raises(ValueError, match=message):
+        parse_solver_options(data)
+
+
+def test_decomposed_matches_greedy(institution):
+    problem = load_problem(institution)
+    assert len(decompose(problem)) > 1
+
+    assignments, stats = solve_decomposed(problem, workers=1)
+    assert stats['components'] > 1
+    assert sorted(assignments) == sorted(solve_greedy(problem))
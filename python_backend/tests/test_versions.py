@@ -0,0 +1,50 @@
+import functools
+
+import pytest
+
+from bell_schedule import load_bell_schedule, parse_bell_schedule, write_bell_schedule
+from editor import TimetableEditor
+from persistence import read_cells
+from versions import StaleVersionError, activate_version, head_version_id, record_version
+
+
+def _clear_first_lesson(conn):
+    editor = TimetableEditor(history=functools.partial(record_version, source='edit'))
+    cell = next(cell for cell, (subject_id, _, _) in sorted(read_cells(conn).items()) if subject_id is not None)
+    changes, conflicts = editor.set_cell(conn, cell, None)
+    assert conflicts == []
+    return cell
+
+
+def test_activate_version_round_trip(generated):
+    generated_id = head_version_id(generated)
+    before = read_cells(generated)
+
+    cell = _clear_first_lesson(generated)
+    edited_id = head_version_id(generated)
+    after = read_cells(generated)
+    assert edited_id != generated_id
+    assert cell not in after
+
+    version, written = activate_version(generated, generated_id)
+    assert version['id'] == generated_id
+    assert written == 1
+    assert read_cells(generated) == before
+    assert head_version_id(generated) == generated_id
+
+    activate_version(generated, edited_id)
+    assert read_cells(generated) == after
+
+
+def test_activate_unknown_version(generated):
+    assert activate_version(generated, 10 ** 6) is None
+
+
+def test_activate_version_of_another_calendar(generated):
+    generated_id = head_version_id(generated)
+    calendar = load_bell_schedule(generated).to_dict()
+    calendar['days'] = calendar['days'][:-1]
+    write_bell_schedule(generated, parse_bell_schedule(calendar))
+
+    with pytest.raises(StaleVersionError):
+        activate_version(generated, generated_id)
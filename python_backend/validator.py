@@ -0,0 +1,216 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from bell_schedule import load_bell_schedule
+from db import ConnectionPool
+
+# Violations listed in full per report; the counts always cover all of them
+MAX_VIOLATIONS = 1000
+
+VIOLATION_TYPES = (
+    'invalidCell', 'unknownReference', 'teacherDoubleBooking', 'hoursExceeded', 'teacherYear', 'teacherSubject'
+)
+
+# Columns of the entries array
+CLASS, DAY, PERIOD, SUBJECT, TEACHER, BREAK = range(6)
+
+
+# timetable_entries as an (n, 6) int64 array; NULL ids become 0, which no
+# row id ever is. Rows are fetched as plain tuples and flattened straight
+# into the array.
+def load_entries(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(
+        'SELECT class_id, day_idx, period_idx, COALESCE(subject_id, 0), COALESCE(teacher_id, 0), is_break '
+        'FROM timetable_entries'
+    ).fetchall()
+    values = itertools.chain.from_iterable(rows)
+    return np.fromiter(values, dtype=np.int64, count=len(rows) * 6).reshape(-1, 6)
+
+
+def _ids(conn, sql):
+    return np.array([row[0] for row in conn.execute(sql).fetchall()], dtype=np.int64)
+
+
+# For each value of `x`, whether it is in the sorted array `keys` and its
+# position there (clipped, only meaningful where found)
+def _lookup(keys, x):
+    if not len(keys):
+        return np.zeros(len(x), dtype=bool), np.zeros(len(x), dtype=np.int64)
+    position = np.minimum(np.searchsorted(keys, x), len(keys) - 1)
+    return keys[position] == x, position
+
+
+# One int64 key per (a, b) pair; row ids and years stay far below 2**32
+def _pair_keys(a, b):
+    return (a << 32) | (b & 0xFFFFFFFF)
+
+
+# Unique rows of the integer matrix `columns` with how often each occurs
+def _group(columns):
+    if not len(columns):
+        return columns, np.zeros(0, dtype=np.int64)
+    return np.unique(columns, axis=0, return_counts=True)
+
+
+# Check the stored timetable against the data it refers to. Every check runs
+# as array operations over all entries at once:
+# - invalidCell: cells outside the calendar, lessons in break periods and
+#   break rows in teaching periods
+# - unknownReference: classes, subjects or teachers that no longer exist
+# - teacherDoubleBooking: a teacher in more than one class in one slot
+# - hoursExceeded: more lessons of a subject in a class than its hours
+# - teacherYear / teacherSubject: a teacher outside their teacher_year
+#   years or teacher_subject subjects
+# Returns counts per type plus at most `limit` violations in that order.
+def validate_timetable(conn, limit=MAX_VIOLATIONS):
+    started = time.perf_counter()
+    entries = load_entries(conn)
+    calendar = load_bell_schedule(conn)
+
+    class_rows = np.array(conn.execute('SELECT id, year FROM classes ORDER BY id').fetchall(),
+                          dtype=np.int64).reshape(-1, 2)
+    subject_rows = np.array(conn.execute('SELECT id, hours FROM subjects ORDER BY id').fetchall(),
+                            dtype=np.int64).reshape(-1, 2)
+    teacher_ids = _ids(conn, 'SELECT id FROM teachers ORDER BY id')
+    teacher_years = np.array(conn.execute('SELECT teacher_id, year FROM teacher_year').fetchall(),
+                             dtype=np.int64).reshape(-1, 2)
+    teacher_subjects = np.array(conn.execute('SELECT teacher_id, subject_id FROM teacher_subject').fetchall(),
+                                dtype=np.int64).reshape(-1, 2)
+
+    violations = {name: [] for name in VIOLATION_TYPES}
+
+    # Cells must lie in the calendar, with breaks exactly in break periods
+    is_break_period = np.zeros(len(calendar.periods), dtype=bool)
+    is_break_period[list(calendar.break_types)] = True
+    in_calendar = ((entries[:, DAY] >= 0) & (entries[:, DAY] < len(calendar.days))
+                   & (entries[:, PERIOD] >= 0) & (entries[:, PERIOD] < len(calendar.periods)))
+    break_period = np.zeros(len(entries), dtype=bool)
+    break_period[in_calendar] = is_break_period[entries[in_calendar, PERIOD]]
+    is_break = entries[:, BREAK] != 0
+    bad_cells = ~in_calendar | (break_period != is_break)
+    for class_id, day_idx, period_idx, _, _, row_break in entries[bad_cells].tolist():
+        if not (0 <= day_idx < len(calendar.days) and 0 <= period_idx < len(calendar.periods)):
+            reason = 'outsideCalendar'
+        elif row_break:
+            reason = 'breakInTeachingPeriod'
+        else:
+            reason = 'lessonInBreakPeriod'
+        violations['invalidCell'].append({
+            'classId': class_id, 'dayIdx': day_idx, 'periodIdx': period_idx, 'reason': reason
+        })
+
+    # Everything below looks at lessons only
+    lessons = entries[~is_break & (entries[:, SUBJECT] != 0)]
+
+    class_found, _ = _lookup(class_rows[:, 0], lessons[:, CLASS])
+    subject_found, _ = _lookup(subject_rows[:, 0], lessons[:, SUBJECT])
+    has_teacher = lessons[:, TEACHER] != 0
+    teacher_found, _ = _lookup(teacher_ids, lessons[:, TEACHER])
+    teacher_found |= ~has_teacher
+    for table, column, found in (('classes', CLASS, class_found), ('subjects', SUBJECT, subject_found),
+                                 ('teachers', TEACHER, teacher_found)):
+        missing, counts = np.unique(lessons[~found, column], return_counts=True)
+        for missing_id, count in zip(missing.tolist(), counts.tolist()):
+            violations['unknownReference'].append({'table': table, 'id': missing_id, 'lessons': count})
+
+    # Sorting by (teacher, day, period) puts every double booking in a run
+    taught = lessons[has_teacher]
+    taught = taught[np.lexsort((taught[:, CLASS], taught[:, PERIOD], taught[:, DAY], taught[:, TEACHER]))]
+    slot_keys = taught[:, [TEACHER, DAY, PERIOD]]
+    new_run = np.ones(len(taught), dtype=bool)
+    new_run[1:] = np.any(slot_keys[1:] != slot_keys[:-1], axis=1)
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, len(taught)))
+    for start, length in zip(starts[lengths > 1].tolist(), lengths[lengths > 1].tolist()):
+        teacher_id, day_idx, period_idx = slot_keys[start].tolist()
+        violations['teacherDoubleBooking'].append({
+            'teacherId': teacher_id,
+            'dayIdx': day_idx,
+            'periodIdx': period_idx,
+            'classIds': taught[start:start + length, CLASS].tolist()
+        })
+
+    # Lessons per (class, subject) against the subject's hours
+    known = lessons[subject_found & class_found]
+    keys, counts = np.unique(_pair_keys(known[:, CLASS], known[:, SUBJECT]), return_counts=True)
+    if len(keys):
+        class_ids, subject_ids = keys >> 32, keys & 0xFFFFFFFF
+        _, position = _lookup(subject_rows[:, 0], subject_ids)
+        hours = subject_rows[position, 1]
+        over = counts > hours
+        for class_id, subject_id, count, limit_hours in zip(class_ids[over].tolist(), subject_ids[over].tolist(),
+                                                            counts[over].tolist(), hours[over].tolist()):
+            violations['hoursExceeded'].append({
+                'classId': class_id, 'subjectId': subject_id, 'scheduled': count, 'hours': limit_hours
+            })
+
+    # Teacher eligibility, as membership of (teacher, year) and
+    # (teacher, subject) pair keys in the allowed ones
+    checked = lessons[class_found & subject_found & teacher_found & has_teacher]
+    _, position = _lookup(class_rows[:, 0], checked[:, CLASS])
+    checked_years = class_rows[position, 1]
+    for name, field, values, allowed in (('teacherYear', 'year', checked_years, teacher_years),
+                                         ('teacherSubject', 'subjectId', checked[:, SUBJECT], teacher_subjects)):
+        ok = np.isin(_pair_keys(checked[:, TEACHER], values), _pair_keys(allowed[:, 0], allowed[:, 1]))
+        rows, counts = _group(np.stack([checked[~ok, TEACHER], values[~ok], checked[~ok, CLASS]], axis=1))
+        for (teacher_id, value, class_id), count in zip(rows.tolist(), counts.tolist()):
+            violations[name].append({'teacherId': teacher_id, field: value, 'classId': class_id, 'lessons': count})
+
+    counts = {name: len(found) for name, found in violations.items()}
+    listed = [dict(found, type=name) for name, group in violations.items() for found in group]
+    return {
+        'valid': not listed,
+        'entries': int(len(entries)),
+        'counts': counts,
+        'violations': listed[:limit],
+        'truncated': len(listed) > limit,
+        'elapsedMs': round((time.perf_counter() - started) * 1000, 3)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python validator.py',
+        description='Check a stored timetable for clashes, excess hours and ineligible teachers.'
+    )
+    parser.add_argument('--db', default='timetable.db', help='SQLite database file (default: timetable.db)')
+    parser.add_argument('--limit', type=int, default=MAX_VIOLATIONS,
+                        help=f'violations to list in full (default: {MAX_VIOLATIONS})')
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        parser.error(f'database {args.db} does not exist')
+
+    pool = ConnectionPool(args.db, size=1)
+    conn = pool.acquire()
+    try:
+        report = validate_timetable(conn, limit=args.limit)
+    finally:
+        conn.close()
+        pool.close_all()
+
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        print(f"{report['entries']} entries checked in {report['elapsedMs']:.1f} ms")
+        for name, count in report['counts'].items():
+            print(f'{name:<24}{count:>8}')
+        for violation in report['violations']:
+            details = ', '.join(f'{key}={value}' for key, value in violation.items() if key != 'type')
+            print(f"  {violation['type']}: {details}")
+        if report['truncated']:
+            print(f'  ... only the first {args.limit} violations are listed')
+
+    return 0 if report['valid'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
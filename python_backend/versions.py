@@ -0,0 +1,297 @@
+from bell_schedule import calendar_signature, load_bell_schedule
+from db import bump_data_version
+from persistence import ONE_CELL, read_cells
+from reader import keyset_page
+
+# A version this many steps from its keyframe is stored whole again, which
+# bounds how many deltas rebuilding any version has to read
+KEYFRAME_INTERVAL = 32
+
+VERSION_CELL_SQL = '''
+    INSERT INTO timetable_version_cells
+        (version_id, class_id, day_idx, period_idx, subject_id, teacher_id, is_break, removed)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+RESTORE_CELL_SQL = '''
+    INSERT INTO timetable_entries (class_id, day_idx, period_idx, subject_id, teacher_id, is_break)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (class_id, day_idx, period_idx)
+    DO UPDATE SET subject_id = excluded.subject_id, teacher_id = excluded.teacher_id, is_break = excluded.is_break
+'''
+
+# A version and its ancestors back to the nearest keyframe. A parent is
+# always stored before its children, so ids fall along the chain.
+CHAIN_SQL = '''
+    WITH RECURSIVE chain (id, parent_id, keyframe) AS (
+        SELECT id, parent_id, keyframe FROM timetable_versions WHERE id = ?
+        UNION ALL
+        SELECT v.id, v.parent_id, v.keyframe
+        FROM timetable_versions v JOIN chain ON v.id = chain.parent_id
+        WHERE NOT chain.keyframe
+    )
+    SELECT id FROM chain ORDER BY id DESC
+'''
+
+VERSION_CELLS_SQL = '''
+    SELECT class_id, day_idx, period_idx, subject_id, teacher_id, is_break, removed
+    FROM timetable_version_cells
+'''
+
+VERSION_STALE_ERROR = 'The version was stored under another calendar and can no longer be restored'
+
+
+# Raised when activating a version made for another calendar
+class StaleVersionError(ValueError):
+    pass
+
+
+def version_to_dict(row, head_id):
+    return {
+        'id': row['id'],
+        'parentId': row['parent_id'],
+        'source': row['source'],
+        'keyframe': bool(row['keyframe']),
+        'cells': row['cells'],
+        'changedCells': row['changed'],
+        'storedCells': row['stored'],
+        'createdAt': row['created_at'],
+        'active': row['id'] == head_id
+    }
+
+
+def head_version_id(conn):
+    row = conn.execute('SELECT version_id FROM timetable_version_head WHERE id = 0').fetchone()
+    return row[0] if row is not None else None
+
+
+def _version(conn, version_id):
+    return conn.execute('SELECT * FROM timetable_versions WHERE id = ?', (version_id,)).fetchone()
+
+
+def _set_head(conn, version_id):
+    conn.execute('INSERT OR REPLACE INTO timetable_version_head (id, version_id) VALUES (0, ?)', (version_id,))
+
+
+# Forget which version the stored timetable is, after a write the history
+# does not see (a calendar change). The next version is a keyframe.
+def detach_head(conn):
+    conn.execute('DELETE FROM timetable_version_head')
+
+
+def clear_versions(conn):
+    conn.execute('DELETE FROM timetable_version_cells')
+    conn.execute('DELETE FROM timetable_versions')
+    detach_head(conn)
+
+
+def _chain(conn, version_id):
+    return [row[0] for row in conn.execute(CHAIN_SQL, (version_id,))]
+
+
+def _in_versions(version_ids):
+    return 'version_id IN (' + ', '.join('?' * len(version_ids)) + ')'
+
+
+# What the versions `version_ids` of one chain store, applied oldest first:
+# {cell: contents, or None where the cell was removed}
+def _chain_rows(conn, version_ids):
+    if not version_ids:
+        return {}
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(VERSION_CELLS_SQL + ' WHERE ' + _in_versions(version_ids) + ' ORDER BY version_id', version_ids)
+    cells = {}
+    for class_id, day_idx, period_idx, subject_id, teacher_id, is_break, removed in cursor:
+        cells[(class_id, day_idx, period_idx)] = None if removed else (subject_id, teacher_id, int(is_break))
+    return cells
+
+
+# The contents of one cell at the newest version of `version_ids`
+def _cell_at(conn, version_ids, cell):
+    row = conn.execute(
+        VERSION_CELLS_SQL + ' WHERE ' + _in_versions(version_ids)
+        + ' AND class_id = ? AND day_idx = ? AND period_idx = ? ORDER BY version_id DESC LIMIT 1',
+        version_ids + list(cell)
+    ).fetchone()
+    if row is None or row['removed']:
+        return None
+    return row['subject_id'], row['teacher_id'], int(row['is_break'])
+
+
+# The cells of a version as read_cells() returns them, rebuilt from its
+# keyframe and the deltas since
+def load_version_cells(conn, version_id):
+    cells = _chain_rows(conn, _chain(conn, version_id))
+    return {cell: value for cell, value in cells.items() if value is not None}
+
+
+# {cell: (contents in from_id, contents in to_id)} for every cell that
+# differs between two versions. When both descend from one keyframe only
+# the deltas after their newest common ancestor are read, plus that
+# ancestor's contents of the cells they touch, so the cost follows the
+# number of changed cells rather than the size of the timetable.
+def _changed_cells(conn, from_id, to_id):
+    from_chain = _chain(conn, from_id)
+    to_chain = _chain(conn, to_id)
+    shared = set(from_chain) & set(to_chain)
+    if not shared:
+        old = load_version_cells(conn, from_id)
+        new = load_version_cells(conn, to_id)
+        return {cell: (old.get(cell), new.get(cell)) for cell in old.keys() | new.keys()
+                if old.get(cell) != new.get(cell)}
+
+    ancestor = max(shared)
+    old = _chain_rows(conn, [version_id for version_id in from_chain if version_id > ancestor])
+    new = _chain_rows(conn, [version_id for version_id in to_chain if version_id > ancestor])
+    base_chain = [version_id for version_id in from_chain if version_id <= ancestor]
+    changed = {}
+    for cell in old.keys() | new.keys():
+        if cell in old and cell in new:
+            old_value, new_value = old[cell], new[cell]
+        else:
+            base = _cell_at(conn, base_chain, cell)
+            old_value, new_value = old.get(cell, base), new.get(cell, base)
+        if old_value != new_value:
+            changed[cell] = (old_value, new_value)
+    return changed
+
+
+# Store a version with `rows` ({cell: contents, or None for a removed cell})
+# and make it the head
+def _insert_version(conn, parent, source, keyframe, cell_count, changed, rows):
+    cursor = conn.execute(
+        'INSERT INTO timetable_versions (parent_id, source, keyframe, depth, cells, changed, stored, calendar) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        (parent['id'] if parent is not None else None, source, keyframe,
+         0 if keyframe else parent['depth'] + 1, cell_count, changed, len(rows),
+         calendar_signature(load_bell_schedule(conn)))
+    )
+    version_id = cursor.lastrowid
+    conn.executemany(VERSION_CELL_SQL, (
+        (version_id,) + cell + (value if value is not None else (None, None, 0)) + (value is None,)
+        for cell, value in rows.items()
+    ))
+    _set_head(conn, version_id)
+    return _version(conn, version_id)
+
+
+# Record the write in progress on `conn` as a new version, a child of the
+# head. Meant as the `history` hook of persistence.replace_timetable,
+# update_timetable and TimetableEditor, with `source` bound to what made the
+# write.
+#
+# Only the cells that changed are stored, unless the version is due a
+# keyframe: KEYFRAME_INTERVAL deltas in a row, or a change to at least half
+# the cells, where the whole timetable costs little more. Without a head
+# (the first write, or after a calendar change) the timetable as it was
+# before the write is kept as a 'baseline' version first, if there was one.
+# Writes that change nothing add no version. Returns the head afterwards.
+def record_version(conn, before, after, source):
+    changed = {}
+    for cell in before.keys() | after.keys():
+        value = after.get(cell)
+        if before.get(cell) != value:
+            changed[cell] = value
+
+    head_id = head_version_id(conn)
+    head = _version(conn, head_id) if head_id is not None else None
+    if head is None:
+        previous = read_cells(conn)
+        for cell in after:
+            previous.pop(cell, None)
+        previous.update(before)
+        if previous:
+            head = _insert_version(conn, None, 'baseline', True, len(previous), len(previous), previous)
+        else:
+            cells = read_cells(conn)
+            return _insert_version(conn, None, source, True, len(cells), len(cells), cells) if cells else None
+    if not changed:
+        return head
+
+    added = sum(1 for cell, value in changed.items() if value is not None and before.get(cell) is None)
+    removed = sum(1 for value in changed.values() if value is None)
+    cell_count = head['cells'] + added - removed
+    if head['depth'] + 1 >= KEYFRAME_INTERVAL or 2 * len(changed) >= cell_count:
+        return _insert_version(conn, head, source, True, cell_count, len(changed), read_cells(conn))
+    return _insert_version(conn, head, source, False, cell_count, len(changed), changed)
+
+
+# One keyset page of versions, oldest first, in the shape of the list
+# endpoints: the versions and the id to pass as ?after= for the next page
+def list_versions(conn, after=None, limit=None):
+    rows, next_after = keyset_page(conn, 'SELECT * FROM timetable_versions', [], [], after, limit)
+    head_id = head_version_id(conn)
+    return [version_to_dict(row, head_id) for row in rows], next_after
+
+
+def _cell_contents(value):
+    if value is None:
+        return None
+    return {'subjectId': value[0], 'teacherId': value[1], 'isBreak': bool(value[2])}
+
+
+# Cells that differ between two versions, in cell order, each with its
+# contents in both (null where the cell has no row). None if either
+# version does not exist.
+def diff_versions(conn, from_id, to_id):
+    if _version(conn, from_id) is None or _version(conn, to_id) is None:
+        return None
+    changed = _changed_cells(conn, from_id, to_id)
+    changes = [
+        {
+            'classId': cell[0],
+            'dayIdx': cell[1],
+            'periodIdx': cell[2],
+            'from': _cell_contents(changed[cell][0]),
+            'to': _cell_contents(changed[cell][1])
+        }
+        for cell in sorted(changed)
+    ]
+    return {'from': from_id, 'to': to_id, 'count': len(changes), 'changes': changes}
+
+
+# Make a stored version the timetable again without solving anything: only
+# the cells that differ between the head and the version are read and
+# written, in one transaction. A timetable that is no version yet (one
+# stored before the history existed) is kept as a baseline version and
+# compared cell by cell instead. The
+# version becomes the head, so later versions branch off it. The solver
+# snapshot no longer describes the timetable and is dropped, so the next
+# incremental run falls back to a full generation.
+#
+# Returns the version and how many cells were written, or None if there is
+# no such version. Raises StaleVersionError for a version stored under
+# another calendar.
+def activate_version(conn, version_id):
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        version = _version(conn, version_id)
+        if version is None:
+            conn.rollback()
+            return None
+        if version['calendar'] != calendar_signature(load_bell_schedule(conn)):
+            raise StaleVersionError(VERSION_STALE_ERROR)
+
+        head_id = head_version_id(conn)
+        if head_id is not None:
+            changed = _changed_cells(conn, head_id, version_id)
+        else:
+            current = read_cells(conn)
+            if current:
+                _insert_version(conn, None, 'baseline', True, len(current), len(current), current)
+            target = load_version_cells(conn, version_id)
+            changed = {cell: (current.get(cell), target.get(cell)) for cell in current.keys() | target.keys()
+                       if current.get(cell) != target.get(cell)}
+        removed = [cell for cell, (_, value) in changed.items() if value is None]
+        restored = [cell + value for cell, (_, value) in changed.items() if value is not None]
+        conn.executemany('DELETE FROM timetable_entries' + ONE_CELL, removed)
+        conn.executemany(RESTORE_CELL_SQL, restored)
+        conn.execute('DELETE FROM generation_snapshot')
+        _set_head(conn, version_id)
+        bump_data_version(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return version_to_dict(version, version_id), len(removed) + len(restored)